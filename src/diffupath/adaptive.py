@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Adaptive number of validation iterations, run in batches until the metrics converge or the budget is spent."""
+
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from scipy import stats
+
+log = logging.getLogger(__name__)
+
+#: Number of iterations run between two convergence checks
+BATCH_SIZE = 10
+
+#: Confidence level of the intervals of the metrics means
+CONFIDENCE = 0.95
+
+
+def get_confidence_interval(values, confidence: float = CONFIDENCE) -> Tuple[float, float]:
+    """Return the mean of a metric and the width of its (Student's t) confidence interval.
+
+    :param values: Metric values, one per iteration.
+    :param confidence: Confidence level of the interval.
+    :return: Mean and interval width, infinite for less than two values.
+    """
+    values = np.asarray(values, dtype=float)
+
+    if len(values) < 2:
+        return float(np.mean(values)) if len(values) else float('nan'), float('inf')
+
+    half_width = stats.t.ppf((1 + confidence) / 2, len(values) - 1) * stats.sem(values)
+
+    return float(np.mean(values)), float(2 * half_width)
+
+
+def get_precision(
+    metrics: Dict[str, Dict[str, list]],
+    confidence: float = CONFIDENCE,
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Return the mean and confidence interval width of every metric and method.
+
+    :param metrics: Metric values by metric (e.g. 'auroc') and method.
+    :param confidence: Confidence level of the intervals.
+    """
+    precision = defaultdict(dict)
+
+    for metric, method_values in metrics.items():
+        for method, values in method_values.items():
+            mean, width = get_confidence_interval(values, confidence)
+            precision[metric][method] = {'mean': mean, 'ci_width': width, 'iterations': len(values)}
+
+    return dict(precision)
+
+
+def run_adaptive(
+    run_batch: Callable[[int], Tuple[Dict[str, list], Dict[str, list]]],
+    max_iterations: int = 100,
+    target_width: Optional[float] = None,
+    batch_size: int = BATCH_SIZE,
+    confidence: float = CONFIDENCE,
+) -> Tuple[Dict[str, list], Dict[str, list], Dict[str, Any]]:
+    """Run validation iterations in batches until every metric interval is narrower than a target width.
+
+    :param run_batch: Validation running the given number of iterations, returning their AUROC and AUPRC by method
+     (e.g. a partial of :func:`diffupath.repeated_holdout.validation_by_method`). Must be picklable to run on workers.
+    :param max_iterations: Budget of iterations.
+    :param target_width: Target width of the confidence intervals of the AUROC and AUPRC means of every method. By
+     default the whole budget is run.
+    :param batch_size: Number of iterations between two convergence checks.
+    :param confidence: Confidence level of the intervals.
+    :return: AUROC and AUPRC metrics by method, and the achieved precision (mean and interval width of each metric and
+     method, number of iterations and whether the target was reached).
+    """
+    metrics = {'auroc': defaultdict(list), 'auprc': defaultdict(list)}
+    iterations, converged = 0, False
+
+    while iterations < max_iterations and not converged:
+        n = min(batch_size if target_width is not None else max_iterations, max_iterations - iterations)
+
+        for metric, batch_metrics in zip(metrics, run_batch(n)):
+            for method, values in batch_metrics.items():
+                metrics[metric][method].extend(values)
+
+        iterations += n
+
+        precision = get_precision(metrics, confidence)
+        converged = target_width is not None and all(
+            method_precision['ci_width'] <= target_width
+            for metric_precision in precision.values()
+            for method_precision in metric_precision.values()
+        )
+
+    if target_width is not None and not converged:
+        log.warning(f'Metric intervals still wider than {target_width} after the budget of {max_iterations} iterations')
+
+    report = {
+        'iterations': iterations,
+        'target_width': target_width,
+        'converged': converged,
+        'confidence': confidence,
+        **get_precision(metrics, confidence),
+    }
+
+    return dict(metrics['auroc']), dict(metrics['auprc']), report
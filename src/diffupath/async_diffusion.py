@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""Asyncio counterparts of the diffusion entry points, coalescing concurrent requests on a kernel into batches.
+
+The blocking stages (kernel loading, input processing and kernel products) run in an executor, by default the event
+loop one, so that the event loop keeps serving requests meanwhile.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import weakref
+from concurrent.futures import Executor
+from typing import Any, List, Optional, Union
+
+import networkx as nx
+import numpy as np
+from diffupy.constants import ML, RAW, Z
+from diffupy.matrix import Matrix
+
+from .cohort import diffuse_cohort
+from .kernel_diffusion import _get_output_cols_labels, get_input_codification
+from .session import DiffusionSession
+
+log = logging.getLogger(__name__)
+
+#: Maximum number of requests coalesced into a single kernel product
+MAX_BATCH_SIZE = 256
+
+#: Methods whose concurrent requests are coalesced
+BATCH_METHODS = {RAW, ML, Z}
+
+#: Batchers of the sessions, released with their session
+_batchers = weakref.WeakKeyDictionary()
+
+
+async def load_kernel_async(
+    path: str,
+    mmap: bool = True,
+    graph: Optional[nx.Graph] = None,
+    executor: Optional[Executor] = None,
+) -> DiffusionSession:
+    """Load a kernel (see :meth:`DiffusionSession.from_network`) in an executor, as a session.
+
+    :param path: Path to the kernel.
+    :param mmap: Flag to memory-map the body of kernel files.
+    :param graph: Optional network as a graph, needed by the PageRank baseline.
+    :param executor: Executor of the loading. By default the event loop executor.
+    """
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(
+        executor, functools.partial(DiffusionSession.from_network, path, mmap=mmap, graph=graph),
+    )
+
+
+async def diffuse_async(
+    input,
+    session: DiffusionSession,
+    method: Union[str, List[str]] = RAW,
+    executor: Optional[Executor] = None,
+    n_permutations: int = 10000,
+    workers: Optional[int] = 1,
+    **processing: Any,
+) -> Matrix:
+    """Diffuse an input over the kernel of a session, without blocking the event loop.
+
+    Concurrent requests of the raw, ml and z methods on the same session are coalesced into a single kernel product.
+    Cancelled requests are dropped from their batch if it did not start yet.
+
+    :param input: Path or miscellaneous format data input, or an already formatted input Matrix.
+    :param session: Diffusion session holding the kernel.
+    :param method: Elected method (or methods), as in :meth:`DiffusionSession.diffuse`.
+    :param executor: Executor of the input processing and kernel products. By default the event loop executor.
+    :param n_permutations: Number of input permutations of the Monte Carlo methods ("mc" and "ber_p").
+    :param workers: Number of worker processes the permutations are sharded over.
+    :param processing: Input processing flags (binarize, threshold, absolute_value and p_value).
+    """
+    loop = asyncio.get_running_loop()
+
+    if not isinstance(method, str) or method not in BATCH_METHODS:
+        return await loop.run_in_executor(executor, functools.partial(
+            session.diffuse, input, method, n_permutations=n_permutations, workers=workers, **processing,
+        ))
+
+    return await get_batcher(session, executor).submit(input, method, **processing)
+
+
+async def diffuse_cohort_async(
+    path: str,
+    session: DiffusionSession,
+    executor: Optional[Executor] = None,
+    **kwargs: Any,
+) -> Union[Matrix, str]:
+    """Diffuse a cohort matrix (see :func:`diffupath.cohort.diffuse_cohort`) in an executor.
+
+    Cancelling the call stops the diffusion before its next chunk of samples, releasing the executor worker.
+
+    :param path: Path to the cohort matrix.
+    :param session: Diffusion session holding the kernel and its label index.
+    :param executor: Executor of the diffusion. By default the event loop executor, a dedicated one keeps long cohort
+     jobs from delaying interactive requests.
+    :param kwargs: Parameters of :func:`diffupath.cohort.diffuse_cohort` (e.g. method, output or chunk_size).
+    """
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+
+    job = functools.partial(diffuse_cohort, path, session.kernel, label_index=session.label_index, stop=stop, **kwargs)
+
+    try:
+        return await loop.run_in_executor(executor, job)
+    except asyncio.CancelledError:
+        stop.set()
+        raise
+
+
+def get_batcher(session: DiffusionSession, executor: Optional[Executor] = None) -> 'DiffusionBatcher':
+    """Return the batcher of a session in the running event loop.
+
+    :param session: Diffusion session holding the kernel.
+    :param executor: Executor of the kernel products, for batchers created by the call.
+    """
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(session)
+
+    if batcher is None or batcher.loop is not loop:
+        batcher = _batchers[session] = DiffusionBatcher(session, executor=executor)
+
+    return batcher
+
+
+class DiffusionBatcher:
+    """Coalesce the requests submitted to a session during an event loop iteration into batched kernel products."""
+
+    def __init__(
+        self,
+        session: DiffusionSession,
+        executor: Optional[Executor] = None,
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ):
+        """Initialize the batcher in the running event loop.
+
+        :param session: Diffusion session holding the kernel.
+        :param executor: Executor of the input processing and kernel products. By default the event loop executor.
+        :param max_batch_size: Maximum number of requests of a kernel product.
+        """
+        self.session = session
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.loop = asyncio.get_running_loop()
+
+        self._pending = []
+        self._flush_task = None
+
+    def submit(self, input, method: str, **processing: Any) -> asyncio.Future:
+        """Submit an input, returning a future of its diffusion scores.
+
+        :param input: Path or miscellaneous format data input, or an already formatted input Matrix.
+        :param method: Elected method ["raw", "ml", "z"].
+        :param processing: Input processing flags (binarize, threshold, absolute_value and p_value).
+        """
+        future = self.loop.create_future()
+        self._pending.append((method, (input, processing), future))
+
+        # Flushed once the requests of the current event loop iteration are submitted, unless a flush is running
+        if self._flush_task is None:
+            self._flush_task = self.loop.create_task(self._flush())
+
+        return future
+
+    async def _flush(self):
+        """Diffuse the pending requests, as one kernel product per method and batch.
+
+        Requests submitted while a product is running are coalesced into the next one.
+        """
+        try:
+            await asyncio.sleep(0)
+
+            while self._pending:
+                pending, self._pending = self._pending, []
+
+                for method in dict.fromkeys(method for method, _, _ in pending):
+                    requests = [
+                        (request, future)
+                        for request_method, request, future in pending
+                        if request_method == method
+                    ]
+
+                    for start in range(0, len(requests), self.max_batch_size):
+                        await self._diffuse_batch(requests[start:start + self.max_batch_size], method)
+        finally:
+            self._flush_task = None
+
+    async def _diffuse_batch(self, batch: List[tuple], method: str):
+        """Diffuse a batch of requests with a single kernel product, resolving their futures."""
+        # Requests may have been cancelled while waiting for their batch
+        batch = [(request, future) for request, future in batch if not future.cancelled()]
+        if not batch:
+            return
+
+        try:
+            results = await self.loop.run_in_executor(
+                self.executor,
+                functools.partial(_diffuse_requests, self.session, [request for request, _ in batch], method),
+            )
+        except Exception as error:
+            results = [error] * len(batch)
+
+        log.debug(f'{len(batch)} {method} requests diffused in a single kernel product.')
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+"""Helper functions"""
+
+
+def _diffuse_requests(session: DiffusionSession, requests: List[tuple], method: str) -> List[Union[Matrix, Exception]]:
+    """Format the (input, processing flags) requests and diffuse them with a single kernel product.
+
+    Requests whose input can not be processed get their error instead of scores, without failing the rest.
+    """
+    formatted = []
+
+    for input, processing in requests:
+        try:
+            formatted.append(session.format_input(input, get_input_codification(method), **processing))
+        except Exception as error:
+            formatted.append(error)
+
+    inputs = {str(i): scores for i, scores in enumerate(formatted) if isinstance(scores, Matrix)}
+    if not inputs:
+        return formatted
+
+    results = session.diffuse_batch(inputs, method)
+
+    start = 0
+    for i, scores in enumerate(formatted):
+        if not isinstance(scores, Matrix):
+            continue
+
+        stop = start + len(scores.cols_labels)
+        formatted[i] = Matrix(
+            np.asarray(results.mat[:, start:stop]),
+            rows_labels=results.rows_labels,
+            cols_labels=_get_output_cols_labels(scores),
+            name=scores.name,
+        )
+        start = stop
+
+    return formatted
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""Bootstrap confidence intervals of the validation metrics, resampling the nodes of the stored validation scores."""
+
+import logging
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+
+import numpy as np
+from diffupy.matrix import Matrix
+
+from .metrics import auprc_by_column, auroc_by_column
+
+log = logging.getLogger(__name__)
+
+#: Number of bootstrap replicates
+N_BOOTSTRAPS = 1000
+
+#: Confidence level of the bootstrap intervals
+CONFIDENCE = 0.95
+
+#: Memory budget (in bytes) of the resampled scores and labels of a chunk of replicates
+BOOTSTRAP_MEMORY = 2 ** 28
+
+#: Bytes per resampled value, counting the ranks and sorting buffers of the metrics
+BYTES_PER_VALUE = 48
+
+
+def store_scores(
+    scores_store: Optional[Dict[Hashable, List[Tuple[np.ndarray, np.ndarray]]]],
+    key: Hashable,
+    validation: Union[Matrix, np.ndarray],
+    scores: Union[Matrix, np.ndarray],
+):
+    """Keep the validation labels and scores of a validation iteration, if a store is given.
+
+    :param scores_store: Validation labels and scores by key, e.g. method, in the order of the iterations.
+    :param key: Key of the scores, following the nesting of the metrics (e.g. a method or a (database, type) tuple).
+    :param validation: Validation labels of the iteration, positive labels being greater than zero.
+    :param scores: Scores of the iteration.
+    """
+    if scores_store is None:
+        return
+
+    validation = validation.mat if isinstance(validation, Matrix) else validation
+    scores = scores.mat if isinstance(scores, Matrix) else scores
+
+    scores_store.setdefault(key, []).append(
+        (np.asarray(validation).ravel() > 0, np.asarray(scores, dtype=float).ravel()),
+    )
+
+
+def bootstrap_metrics(
+    labels: np.ndarray,
+    scores: np.ndarray,
+    n_bootstraps: int = N_BOOTSTRAPS,
+    seed: Optional[int] = None,
+    max_memory: int = BOOTSTRAP_MEMORY,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return bootstrap replicates of the AUROC and AUPRC (averaged over iterations) of validation scores.
+
+    Every replicate resamples the nodes with replacement, the same nodes for all the iterations, and its metrics are
+    computed for all the iterations at once. Replicates are computed in chunks within the memory budget, and do not
+    depend on the chunk size.
+
+    :param labels: Validation labels (nodes, or nodes x iterations), positive labels being greater than zero.
+    :param scores: Scores (nodes, or nodes x iterations).
+    :param n_bootstraps: Number of replicates.
+    :param seed: Seed of the resampling.
+    :param max_memory: Memory budget (in bytes) of a chunk of replicates.
+    :return: AUROC and AUPRC of each replicate, NaN for replicates without positives (or negatives).
+    """
+    n = len(labels)
+    labels = np.asarray(labels).reshape(n, -1) > 0
+    scores = np.asarray(scores, dtype=float).reshape(n, -1)
+    n_iterations = labels.shape[1]
+
+    rng = np.random.default_rng(seed)
+    chunk_size = max(1, max_memory // (BYTES_PER_VALUE * n * n_iterations))
+
+    auroc_replicates, auprc_replicates = [], []
+
+    for start in range(0, n_bootstraps, chunk_size):
+        size = min(chunk_size, n_bootstraps - start)
+
+        # Index matrix of the resampled nodes (nodes x replicates), drawn replicate by replicate
+        index = rng.integers(0, n, (size, n)).T
+
+        chunk_labels = labels[index].reshape(n, size * n_iterations)
+        chunk_scores = scores[index].reshape(n, size * n_iterations)
+
+        auroc_replicates.append(_mean_by_replicate(auroc_by_column(chunk_labels, chunk_scores), size))
+        auprc_replicates.append(_mean_by_replicate(auprc_by_column(chunk_labels, chunk_scores), size))
+
+    return np.concatenate(auroc_replicates), np.concatenate(auprc_replicates)
+
+
+def get_percentile_interval(replicates: np.ndarray, confidence: float = CONFIDENCE) -> Tuple[float, float]:
+    """Return the percentile interval of bootstrap replicates, ignoring undefined replicates.
+
+    :param replicates: Bootstrap replicates.
+    :param confidence: Confidence level of the interval.
+    """
+    replicates = np.asarray(replicates)
+    replicates = replicates[~np.isnan(replicates)]
+
+    if not len(replicates):
+        return float('nan'), float('nan')
+
+    low, high = np.percentile(replicates, [50 * (1 - confidence), 50 * (1 + confidence)])
+
+    return float(low), float(high)
+
+
+def bootstrap_confidence_intervals(
+    scores_store: Dict[Hashable, List[Tuple[np.ndarray, np.ndarray]]],
+    n_bootstraps: int = N_BOOTSTRAPS,
+    confidence: float = CONFIDENCE,
+    seed: Optional[int] = None,
+    max_memory: int = BOOTSTRAP_MEMORY,
+) -> Dict[Hashable, Dict[str, Tuple[float, float]]]:
+    """Return bootstrap confidence intervals of the mean AUROC and AUPRC of every key of a scores store.
+
+    The store is filled by the validations given it as their ``scores_store`` (e.g.
+    :func:`diffupath.repeated_holdout.validation_by_method`), with the scores of every iteration.
+
+    :param scores_store: Validation labels and scores by key, in the order of the iterations.
+    :param n_bootstraps: Number of replicates.
+    :param confidence: Confidence level of the intervals.
+    :param seed: Seed of the resampling.
+    :param max_memory: Memory budget (in bytes) of a chunk of replicates.
+    :return: AUROC and AUPRC intervals by key.
+    """
+    intervals = defaultdict(dict)
+
+    for key, iterations in scores_store.items():
+        labels, scores = (np.column_stack(vectors) for vectors in zip(*iterations))
+
+        auroc, auprc = bootstrap_metrics(labels, scores, n_bootstraps, seed=seed, max_memory=max_memory)
+
+        intervals[key]['auroc'] = get_percentile_interval(auroc, confidence)
+        intervals[key]['auprc'] = get_percentile_interval(auprc, confidence)
+
+    return dict(intervals)
+
+
+"""Helper functions"""
+
+
+def _mean_by_replicate(values: np.ndarray, n_replicates: int) -> np.ndarray:
+    """Average the metrics of the iterations of each replicate, ignoring undefined ones."""
+    values = values.reshape(n_replicates, -1)
+    defined = ~np.isnan(values)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(defined, values, 0).sum(axis=1) / defined.sum(axis=1)
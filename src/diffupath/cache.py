@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+"""Management of the DiffuPath directory artifacts (kernels, graphs and outputs): stats, warm-up, pruning and checks."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    import msvcrt
+
+    fcntl = None
+
+from .constants import DEFAULT_DIFFUPATH_DIR
+from .kernel_io import is_kernel_file, read_kernel_header, verify_kernel_file
+
+log = logging.getLogger(__name__)
+
+#: Name of the manifest recording access times, build costs and checksums of the artifacts
+MANIFEST_FILE_NAME = 'manifest.json'
+
+#: Name of the lock file serializing the updates of the manifest (hidden, so that it is not listed as an artifact)
+MANIFEST_LOCK_FILE_NAME = '.manifest.lock'
+
+#: Number of bytes read at once when streaming artifacts
+CHUNK_SIZE = 2 ** 24
+
+#: Checksum statuses
+VERIFIED = 'ok'
+CORRUPTED = 'corrupted'
+RECORDED = 'recorded'
+
+
+class ArtifactInfo(NamedTuple):
+    """Artifact of the DiffuPath directory."""
+
+    #: Path to the artifact
+    path: str
+    #: Top level folder of the artifact (e.g. 'kernels', 'graphs' or 'output')
+    category: str
+    #: Size in bytes
+    size: int
+    #: Last recorded access (or modification) time, as a timestamp
+    last_access: float
+    #: Time spent building the artifact, when known
+    build_seconds: Optional[float]
+
+
+def read_manifest(cache_dir: str = DEFAULT_DIFFUPATH_DIR) -> Dict[str, Dict]:
+    """Read the artifacts manifest, keyed by the paths relative to the DiffuPath directory.
+
+    :param cache_dir: DiffuPath directory.
+    """
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE_NAME)
+
+    if not os.path.isfile(manifest_path):
+        return {}
+
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def write_manifest(manifest: Dict[str, Dict], cache_dir: str = DEFAULT_DIFFUPATH_DIR):
+    """Write the artifacts manifest atomically.
+
+    :param manifest: Artifacts manifest.
+    :param cache_dir: DiffuPath directory.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.', suffix='.tmp')
+
+    with os.fdopen(fd, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+    os.replace(tmp_path, os.path.join(cache_dir, MANIFEST_FILE_NAME))
+
+
+@contextmanager
+def update_manifest(cache_dir: str = DEFAULT_DIFFUPATH_DIR):
+    """Read the artifacts manifest to be updated, holding a file lock until it is written back.
+
+    Concurrent updates (e.g. the accesses recorded by diffusion runs in several processes) are serialized, so that none
+    of them is lost.
+
+    :param cache_dir: DiffuPath directory.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with open(os.path.join(cache_dir, MANIFEST_LOCK_FILE_NAME), 'a+') as lock_file:
+        _lock_file(lock_file)
+
+        try:
+            manifest = read_manifest(cache_dir)
+            yield manifest
+            write_manifest(manifest, cache_dir)
+        finally:
+            _unlock_file(lock_file)
+
+
+def record_access(path: str, cache_dir: str = DEFAULT_DIFFUPATH_DIR, build_seconds: Optional[float] = None):
+    """Record the access (and optionally the build cost) of an artifact in the manifest.
+
+    Paths outside the DiffuPath directory are ignored.
+
+    :param path: Path to the artifact.
+    :param cache_dir: DiffuPath directory.
+    :param build_seconds: Optional time spent building the artifact.
+    """
+    relative_path = _get_relative_path(path, cache_dir)
+
+    if relative_path is None or not os.path.isfile(path):
+        return
+
+    with update_manifest(cache_dir) as manifest:
+        entry = manifest.setdefault(relative_path, {})
+        entry['last_access'] = time.time()
+
+        if build_seconds is not None:
+            entry['build_seconds'] = build_seconds
+
+
+def get_artifacts(
+    cache_dir: str = DEFAULT_DIFFUPATH_DIR,
+    categories: Optional[Iterable[str]] = None,
+) -> List[ArtifactInfo]:
+    """List the artifacts of the DiffuPath directory, reading only kernel file headers.
+
+    :param cache_dir: DiffuPath directory.
+    :param categories: Optional top level folders to restrict the listing to.
+    """
+    manifest = read_manifest(cache_dir)
+    artifacts = []
+
+    for root, _, files in os.walk(cache_dir):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            relative_path = os.path.relpath(path, cache_dir)
+
+            # Skip the manifests (including those of nested caches, e.g. results) and temporary files of ongoing writes
+            if file_name == MANIFEST_FILE_NAME or file_name.startswith('.'):
+                continue
+
+            category = relative_path.split(os.sep)[0] if os.sep in relative_path else ''
+
+            if categories and category not in categories:
+                continue
+
+            stat = os.stat(path)
+            entry = manifest.get(relative_path, {})
+
+            # Access times are recorded in the manifest, since file access times are also updated by header reads
+            artifacts.append(ArtifactInfo(
+                path=path,
+                category=category,
+                size=stat.st_size,
+                last_access=max(stat.st_mtime, entry.get('last_access', 0.)),
+                build_seconds=_get_build_seconds(path, entry),
+            ))
+
+    return artifacts
+
+
+def warm_artifacts(paths: Iterable[str], chunk_size: int = CHUNK_SIZE, max_bytes: Optional[int] = None) -> int:
+    """Pre-load artifacts into the operating system page cache, so that the next (memory-mapped) reads are fast.
+
+    :param paths: Paths to the artifacts.
+    :param chunk_size: Number of bytes read at once.
+    :param max_bytes: Optional number of bytes pre-loaded from the start of each artifact. By default the whole files.
+    :return: Number of bytes read.
+    """
+    buffer = memoryview(bytearray(chunk_size))
+    n_bytes = 0
+
+    for path in paths:
+        remaining = max_bytes if max_bytes is not None else float('inf')
+
+        with open(path, 'rb', buffering=0) as file:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(file.fileno(), 0, max_bytes or 0, os.POSIX_FADV_WILLNEED)
+
+            while remaining > 0:
+                read = file.readinto(buffer[:min(chunk_size, remaining)])
+                if not read:
+                    break
+                n_bytes += read
+                remaining -= read
+
+    return n_bytes
+
+
+def prune_cache(
+    budget: int,
+    cache_dir: str = DEFAULT_DIFFUPATH_DIR,
+    categories: Optional[Iterable[str]] = None,
+    dry_run: bool = False,
+) -> List[ArtifactInfo]:
+    """Evict the least recently used artifacts until the DiffuPath directory fits in the disk budget.
+
+    :param budget: Disk budget in bytes.
+    :param cache_dir: DiffuPath directory.
+    :param categories: Optional top level folders whose artifacts can be evicted. By default every artifact.
+    :param dry_run: Flag to only report the artifacts that would be evicted.
+    :return: Evicted artifacts.
+    """
+    artifacts = get_artifacts(cache_dir)
+    total_size = sum(artifact.size for artifact in artifacts)
+
+    evictable = sorted(
+        (artifact for artifact in artifacts if not categories or artifact.category in categories),
+        key=lambda artifact: artifact.last_access,
+    )
+
+    evicted = []
+
+    for artifact in evictable:
+        if total_size <= budget:
+            break
+
+        evicted.append(artifact)
+        total_size -= artifact.size
+
+    if dry_run or not evicted:
+        return evicted
+
+    with update_manifest(cache_dir) as manifest:
+        for artifact in evicted:
+            os.remove(artifact.path)
+            manifest.pop(os.path.relpath(artifact.path, cache_dir), None)
+
+            log.info(f'Evicted {artifact.path} ({artifact.size} bytes).')
+
+    if total_size > budget:
+        log.warning(f'The DiffuPath directory still exceeds the budget ({total_size} > {budget} bytes).')
+
+    return evicted
+
+
+def verify_artifacts(
+    cache_dir: str = DEFAULT_DIFFUPATH_DIR,
+    categories: Optional[Iterable[str]] = None,
+) -> Dict[str, str]:
+    """Verify the artifacts checksums, streaming the files instead of loading the matrices.
+
+    Kernel files are checked against the checksum of their header. Other artifacts are checked against the checksum
+    recorded in the manifest, which is recorded the first time they are seen (or after they are rewritten).
+
+    :param cache_dir: DiffuPath directory.
+    :param categories: Optional top level folders to restrict the check to.
+    :return: Status of each artifact ('ok', 'corrupted' or 'recorded').
+    """
+    manifest = read_manifest(cache_dir)
+    statuses, recorded = {}, {}
+
+    for artifact in get_artifacts(cache_dir, categories=categories):
+        if is_kernel_file(artifact.path):
+            try:
+                statuses[artifact.path] = VERIFIED if verify_kernel_file(artifact.path) else CORRUPTED
+            except (IOError, ValueError):
+                statuses[artifact.path] = CORRUPTED
+            continue
+
+        stat = os.stat(artifact.path)
+        relative_path = os.path.relpath(artifact.path, cache_dir)
+        entry = manifest.get(relative_path, {})
+        checksum = get_file_checksum(artifact.path)
+
+        if entry.get('checksum') and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            statuses[artifact.path] = VERIFIED if entry['checksum'] == checksum else CORRUPTED
+        else:
+            recorded[relative_path] = {'checksum': checksum, 'size': stat.st_size, 'mtime': stat.st_mtime}
+            statuses[artifact.path] = RECORDED
+
+    # Files are streamed without the lock, only the new checksums are merged under it
+    if recorded:
+        with update_manifest(cache_dir) as manifest:
+            for relative_path, checksum_entry in recorded.items():
+                manifest.setdefault(relative_path, {}).update(checksum_entry)
+
+    return statuses
+
+
+def get_file_checksum(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """Return the sha256 checksum of a file, streaming it by chunks.
+
+    :param path: Path to the file.
+    :param chunk_size: Number of bytes read at once.
+    """
+    file_hash = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def format_size(n_bytes: float) -> str:
+    """Return a human readable size.
+
+    :param n_bytes: Size in bytes.
+    """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n_bytes < 1024:
+            return f'{n_bytes:.1f}{unit}'
+        n_bytes /= 1024
+
+    return f'{n_bytes:.1f}TB'
+
+
+"""Helper functions"""
+
+
+def _get_relative_path(path: str, cache_dir: str) -> Optional[str]:
+    """Return the path relative to the DiffuPath directory, or None for paths outside of it."""
+    relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(cache_dir))
+
+    if relative_path.startswith(os.pardir):
+        return None
+
+    return relative_path
+
+
+def _get_build_seconds(path: str, entry: Dict) -> Optional[float]:
+    """Return the build cost of an artifact, from its kernel file header or from the manifest."""
+    if is_kernel_file(path):
+        try:
+            return read_kernel_header(path)['metadata'].get('build_seconds')
+        except (IOError, ValueError):
+            log.warning(f'Unreadable kernel file header: {path}')
+
+    return entry.get('build_seconds')
+
+
+def _lock_file(file):
+    """Block until the exclusive lock of an open file is acquired."""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        return
+
+    # msvcrt locks give up after 10 attempts, so they are retried until acquired
+    while True:
+        try:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(file):
+    """Release the lock of an open file."""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        return
+
+    file.seek(0)
+    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
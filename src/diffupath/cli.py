@@ -4,11 +4,13 @@
 
 import logging
 from collections import defaultdict
+from functools import partial
 from typing import Optional, Union, Callable, List
 
 import click
 from bio2bel.constants import get_global_connection
-from diffupy.constants import EMOJI, CSV, Z
+from diffupy import kernels
+from diffupy.constants import EMOJI, ML, RAW, Z
 from diffupy.kernels import regularised_laplacian_kernel
 from diffupy.process_network import process_kernel_from_file, process_graph_from_file
 from diffupy.utils import from_json, to_json
@@ -17,8 +19,12 @@ from tqdm import tqdm
 
 from .constants import *
 from .diffuse import run_diffusion
+from .adaptive import run_adaptive
+from .kfold import validation_by_kfold
+from .loo import validation_by_loo
 from .ltoo import ltoo_by_method
 from .repeated_holdout import validation_by_method, validation_by_subgraph
+from .resources import AUTO, map_tasks, plan_resources, write_run_report
 from .utils import reduce_dict_dimension, reduce_dict_two_dimensional, reverse_twodim_dict
 
 logger = logging.getLogger(__name__)
@@ -56,15 +62,18 @@ def diffusion():
 )
 @click.option(
     '-o', '--output',
-    type=click.File('w'),
-    help='Path (with file name) for the generated scores output file. By default "$OUTPUT/diffusion_scores.csv"',
+    type=click.Path(dir_okay=False),
+    help='Path (with file name) for the generated scores output file, as CSV, TSV, JSON, parquet, feather, npz or h5. '
+         'By default "$OUTPUT/diffusion_scores.csv"',
     default=os.path.join(OUTPUT_DIR, 'diffusion_scores_on_pathme.csv'),
 )
 @click.option(
     '-m', '--method',
-    help='Method to elect among ["raw", "ml", "gm", "ber_s", "ber_p", "mc", "z"]. By default "z"',
+    help='Method to elect among ["raw", "ml", "gm", "ber_s", "ber_p", "mc", "z"]. By default "z". Can be given several '
+         'times to compute all the methods from a shared kernel product, as one column per method',
     type=click.Choice(METHODS),
-    default=Z,
+    default=[Z],
+    multiple=True,
     show_default=True,
 )
 @click.option(
@@ -98,10 +107,14 @@ def diffusion():
 )
 @click.option(
     '-f', '--format_output',
-    help='Choose CSV or JSON output scores file format.',
+    help='Output scores file format among CSV, TSV, JSON, parquet, feather, npz or h5. By default from the extension '
+         'of parquet, feather, npz and h5 outputs, CSV otherwise',
+    type=str,
+)
+@click.option(
+    '-c', '--compression',
+    help='Output compression (e.g. "zstd" for parquet or "gzip" for CSV)',
     type=str,
-    default=CSV,
-    show_default=True,
 )
 @click.option(
     '-km', '--kernel_method',
@@ -124,34 +137,139 @@ def diffusion():
     '-s', '--specie',
     help='Select among the species.',
     type=str,
+    default=HSA,
+)
+@click.option(
+    '-kd', '--kernel_dtype',
+    help='Dtype to store and multiply the kernel with (e.g. "float32"). By default the stored kernel dtype',
+    type=click.Choice(['float32', 'float64']),
+)
+@click.option(
+    '--packed',
+    help='Store the (symmetric) kernel as its packed upper triangle',
+    is_flag=True,
+)
+@click.option(
+    '-bs', '--block_size',
+    help='Number of kernel rows diffused at once, memory-mapping kernel files (.dpk) larger than memory',
+    type=int,
+)
+@click.option(
+    '-np', '--n_permutations',
+    help='Number of input permutations of the Monte Carlo methods ("mc" and "ber_p")',
+    type=int,
+    default=10000,
+    show_default=True,
+)
+@click.option(
+    '-w', '--workers',
+    help='Number of worker processes the permutations are sharded over, or "auto" to split the cores between workers '
+         'and BLAS threads from the kernel size',
+    default='1',
+    show_default=True,
+)
+@click.option(
+    '-bt', '--blas_threads',
+    help='Number of BLAS threads of each worker, or "auto" for the cores left by the workers',
+    default=AUTO,
+    show_default=True,
+)
+@click.option(
+    '-k', '--top_k',
+    help='Output only the top-k scoring nodes of each scores column',
+    type=int,
+)
+@click.option(
+    '-st', '--score_threshold',
+    help='Output only the nodes scoring above the threshold',
+    type=float,
+)
+@click.option(
+    '-e', '--entity_type',
+    help='Output only the nodes of the entity type, for kernel files and graphs. Can be given several times',
+    type=click.Choice(['genes', 'mirna', 'metabolites', 'bps']),
+    multiple=True,
+)
+@click.option(
+    '--cache', 'use_cache',
+    help='Reuse the scores of identical requests stored in the results cache, and store them otherwise',
+    is_flag=True,
+)
+@click.option(
+    '-cs', '--cache_size',
+    help='Disk budget of the results cache, in GB, beyond which the least recently used results are evicted',
+    type=float,
+    default=2,
+    show_default=True,
+)
+@click.option(
+    '--pipeline',
+    help='Load the kernel on a background thread while the input is processed',
+    is_flag=True,
 )
 def run(
     input: str,
     network: Optional[str] = None,
     output: Optional[str] = os.path.join(OUTPUT_DIR, 'diffusion_scores_on_pathme.csv'),
-    method: Union[str, Callable] = Z,
+    method: Union[str, List[str]] = Z,
     binarize: Optional[bool] = False,
     threshold: Optional[float] = None,
     absolute_value: Optional[bool] = False,
     p_value: Optional[float] = 0.05,
-    format_output: Optional[str] = CSV,
-    database: Optional[List] = None,
+    format_output: Optional[str] = None,
+    compression: Optional[str] = None,
+    kernel_method: Union[str, Callable] = regularised_laplacian_kernel,
+    filter_network_database: Optional[List] = None,
     filter_network_omic: Optional[List] = None,
-    specie: Optional[str] = HSA
+    specie: Optional[str] = HSA,
+    kernel_dtype: Optional[str] = None,
+    packed: Optional[bool] = False,
+    block_size: Optional[int] = None,
+    n_permutations: Optional[int] = 10000,
+    workers: Union[int, str] = 1,
+    blas_threads: Union[int, str] = AUTO,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+    entity_type: Optional[List[str]] = None,
+    use_cache: Optional[bool] = False,
+    cache_size: Optional[float] = 2,
+    pipeline: Optional[bool] = False,
 ):
     """Run a diffusion method for the provided input_scores over (by default) PathMeUniverse integrated network.
 
     :param input: Path or miscellaneous format data input to be processed/formatted.
     :param network: Path to the network or the network Object, as a (NetworkX) graph or as a (diffuPy.Matrix) kernel. By default 'KERNEL_PATH', pointing to PathMeUniverse kernel
     :param output: Path (with file name) for the generated scores output file. By default '$OUTPUT/diffusion_scores.csv'
-    :param method:  Elected method ["raw", "ml", "gm", "ber_s", "ber_p", "mc", "z"]. By default 'z'
+    :param method:  Elected method ["raw", "ml", "gm", "ber_s", "ber_p", "mc", "z"], or several of them. By default 'z'
     :param binarize: If logFC provided in dataset, convert logFC to binary. By default False
     :param threshold: Codify node labels by applying a threshold to logFC in input. By default None
     :param absolute_value: Codify node labels by applying threshold to | logFC | in input. By default False
     :param p_value: Statistical significance. By default 0.05
+    :param format_output: Output scores file format. By default from the extension of binary outputs, CSV otherwise.
+    :param compression: Output compression.
+    :param kernel_method: Kernel method (or name of a diffupy kernel method) used when a graph is provided.
     :param filter_network_database: List of selecte network databases to filter the network.
     :param filter_network_omic: List of omic network databases to filter the network.
+    :param specie: Specie id name to retrieve network and perform diffusion on.
+    :param kernel_dtype: Dtype to store and multiply the kernel with.
+    :param packed: Flag to store the kernel as its packed upper triangle.
+    :param block_size: Number of kernel rows diffused at once.
+    :param n_permutations: Number of input permutations of the Monte Carlo methods.
+    :param workers: Number of worker processes the permutations are sharded over, or "auto".
+    :param blas_threads: Number of BLAS threads of each worker, or "auto".
+    :param top_k: Output only the top-k scoring nodes of each scores column.
+    :param score_threshold: Output only the nodes scoring above the threshold.
+    :param entity_type: Output only the nodes of the given entity types.
+    :param use_cache: Flag to reuse (or store) the scores in the results cache.
+    :param cache_size: Disk budget of the results cache, in GB.
+    :param pipeline: Flag to load the kernel on a background thread while the input is processed.
     """
+    if isinstance(kernel_method, str):
+        kernel_method = getattr(kernels, kernel_method)
+
+    if not isinstance(method, str):
+        method = method[0] if len(method) == 1 else list(method)
+
     run_diffusion(input,
                   network,
                   output,
@@ -161,9 +279,110 @@ def run(
                   absolute_value,
                   p_value,
                   format_output,
-                  database,
-                  filter_network_omic,
-                  specie)
+                  kernel_method=kernel_method,
+                  database=filter_network_database,
+                  filter_network_omic=filter_network_omic,
+                  specie=specie,
+                  kernel_dtype=kernel_dtype,
+                  packed_kernel=packed,
+                  block_size=block_size,
+                  n_permutations=n_permutations,
+                  workers=workers,
+                  blas_threads=blas_threads,
+                  top_k=top_k,
+                  score_threshold=score_threshold,
+                  entity_types=list(entity_type),
+                  compression=compression,
+                  cache=use_cache,
+                  cache_size=int(cache_size * 1024 ** 3),
+                  pipeline=pipeline)
+
+
+@diffusion.command()
+@click.option(
+    '-i', '--input',
+    help='Path to the cohort matrix (samples x features) as CSV, TSV or .npy.',
+    required=True,
+    type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    '-n', '--network',
+    help='Path to the network as a kernel. By default "KERNEL_PATH", pointing to PathMeUniverse kernel',
+    default=KERNEL_PATH,
+    type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    '-o', '--output',
+    help='Output path for the (samples x nodes) scores, as .npy, .parquet, CSV or TSV',
+    required=True,
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    '-m', '--method',
+    help='Method to elect among ["raw", "ml", "z"]',
+    type=click.Choice([RAW, ML, Z]),
+    default=Z,
+    show_default=True,
+)
+@click.option(
+    '-cs', '--chunk_size',
+    help='Number of samples diffused at once',
+    type=int,
+    default=256,
+    show_default=True,
+)
+@click.option(
+    '-fl', '--feature_labels',
+    help='Path to a file with the feature labels (one per line) of the columns of .npy cohort matrices',
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    '-dt', '--dtype',
+    help='Dtype of the output scores',
+    type=click.Choice(['float32', 'float64']),
+    default='float64',
+    show_default=True,
+)
+def cohort(
+    input: str,
+    network: str,
+    output: str,
+    method: str = Z,
+    chunk_size: int = 256,
+    feature_labels: Optional[str] = None,
+    dtype: str = 'float64',
+):
+    """Diffuse every sample of a cohort matrix, streaming it in chunks of samples."""
+    from .cohort import diffuse_cohort
+    from .kernel_io import is_kernel_file, prefer_kernel_file, read_kernel_file, read_label_index
+
+    network = prefer_kernel_file(network)
+
+    click.secho(f'{EMOJI} Loading kernel from {network}... {EMOJI}')
+
+    if is_kernel_file(network):
+        kernel, label_index = read_kernel_file(network), read_label_index(network)
+    else:
+        kernel, label_index = process_kernel_from_file(network), None
+
+    if feature_labels:
+        with open(feature_labels) as file:
+            feature_labels = [line.strip() for line in file if line.strip()]
+
+    click.secho(f'{EMOJI} Diffusing the cohort {input}... {EMOJI}')
+
+    diffuse_cohort(
+        input,
+        kernel,
+        method=method,
+        output=output,
+        chunk_size=chunk_size,
+        label_index=label_index,
+        feature_labels=feature_labels,
+        dtype=dtype,
+    )
+
+    click.secho(f'{EMOJI} Cohort diffusion scores located at {output} {EMOJI}')
 
 
 @diffusion.command()
@@ -194,18 +413,48 @@ def run(
 )
 @click.option(
     '-o', '--output',
-    help='Output path for the results',
+    help='Output path for the results, as nested JSON or as a long metrics table (CSV, TSV, parquet, feather or h5)',
     default=os.path.join(OUTPUT_DIR, 'evaluation_metrics.json'),
     show_default=True,
-    type=click.Path(dir_okay=False),
+    type=click.Path(),
 )
 @click.option(
     '-i', '--iterations',
-    help='Number of distinct cross validations',
+    help='Number of distinct cross validations, or their maximum with a target width',
     default=25,
     show_default=True,
     type=int,
 )
+@click.option(
+    '-tw', '--target_width',
+    help='Stop the iterations of each dataset (or omic) once the confidence intervals of its metrics are narrower than '
+         'this width, iterations being the budget',
+    type=float,
+)
+@click.option(
+    '-f', '--folds',
+    help='Number of folds of the k-fold validation, repeated as many times as iterations',
+    default=10,
+    show_default=True,
+    type=int,
+)
+@click.option(
+    '--append',
+    help='Append the metrics to an existing metrics table (parquet outputs are written as datasets)',
+    is_flag=True,
+)
+@click.option(
+    '-w', '--workers',
+    help='Number of worker processes the validations are distributed over, or "auto"',
+    default='1',
+    show_default=True,
+)
+@click.option(
+    '-bt', '--blas_threads',
+    help='Number of BLAS threads of each worker, or "auto" for the cores left by the workers',
+    default=AUTO,
+    show_default=True,
+)
 def evaluate(
     comparison: Optional[str] = BY_METHOD,
     data_path: Optional[str] = os.path.join(ROOT_RESULTS_DIR, 'data', 'input_mappings'),
@@ -213,22 +462,36 @@ def evaluate(
     kernel: Optional[str] = KERNEL_PATH,
     output: Optional[str] = os.path.join(OUTPUT_DIR, 'evaluation_metrics.json'),
     iterations: Optional[int] = 100,
+    target_width: Optional[float] = None,
+    folds: int = 10,
+    append: bool = False,
+    workers: Union[int, str] = 1,
+    blas_threads: Union[int, str] = AUTO,
 ):
     """Evaluate a kernel/network on one of the three presented datasets.
 
-    :param comparison: Elected comparison ["by_method", "by_database", "by_entity_type"]. By default 'by_method'
+    :param comparison: Elected comparison ["by_method", "by_database", "by_entity_type", "loo", "kfold"].
+     By default 'by_method'
     :param data_path: Path to a DIRECTORY with a set of preprocessed and mapped data inputs in .json.
     :param graph: Path to the network as a (NetworkX) graph.
     :param kernel: Path to the network kernel (diffuPy.Matrix type).
     :param output: Path (with file name) for the generated scores output file. By default '$OUTPUT/diffusion_scores.csv'
-    :param iterations: Number of iterations of the Cross-Validation.
-
+    :param iterations: Number of iterations of the Cross-Validation (repeats of the k-fold validation).
+    :param target_width: Target width of the metric confidence intervals of the adaptive iterations.
+    :param folds: Number of folds of the k-fold validation.
+    :param append: Flag to append the metrics to an existing metrics table.
+    :param workers: Number of worker processes the validations by method are distributed over, or "auto".
+    :param blas_threads: Number of BLAS threads of each worker, or "auto".
     """
     click.secho(f'{EMOJI} Loading network for validation... {EMOJI}')
 
     graph = process_graph_from_file(graph)
     kernel = process_kernel_from_file(kernel)
 
+    # Holdout loops are distributed on worker processes, each limited to its BLAS threads
+    resources = plan_resources(workers, blas_threads, n_nodes=len(kernel.rows_labels), n_tasks=3)
+    click.secho(f'{EMOJI} {resources.workers} workers with {resources.blas_threads} BLAS threads each {EMOJI}')
+
     click.secho(f'{EMOJI} Loading data for validation... {EMOJI}')
 
     mapping_path_dataset_1 = os.path.join(data_path, 'dataset_1_mapping_absolute_value_bp.json')
@@ -240,6 +503,9 @@ def evaluate(
     mapping_path_dataset_3 = os.path.join(data_path, 'dataset_3_mapping.json')
     dataset3_mapping_by_database_and_entity = from_json(mapping_path_dataset_3)
 
+    # Achieved precision of the metrics of each dataset (or stratum), for the adaptive comparisons
+    precision = {}
+
     if comparison == LTOO:
         dataset1_mapping_by_entity = reduce_dict_dimension(reverse_twodim_dict(dataset1_mapping_by_database_and_entity))
         dataset2_mapping_by_entity = reduce_dict_dimension(reverse_twodim_dict(dataset2_mapping_by_database_and_entity))
@@ -282,30 +548,69 @@ def evaluate(
 
         metrics = defaultdict(lambda: defaultdict(lambda: list))
 
-        click.secho(f'{EMOJI} Running cross_validation_by_method for Dataset 1... {EMOJI}')
-        metrics['auroc']['Dataset 1'], metrics['auprc']['Dataset 1'] = validation_by_method(
-            dataset1_mapping_all_labels,
-            graph,
-            kernel,
-            k=iterations
+        datasets = {
+            'Dataset 1': dataset1_mapping_all_labels,
+            'Dataset 2': dataset2_mapping_all_labels,
+            'Dataset 3': dataset3_mapping_all_labels,
+        }
+
+        click.secho(f'{EMOJI} Running cross_validation_by_method for {", ".join(datasets)}... {EMOJI}')
+        dataset_metrics = map_tasks(
+            run_adaptive,
+            [
+                (partial(validation_by_method, mapping, graph, kernel), iterations, target_width)
+                for mapping in datasets.values()
+            ],
+            resources,
         )
 
-        click.secho(f'{EMOJI} Running cross_validation_by_method for Dataset 2... {EMOJI}')
-        metrics['auroc']['Dataset 2'], metrics['auprc']['Dataset 2'] = validation_by_method(
-            dataset2_mapping_all_labels,
-            graph,
-            kernel,
-            k=iterations
+        for dataset, (auroc, auprc, precision[dataset]) in zip(datasets, dataset_metrics):
+            metrics['auroc'][dataset], metrics['auprc'][dataset] = auroc, auprc
+
+    elif comparison == LOO:
+        datasets = {
+            'Dataset 1': reduce_dict_two_dimensional(dataset1_mapping_by_database_and_entity),
+            'Dataset 2': reduce_dict_two_dimensional(dataset2_mapping_by_database_and_entity),
+            'Dataset 3': reduce_dict_two_dimensional(dataset3_mapping_by_database_and_entity),
+        }
+
+        metrics = defaultdict(lambda: defaultdict(lambda: list))
+
+        # Exact held-out scores of every label from a single diffusion, so iterations are not needed
+        click.secho(f'{EMOJI} Running leave-one-out validation for {", ".join(datasets)}... {EMOJI}')
+        dataset_metrics = map_tasks(
+            validation_by_loo,
+            [(mapping, kernel, graph) for mapping in datasets.values()],
+            resources,
         )
 
-        click.secho(f'{EMOJI} Running cross_validation_by_method for Dataset 3... {EMOJI}')
-        metrics['auroc']['Dataset 3'], metrics['auprc']['Dataset 3'] = validation_by_method(
-            dataset3_mapping_all_labels,
-            graph,
-            kernel,
-            k=iterations
+        for dataset, (auroc, auprc) in zip(datasets, dataset_metrics):
+            metrics['auroc'][dataset], metrics['auprc'][dataset] = auroc, auprc
+
+    elif comparison == KFOLD:
+        # Labels by omic type, so that the folds are stratified by omic
+        datasets = {
+            'Dataset 1': reduce_dict_dimension(reverse_twodim_dict(dataset1_mapping_by_database_and_entity)),
+            'Dataset 2': reduce_dict_dimension(reverse_twodim_dict(dataset2_mapping_by_database_and_entity)),
+            'Dataset 3': reduce_dict_dimension(reverse_twodim_dict(dataset3_mapping_by_database_and_entity)),
+        }
+
+        metrics = defaultdict(lambda: defaultdict(lambda: list))
+
+        click.secho(f'{EMOJI} Running {iterations}x{folds}-fold validation for {", ".join(datasets)}... {EMOJI}')
+        # Repeats of the k-fold validation are the iterations of the adaptive runs
+        dataset_metrics = map_tasks(
+            run_adaptive,
+            [
+                (partial(validation_by_kfold, mapping, kernel, graph, folds), iterations, target_width)
+                for mapping in datasets.values()
+            ],
+            resources,
         )
 
+        for dataset, (auroc, auprc, precision[dataset]) in zip(datasets, dataset_metrics):
+            metrics['auroc'][dataset], metrics['auprc'][dataset] = auroc, auprc
+
     elif comparison == BY_DB:
         dataset1_mapping_all_labels = reduce_dict_two_dimensional(dataset1_mapping_by_database_and_entity)
         dataset2_mapping_all_labels = reduce_dict_two_dimensional(dataset2_mapping_by_database_and_entity)
@@ -351,44 +656,30 @@ def evaluate(
 
         metrics = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: list)))
 
-        click.secho(f'{EMOJI} Running cross_validation_by_method stratified by omic for Dataset 1... {EMOJI}')
-
-        for entity_type, entity_set in dataset1_mapping_by_entity.items():
-            if len(entity_set) > 2:
-                click.secho(f'{EMOJI} Running cross_validation_by_method for {entity_type}... {EMOJI}')
-                metrics['auroc']['Dataset 1'][entity_type], metrics['auprc']['Dataset 1'][
-                    entity_type] = validation_by_method(
-                    entity_set,
-                    graph,
-                    kernel,
-                    k=iterations
-                )
-
-        click.secho(f'{EMOJI} Running cross_validation_by_method stratified by omic for Dataset 2... {EMOJI}')
-
-        for entity_type, entity_set in dataset2_mapping_by_entity.items():
-            if len(entity_set) > 2:
-                click.secho(f'{EMOJI} Running cross_validation_by_method for {entity_type}... {EMOJI}')
-                metrics['auroc']['Dataset 2'][entity_type], metrics['auprc']['Dataset 2'][
-                    entity_type] = validation_by_method(
-                    entity_set,
-                    graph,
-                    kernel,
-                    k=iterations
-                )
-
-        click.secho(f'{EMOJI} Running cross_validation_by_method stratified by omic for Dataset 3... {EMOJI}')
+        # Validations of every dataset and omic, run on the workers
+        tasks = {
+            (dataset, entity_type): entity_set
+            for dataset, mapping_by_entity in (
+                ('Dataset 1', dataset1_mapping_by_entity),
+                ('Dataset 2', dataset2_mapping_by_entity),
+                ('Dataset 3', dataset3_mapping_by_entity),
+            )
+            for entity_type, entity_set in mapping_by_entity.items()
+            if len(entity_set) > 2
+        }
+
+        click.secho(f'{EMOJI} Running cross_validation_by_method stratified by omic for {len(tasks)} sets... {EMOJI}')
+        task_metrics = map_tasks(
+            run_adaptive,
+            [
+                (partial(validation_by_method, entity_set, graph, kernel), iterations, target_width)
+                for entity_set in tasks.values()
+            ],
+            resources,
+        )
 
-        for entity_type, entity_set in dataset3_mapping_by_entity.items():
-            if len(entity_set) > 2:
-                click.secho(f'{EMOJI} Running cross_validation_by_method for {entity_type}... {EMOJI}')
-                metrics['auroc']['Dataset 3'][entity_type], metrics['auprc']['Dataset 3'][
-                    entity_type] = validation_by_method(
-                    entity_set,
-                    graph,
-                    kernel,
-                    k=iterations
-                )
+        for (dataset, entity_type), (auroc, auprc, precision[f'{dataset} {entity_type}']) in zip(tasks, task_metrics):
+            metrics['auroc'][dataset][entity_type], metrics['auprc'][dataset][entity_type] = auroc, auprc
 
     elif comparison == BY_ENTITY_DB:
         dataset1_mapping_by_entity = reduce_dict_dimension(reverse_twodim_dict(dataset1_mapping_by_database_and_entity))
@@ -445,11 +736,522 @@ def evaluate(
     else:
         raise ValueError("The indicated comparison method do not match any provided method.")
 
-    to_json(metrics, output)
+    if output.endswith('.json'):
+        to_json(metrics, output)
+    else:
+        from .results import METRICS_LEVELS, write_metrics
+
+        write_metrics(metrics, output, levels=METRICS_LEVELS.get(comparison), append=append)
+
+    for name, report in precision.items():
+        widest = max(
+            method_precision['ci_width']
+            for metric in ('auroc', 'auprc')
+            for method_precision in report[metric].values()
+        )
+        click.secho(f'{EMOJI} {name}: {report["iterations"]} iterations, widest interval {widest:.4f} {EMOJI}')
+
+    write_run_report(
+        output, resources, comparison=comparison, iterations=iterations, folds=folds, target_width=target_width,
+        precision=precision,
+    )
 
     click.secho(f'{EMOJI} Random cross-validation performed with success. Output located at {output}... {EMOJI}')
 
 
+@diffusion.command()
+@click.option(
+    '-i', '--input',
+    help='Metrics table (or nested JSON metrics) of an evaluation',
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    '-o', '--output',
+    help='Directory of the figures',
+    default=os.path.join(OUTPUT_DIR, 'report'),
+    show_default=True,
+    type=click.Path(file_okay=False),
+)
+@click.option(
+    '-c', '--comparison',
+    help='Comparison of the evaluation, naming the levels of nested JSON metrics',
+    default=BY_METHOD,
+    show_default=True,
+    type=click.Choice(EVALUATION_COMPARISONS),
+)
+@click.option(
+    '-f', '--figure_format',
+    help='Format of the figures',
+    default='png',
+    show_default=True,
+)
+@click.option(
+    '-t', '--test',
+    help='Paired test of the FDR bar charts',
+    default='t',
+    show_default=True,
+    type=click.Choice(['t', 'wilcoxon']),
+)
+@click.option(
+    '-w', '--workers',
+    help='Number of worker processes the figures are rendered on, or "auto"',
+    default=AUTO,
+    show_default=True,
+)
+@click.option(
+    '--force',
+    help='Redraw every figure, including those whose data did not change',
+    is_flag=True,
+)
+def report(
+    input: str,
+    output: str = os.path.join(OUTPUT_DIR, 'report'),
+    comparison: str = BY_METHOD,
+    figure_format: str = 'png',
+    test: str = 't',
+    workers: Union[int, str] = AUTO,
+    force: bool = False,
+):
+    """Render the figures of evaluation metrics to files.
+
+    :param input: Path to the metrics table (or nested JSON metrics) of an evaluation.
+    :param output: Directory of the figures.
+    :param comparison: Comparison of the evaluation, naming the levels of nested JSON metrics.
+    :param figure_format: Format of the figures (e.g. png, svg or pdf).
+    :param test: Paired test of the FDR bar charts, "t" or "wilcoxon".
+    :param workers: Number of worker processes the figures are rendered on, or "auto".
+    :param force: Flag to redraw every figure.
+    """
+    from .report import render_report
+    from .results import METRICS_LEVELS, metrics_to_table, read_table
+
+    if input.endswith('.json'):
+        table = metrics_to_table(from_json(input), levels=METRICS_LEVELS.get(comparison))
+    else:
+        table = read_table(input)
+
+    rendered = render_report(table, output, figure_format=figure_format, workers=workers, force=force, test=test)
+
+    click.secho(f'{EMOJI} {len(rendered)} figures redrawn. Report located at {output} {EMOJI}')
+
+
+@main.group()
+def kernel():
+    """Commands for processing network kernels."""
+
+
+@kernel.command()
+@click.option(
+    '-k', '--kernel',
+    help='Path to the dense kernel',
+    default=KERNEL_PATH,
+    type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    '-o', '--output',
+    help='Output path for the sparsified kernel (pickle)',
+    required=True,
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    '-t', '--top_k',
+    help='Number of largest entries kept per kernel column',
+    type=int,
+)
+@click.option(
+    '-r', '--relative_threshold',
+    help='Keep entries above this fraction of the column maximum',
+    type=float,
+)
+@click.option(
+    '-i', '--input',
+    help='Path to a data input used to report the ranking agreement. By default a random probe input',
+    type=click.Path(exists=True, dir_okay=False),
+)
+def sparsify(
+    kernel: str,
+    output: str,
+    top_k: Optional[int] = None,
+    relative_threshold: Optional[float] = None,
+    input: Optional[str] = None,
+):
+    """Sparsify a dense kernel and report its ranking agreement with the dense kernel."""
+    from diffupy.process_input import process_map_and_format_input_data_for_diff
+
+    from .kernel_diffusion import kernel_ranking_agreement, random_probe_input
+    from .sparse_kernel import sparsify_kernel
+    from .utils import to_pickle
+
+    click.secho(f'{EMOJI} Loading kernel from {kernel}... {EMOJI}')
+    dense_kernel = process_kernel_from_file(kernel)
+
+    sparse_kernel = sparsify_kernel(dense_kernel, top_k=top_k, relative_threshold=relative_threshold)
+
+    click.secho(
+        f'{EMOJI} Sparsified kernel keeps {sparse_kernel.mat.nnz} entries ({sparse_kernel.density:.2%} density, '
+        f'{sparse_kernel.nbytes / dense_kernel.mat.nbytes:.2%} of the dense kernel memory) {EMOJI}'
+    )
+
+    if input:
+        input_scores = process_map_and_format_input_data_for_diff(input, dense_kernel)
+    else:
+        input_scores = random_probe_input(dense_kernel, seed=0)
+
+    for col_label, agreement in kernel_ranking_agreement(dense_kernel, sparse_kernel, input_scores).items():
+        click.secho(
+            f'{EMOJI} {col_label}: Kendall tau {agreement["kendall_tau"]:.4f}, AUROC {agreement["auroc"]:.4f} {EMOJI}'
+        )
+
+    to_pickle(sparse_kernel, output)
+
+    click.secho(f'{EMOJI} Sparsified kernel exported to {output} {EMOJI}')
+
+
+@kernel.command()
+@click.option(
+    '-k', '--kernel',
+    help='Path to the float64 kernel',
+    default=KERNEL_PATH,
+    type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    '-o', '--output',
+    help='Output path for the compact kernel (pickle)',
+    required=True,
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    '-kd', '--kernel_dtype',
+    help='Dtype of the compact kernel values',
+    default='float32',
+    show_default=True,
+    type=click.Choice(['float32', 'float64']),
+)
+@click.option(
+    '--packed',
+    help='Store only the packed upper triangle of the (symmetric) kernel',
+    is_flag=True,
+)
+def compact(
+    kernel: str,
+    output: str,
+    kernel_dtype: str = 'float32',
+    packed: bool = False,
+):
+    """Store a kernel in float32 and/or symmetric packed format, checking its precision against float64."""
+    from .compact_kernel import compact_kernel, kernel_nbytes
+    from .kernel_diffusion import check_kernel_precision
+    from .utils import to_pickle
+
+    click.secho(f'{EMOJI} Loading kernel from {kernel}... {EMOJI}')
+    reference_kernel = process_kernel_from_file(kernel)
+
+    compacted_kernel = compact_kernel(reference_kernel, dtype=kernel_dtype, packed=packed)
+
+    precision = check_kernel_precision(reference_kernel, compacted_kernel)
+
+    click.secho(
+        f'{EMOJI} Compact kernel uses {kernel_nbytes(compacted_kernel) / kernel_nbytes(reference_kernel):.2%} of the '
+        f'original memory. Kendall tau {precision["kendall_tau"]:.6f}, AUROC {precision["auroc"]:.6f}, '
+        f'max. absolute error {precision["max_abs_error"]:.2e} {EMOJI}'
+    )
+
+    to_pickle(compacted_kernel, output)
+
+    click.secho(f'{EMOJI} Compact kernel exported to {output} {EMOJI}')
+
+
+@kernel.command()
+@click.option(
+    '-k', '--kernel',
+    help='Path to the kernel (pickle)',
+    default=KERNEL_PATH,
+    type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    '-o', '--output',
+    help='Output path for the kernel file. By default the kernel path with the .dpk extension',
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    '-d', '--database',
+    help='Database the kernel network stems from, recorded in the kernel file header. Can be given several times',
+    multiple=True,
+)
+@click.option(
+    '-km', '--kernel_method',
+    help='Name of the method the kernel was computed with, recorded in the kernel file header',
+    default='regularised_laplacian_kernel',
+    show_default=True,
+)
+def convert(
+    kernel: str,
+    output: Optional[str] = None,
+    database: Optional[List[str]] = None,
+    kernel_method: Optional[str] = 'regularised_laplacian_kernel',
+):
+    """Convert a kernel into a kernel file (.dpk) that can be memory-mapped for out-of-core diffusion."""
+    from .kernel_io import get_kernel_file_path, write_kernel_file
+
+    click.secho(f'{EMOJI} Loading kernel from {kernel}... {EMOJI}')
+
+    output = output or get_kernel_file_path(kernel)
+
+    write_kernel_file(
+        process_kernel_from_file(kernel),
+        output,
+        databases=list(database) or None,
+        kernel_method=kernel_method,
+    )
+
+    click.secho(f'{EMOJI} Kernel file exported to {output} {EMOJI}')
+
+
+@kernel.command()
+@click.argument('kernel', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '-i', '--input',
+    help='Optional file with input labels (first column) to report the kernel coverage by node type',
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    '--as_json',
+    help='Print the kernel information as JSON',
+    is_flag=True,
+)
+def info(
+    kernel: str,
+    input: Optional[str] = None,
+    as_json: bool = False,
+):
+    """Show the metadata of a kernel file (.dpk), reading only its header."""
+    import json
+
+    from .kernel_io import get_kernel_info, get_label_coverage
+
+    kernel_info = get_kernel_info(kernel)
+
+    if input:
+        import pandas as pd
+        from diffupy.utils import munge_label
+
+        labels = set()
+        for label in pd.read_csv(input, sep=None, engine='python').iloc[:, 0]:
+            label = munge_label(label)
+            labels.update(label if isinstance(label, tuple) else [label])
+
+        kernel_info['coverage'] = {
+            str(node_type): {'mapped': mapped, 'total': total}
+            for node_type, (mapped, total) in get_label_coverage(kernel, labels).items()
+        }
+
+    if as_json:
+        click.echo(json.dumps(kernel_info, indent=2))
+        return
+
+    for key, value in kernel_info.items():
+        click.echo(f'{key}\t{value}')
+
+
+@kernel.command()
+@click.option(
+    '-g', '--graph',
+    help='Path to the universe graph, annotated by database',
+    default=GRAPH_PATH,
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    '-o', '--output',
+    help='Kernel store directory',
+    default=KERNELS_PATH,
+    type=click.Path(file_okay=False),
+)
+@click.option(
+    '-d', '--database',
+    help='Database, or comma separated combination of databases, to build a kernel for. Can be given several times. '
+         'By default every single PathMe database',
+    multiple=True,
+)
+@click.option(
+    '-s', '--specie',
+    help='Specie whose universe kernel is also built. Can be given several times',
+    multiple=True,
+)
+@click.option(
+    '-w', '--workers',
+    help='Number of worker processes. By default the number of CPUs',
+    type=int,
+)
+@click.option(
+    '-m', '--memory_budget',
+    help='Memory budget (in GB) shared by the kernels built at once',
+    type=float,
+)
+@click.option(
+    '-kd', '--kernel_dtype',
+    help='Dtype to store the kernels with',
+    type=click.Choice(['float32', 'float64']),
+)
+@click.option(
+    '--overwrite',
+    help='Rebuild kernels already in the store',
+    is_flag=True,
+)
+def build(
+    graph: str,
+    output: str,
+    database: List[str],
+    specie: List[str],
+    workers: Optional[int] = None,
+    memory_budget: Optional[float] = None,
+    kernel_dtype: Optional[str] = None,
+    overwrite: bool = False,
+):
+    """Prebuild the kernels of the selected databases (and combinations) and species in parallel."""
+    from .kernel_build import build_kernels, plan_kernel_builds
+
+    click.secho(f'{EMOJI} Planning kernel builds from {graph}... {EMOJI}')
+
+    jobs = plan_kernel_builds(
+        graph,
+        output,
+        databases=[combination.split(',') for combination in database] or None,
+        species=list(specie),
+        graphs_dir=GRAPHS_PATH,
+        overwrite=overwrite,
+    )
+
+    if not jobs:
+        click.secho(f'{EMOJI} All the requested kernels are already built {EMOJI}')
+        return
+
+    click.secho(f'{EMOJI} Building {len(jobs)} kernels... {EMOJI}')
+
+    reports = build_kernels(
+        jobs,
+        workers=workers,
+        memory_budget=int(memory_budget * 1024 ** 3) if memory_budget else None,
+        kernel_dtype=kernel_dtype,
+    )
+
+    for report in sorted(reports, key=lambda report: report.build_seconds, reverse=True):
+        click.echo(f'{report.name}\t{report.n_nodes} nodes\t{report.build_seconds:.1f}s\t{report.output}')
+
+    click.secho(f'{EMOJI} {len(reports)} kernels built in {output} {EMOJI}')
+
+
+@main.group()
+def cache():
+    """Commands for managing the DiffuPath directory (kernels, graphs and outputs)."""
+
+
+@cache.command()
+@click.option(
+    '-c', '--category',
+    help='Top level folder to restrict the stats to (e.g. kernels, graphs or output). Can be given several times',
+    multiple=True,
+)
+def stats(category: List[str]):
+    """Report the size, last access and build cost of each artifact."""
+    from datetime import datetime
+
+    from .cache import format_size, get_artifacts
+
+    artifacts = get_artifacts(DEFAULT_DIFFUPATH_DIR, categories=category)
+
+    size_by_category = defaultdict(int)
+
+    for artifact in sorted(artifacts, key=lambda artifact: artifact.size, reverse=True):
+        size_by_category[artifact.category] += artifact.size
+
+        build_cost = f'{artifact.build_seconds:.1f}s' if artifact.build_seconds is not None else '-'
+
+        click.echo(
+            f'{format_size(artifact.size)}\t'
+            f'{datetime.fromtimestamp(artifact.last_access):%Y-%m-%d %H:%M}\t'
+            f'{build_cost}\t'
+            f'{os.path.relpath(artifact.path, DEFAULT_DIFFUPATH_DIR)}'
+        )
+
+    for category_name, size in sorted(size_by_category.items()):
+        click.secho(f'{EMOJI} {category_name or "."}: {format_size(size)} {EMOJI}')
+
+    click.secho(
+        f'{EMOJI} Total: {format_size(sum(size_by_category.values()))} in {len(artifacts)} artifacts {EMOJI}'
+    )
+
+
+@cache.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def warm(paths: List[str]):
+    """Pre-load kernels into the page cache. By default the PathMeUniverse kernel."""
+    from .cache import format_size, warm_artifacts
+    from .kernel_io import prefer_kernel_file
+
+    paths = paths or [prefer_kernel_file(KERNEL_PATH)]
+
+    n_bytes = warm_artifacts(paths)
+
+    click.secho(f'{EMOJI} {format_size(n_bytes)} loaded into the page cache from {len(paths)} files {EMOJI}')
+
+
+@cache.command()
+@click.option(
+    '-b', '--budget',
+    help='Disk budget (in GB) of the DiffuPath directory',
+    required=True,
+    type=float,
+)
+@click.option(
+    '-c', '--category',
+    help='Top level folder whose artifacts can be evicted. Can be given several times. By default every artifact',
+    multiple=True,
+)
+@click.option(
+    '--dry_run',
+    help='Only report the artifacts that would be evicted',
+    is_flag=True,
+)
+def prune(budget: float, category: List[str], dry_run: bool = False):
+    """Evict the least recently used artifacts to fit the disk budget."""
+    from .cache import format_size, prune_cache
+
+    evicted = prune_cache(int(budget * 1024 ** 3), DEFAULT_DIFFUPATH_DIR, categories=category, dry_run=dry_run)
+
+    for artifact in evicted:
+        click.echo(f'{format_size(artifact.size)}\t{os.path.relpath(artifact.path, DEFAULT_DIFFUPATH_DIR)}')
+
+    click.secho(
+        f'{EMOJI} {"Would evict" if dry_run else "Evicted"} {len(evicted)} artifacts '
+        f'({format_size(sum(artifact.size for artifact in evicted))}) {EMOJI}'
+    )
+
+
+@cache.command()
+@click.option(
+    '-c', '--category',
+    help='Top level folder to restrict the check to. Can be given several times',
+    multiple=True,
+)
+def verify(category: List[str]):
+    """Verify the artifacts checksums without loading the matrices."""
+    from .cache import CORRUPTED, verify_artifacts
+
+    statuses = verify_artifacts(DEFAULT_DIFFUPATH_DIR, categories=category)
+
+    for path, status in sorted(statuses.items()):
+        click.echo(f'{status}\t{os.path.relpath(path, DEFAULT_DIFFUPATH_DIR)}')
+
+    corrupted = [path for path, status in statuses.items() if status == CORRUPTED]
+
+    if corrupted:
+        click.secho(f'{EMOJI} {len(corrupted)} corrupted artifacts {EMOJI}', fg='red')
+        raise SystemExit(1)
+
+    click.secho(f'{EMOJI} {len(statuses)} artifacts verified {EMOJI}')
+
+
 @main.group()
 def database():
     """Commands related to available databases."""
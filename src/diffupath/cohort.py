@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+"""Streaming diffusion of cohort (samples x features) matrices, with memory bounded by the chunk size."""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import CancelledError
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from diffupy.constants import ML, RAW, Z
+from diffupy.matrix import Matrix
+
+from .kernel_diffusion import kernel_product, kernel_row_sums, z_normalize
+from .label_index import LabelIndex
+
+log = logging.getLogger(__name__)
+
+#: Number of samples diffused at once
+COHORT_CHUNK_SIZE = 256
+
+#: Label of the samples column in tabular outputs
+SAMPLE_COLUMN = 'Sample'
+
+
+def diffuse_cohort(
+    path: str,
+    kernel: Matrix,
+    method: str = RAW,
+    output: Optional[str] = None,
+    chunk_size: int = COHORT_CHUNK_SIZE,
+    label_index: Optional[LabelIndex] = None,
+    feature_labels: Optional[List[str]] = None,
+    missing_value: float = 0,
+    dtype: str = 'float64',
+    stop: Optional[threading.Event] = None,
+) -> Union[Matrix, str]:
+    """Diffuse every sample of a cohort matrix, streaming the matrix in chunks of samples.
+
+    The feature columns are mapped to the kernel rows once. Each chunk of samples is then diffused with a single kernel
+    product and its (samples x nodes) scores are written to the output before the next chunk is read, so peak memory
+    only depends on the chunk size and the kernel.
+
+    :param path: Path to the cohort matrix, with samples as rows and features (e.g. genes or metabolites) as columns.
+     Either a CSV/TSV file, whose first column holds the sample identifiers, or a .npy file (see feature_labels).
+    :param kernel: Network as a kernel (dense, sparse, packed or memory-mapped).
+    :param method: Elected method ["raw", "ml", "z"].
+    :param output: Optional output path, either a .npy file (memory-mapped, its labels written to a .labels.json
+     sidecar), a .parquet file (one row group per chunk) or a CSV/TSV file.
+    :param chunk_size: Number of samples diffused at once.
+    :param label_index: Label index of the kernel. By default built from the kernel labels.
+    :param feature_labels: Feature labels of the columns of .npy cohort matrices.
+    :param missing_value: Score of the kernel nodes absent from the cohort features (and of missing values).
+    :param dtype: Dtype of the output scores.
+    :param stop: Optional event cancelling the diffusion before the next chunk once set (e.g. from another thread).
+    :return: Diffusion scores as a (samples x nodes) Matrix or, if an output is given, the output path.
+    """
+    if method not in {RAW, Z, ML}:
+        raise ValueError(f'Method not supported for cohort diffusion: {method}')
+
+    if label_index is None:
+        label_index = LabelIndex.from_kernel(kernel)
+
+    features = read_cohort_features(path, feature_labels)
+    rows = label_index.get_rows(features)
+    mapped = np.flatnonzero(rows >= 0)
+
+    if not len(mapped):
+        raise ValueError(f'None of the {len(features)} cohort features maps to the kernel.')
+
+    log.info(f'{len(mapped)} of {len(features)} cohort features mapped to the kernel.')
+
+    if method == Z:
+        row_sums = kernel_row_sums(kernel)
+
+    nodes = list(kernel.rows_labels)
+    n_samples = count_cohort_samples(path)
+
+    samples, writer = [], _open_writer(output, n_samples, nodes, dtype)
+
+    for chunk_samples, values in iter_cohort_chunks(path, chunk_size, columns=mapped):
+        if stop is not None and stop.is_set():
+            raise CancelledError(f'Diffusion of {path} cancelled after {len(samples)} of {n_samples} samples.')
+
+        input_mat = np.full((len(nodes), len(chunk_samples)), missing_value, dtype=float)
+        input_mat[rows[mapped]] = np.where(np.isnan(values.T), missing_value, values.T)
+
+        if method == ML:
+            input_mat = _to_ml_labels(input_mat)
+
+        scores = kernel_product(kernel, input_mat)
+
+        if method == Z:
+            scores = z_normalize(scores, input_mat, *row_sums)
+
+        writer(len(samples), chunk_samples, scores.T.astype(dtype, copy=False))
+        samples.extend(chunk_samples)
+
+        log.debug(f'Diffused {len(samples)} of {n_samples} samples.')
+
+    result = writer(None, samples, None)
+
+    if output is None:
+        return Matrix(result, rows_labels=samples, cols_labels=nodes, name=os.path.basename(path))
+
+    return output
+
+
+def read_cohort_features(path: str, feature_labels: Optional[List[str]] = None) -> List[str]:
+    """Return the feature labels of a cohort matrix, reading only its header.
+
+    :param path: Path to the cohort matrix.
+    :param feature_labels: Feature labels of the columns of .npy cohort matrices.
+    """
+    if path.endswith('.npy'):
+        n_features = np.load(path, mmap_mode='r').shape[1]
+
+        if feature_labels is None or len(feature_labels) != n_features:
+            raise ValueError(f'{n_features} feature labels are needed for the columns of {path}.')
+
+        return list(feature_labels)
+
+    return list(pd.read_csv(path, sep=_get_separator(path), index_col=0, nrows=0).columns)
+
+
+def count_cohort_samples(path: str) -> int:
+    """Return the number of samples of a cohort matrix, without parsing it.
+
+    :param path: Path to the cohort matrix.
+    """
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r').shape[0]
+
+    with open(path, 'rb') as file:
+        # Header line excluded
+        return sum(1 for line in file if line.strip()) - 1
+
+
+def iter_cohort_chunks(
+    path: str,
+    chunk_size: int = COHORT_CHUNK_SIZE,
+    columns: Optional[np.ndarray] = None,
+) -> Iterator[Tuple[List[str], np.ndarray]]:
+    """Iterate over the chunks of samples of a cohort matrix, as (sample identifiers, samples x features values).
+
+    :param path: Path to the cohort matrix.
+    :param chunk_size: Number of samples per chunk.
+    :param columns: Optional positions of the feature columns to read, the rest of columns are not parsed.
+    """
+    if path.endswith('.npy'):
+        cohort = np.load(path, mmap_mode='r')
+
+        for start in range(0, cohort.shape[0], chunk_size):
+            values = cohort[start:start + chunk_size]
+            if columns is not None:
+                values = values[:, columns]
+
+            yield [str(sample) for sample in range(start, start + values.shape[0])], np.asarray(values, dtype=float)
+
+        return
+
+    usecols = None if columns is None else [0] + [column + 1 for column in columns]
+
+    for chunk in pd.read_csv(path, sep=_get_separator(path), index_col=0, usecols=usecols, chunksize=chunk_size):
+        yield [str(sample) for sample in chunk.index], chunk.values.astype(float)
+
+
+"""Helper functions"""
+
+
+def _get_separator(path: str) -> str:
+    """Return the separator of a delimited file from its extension."""
+    return '\t' if path.endswith(('.tsv', '.tab', '.txt')) else ','
+
+
+def _to_ml_labels(input_mat: np.ndarray) -> np.ndarray:
+    """Codify binary cohort scores as {-1, 1} labels, as required by the ml method."""
+    if not np.isin(input_mat, [-1, 0, 1]).all():
+        raise ValueError('Cohort scores must be binary.')
+
+    return np.where(input_mat == 0, -1, input_mat)
+
+
+def _open_writer(output: Optional[str], n_samples: int, nodes: List[str], dtype: str):
+    """Return a writer of (start, samples, scores) chunks, called with scores None once all chunks are written.
+
+    In memory and .npy outputs are preallocated for all the samples, the rest are appended chunk by chunk.
+    """
+    if output is None or output.endswith('.npy'):
+        if output is None:
+            scores = np.empty((n_samples, len(nodes)), dtype=dtype)
+        else:
+            scores = np.lib.format.open_memmap(output, mode='w+', dtype=dtype, shape=(n_samples, len(nodes)))
+
+        def write(start, samples, chunk_scores):
+            if chunk_scores is not None:
+                scores[start:start + len(samples)] = chunk_scores
+                return
+
+            if output is not None:
+                scores.flush()
+                with open(f'{os.path.splitext(output)[0]}.labels.json', 'w') as file:
+                    json.dump({'rows_labels': samples, 'cols_labels': nodes}, file)
+
+            return scores
+
+        return write
+
+    if output.endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Parquet outputs require pyarrow, install it with "pip install pyarrow".')
+
+        scores_type = pa.from_numpy_dtype(np.dtype(dtype))
+        schema = pa.schema([(SAMPLE_COLUMN, pa.string())] + [(node, scores_type) for node in nodes])
+        parquet_writer = pq.ParquetWriter(output, schema)
+
+        def write(start, samples, chunk_scores):
+            if chunk_scores is None:
+                parquet_writer.close()
+                return
+
+            parquet_writer.write_table(pa.Table.from_arrays(
+                [pa.array(samples, pa.string())] + [pa.array(column) for column in chunk_scores.T],
+                schema=schema,
+            ))
+
+        return write
+
+    separator = _get_separator(output)
+    pd.DataFrame(columns=nodes).rename_axis(SAMPLE_COLUMN).to_csv(output, sep=separator)
+
+    def write(start, samples, chunk_scores):
+        if chunk_scores is not None:
+            pd.DataFrame(chunk_scores, index=samples).to_csv(output, sep=separator, mode='a', header=False)
+
+    return write
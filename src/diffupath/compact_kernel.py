@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""Compact kernel storage, as reduced precision (float32) and/or symmetric packed kernels."""
+
+import logging
+from typing import Optional
+
+import numpy as np
+from diffupy.matrix import Matrix
+from scipy.linalg import blas
+
+from .sparse_kernel import SparseKernel
+
+log = logging.getLogger(__name__)
+
+#: Number of input columns above which packed products unpack row blocks instead of calling BLAS spmv per column
+SPMV_MAX_COLUMNS = 8
+
+
+class PackedKernel(Matrix):
+    """Symmetric kernel Matrix storing only its upper triangle, packed as in BLAS (column-major upper packing)."""
+
+    def __init__(
+        self,
+        mat,
+        rows_labels,
+        name: str = '',
+    ):
+        """Initialize the packed kernel.
+
+        :param mat: Packed upper triangle of the kernel, of length n * (n + 1) / 2.
+        :param rows_labels: Node labels, shared by rows and columns.
+        :param name: Name of the kernel.
+        """
+        self.rows_labels = list(rows_labels)
+        self.name = name
+        self.quadratic = True
+
+        n = len(self.rows_labels)
+        self.mat = np.asarray(mat)
+
+        if self.mat.shape != (n * (n + 1) // 2,):
+            raise ValueError(f'The packed kernel should have {n * (n + 1) // 2} entries for {n} nodes.')
+
+        self.get_labels = True
+        self.get_indices = False
+
+        # Offset of each column in the packed upper triangle
+        self._offsets = np.arange(n, dtype=np.int64) * np.arange(1, n + 1, dtype=np.int64) // 2
+
+        self.validate_labels()
+
+    def __copy__(self):
+        """Return a copy of the packed kernel."""
+        return PackedKernel(self.mat.copy(), rows_labels=self.rows_labels, name=self.name)
+
+    @property
+    def shape(self):
+        """Return the shape of the unpacked kernel."""
+        return len(self.rows_labels), len(self.rows_labels)
+
+    @property
+    def dtype(self):
+        """Return the dtype of the kernel values."""
+        return self.mat.dtype
+
+    def get_rows(self, start: int, stop: int) -> np.ndarray:
+        """Unpack a block of full kernel rows.
+
+        :param start: First row of the block.
+        :param stop: Row after the last row of the block.
+        """
+        stop = min(stop, self.shape[0])
+        offsets = self._offsets
+        rows = np.empty((max(stop - start, 0), self.shape[1]), dtype=self.dtype)
+
+        # Column-major upper packing: entry (i, j) with i <= j is stored at i + j * (j + 1) / 2, so the first i + 1
+        # entries of row i are contiguous, and the others are gathered from one offset per column
+        for row, i in enumerate(range(start, stop)):
+            rows[row, :i + 1] = self.mat[offsets[i]:offsets[i] + i + 1]
+            np.take(self.mat, offsets[i + 1:] + i, out=rows[row, i + 1:])
+
+        return rows
+
+    def to_dense(self, dtype=None) -> Matrix:
+        """Return the kernel as a dense Matrix.
+
+        :param dtype: Optional dtype of the dense kernel. By default the packed dtype.
+        """
+        return Matrix(
+            self.get_rows(0, self.shape[0]).astype(dtype or self.dtype, copy=False),
+            rows_labels=self.rows_labels,
+            quadratic=True,
+            name=self.name,
+        )
+
+    def dot(self, mat: np.ndarray, block_size: int = 256) -> np.ndarray:
+        """Multiply the kernel by a dense (nodes x columns) array.
+
+        Few columns use the symmetric packed BLAS product (spmv); wider arrays are multiplied by unpacked row blocks.
+
+        :param mat: Dense array with rows matching the kernel rows.
+        :param block_size: Number of rows unpacked at once for wide arrays.
+        """
+        mat = np.asarray(mat, dtype=self.dtype)
+        n = self.shape[0]
+
+        if mat.shape[1] <= SPMV_MAX_COLUMNS:
+            spmv = blas.get_blas_funcs('spmv', dtype=self.dtype)
+            return np.column_stack([spmv(n, 1., self.mat, mat[:, j]) for j in range(mat.shape[1])])
+
+        return np.concatenate([
+            np.matmul(self.get_rows(start, start + block_size), mat)
+            for start in range(0, n, block_size)
+        ])
+
+    def row_sums(self, block_size: int = 256):
+        """Return the kernel row sums and squared row sums.
+
+        :param block_size: Number of rows unpacked at once.
+        """
+        row_sums, row_sums_2 = [], []
+
+        for start in range(0, self.shape[0], block_size):
+            rows = self.get_rows(start, start + block_size).astype(float)
+            row_sums.append(np.sum(rows, axis=1))
+            row_sums_2.append(np.sum(rows ** 2, axis=1))
+
+        return np.concatenate(row_sums), np.concatenate(row_sums_2)
+
+
+def pack_kernel(kernel: Matrix, dtype=None) -> PackedKernel:
+    """Pack the upper triangle of a symmetric kernel.
+
+    :param kernel: Network as a dense symmetric kernel.
+    :param dtype: Optional dtype of the packed values. By default the kernel dtype.
+    """
+    mat = kernel.mat
+    n = mat.shape[0]
+
+    packed = np.empty(n * (n + 1) // 2, dtype=dtype or mat.dtype)
+
+    # Column j of the upper triangle (rows 0..j) equals row j of the lower triangle for symmetric kernels
+    for j in range(n):
+        offset = j * (j + 1) // 2
+        packed[offset:offset + j + 1] = mat[j, :j + 1]
+
+    return PackedKernel(packed, rows_labels=kernel.rows_labels, name=kernel.name)
+
+
+def compact_kernel(
+    kernel: Matrix,
+    dtype: Optional[str] = 'float32',
+    packed: bool = False,
+) -> Matrix:
+    """Return a compact version of a kernel, casting its values and/or packing its upper triangle.
+
+    :param kernel: Network as a kernel. Already packed or sparse kernels can only be cast.
+    :param dtype: Dtype of the kernel values (e.g. 'float32'). None keeps the kernel dtype.
+    :param packed: Flag to store only the upper triangle of the kernel, which must be symmetric.
+    """
+    if isinstance(kernel, PackedKernel):
+        if dtype is None:
+            return kernel
+        return PackedKernel(kernel.mat.astype(dtype), rows_labels=kernel.rows_labels, name=kernel.name)
+
+    if isinstance(kernel, SparseKernel):
+        if packed:
+            raise ValueError('Sparse kernels can not be packed.')
+        if dtype is None:
+            return kernel
+        return SparseKernel(kernel.mat.astype(dtype), rows_labels=kernel.rows_labels, name=kernel.name)
+
+    if packed:
+        if not is_symmetric(kernel.mat):
+            raise ValueError('Only symmetric kernels can be packed.')
+        return pack_kernel(kernel, dtype=dtype)
+
+    if dtype is None:
+        return kernel
+
+    return Matrix(
+        kernel.mat.astype(dtype),
+        rows_labels=kernel.rows_labels,
+        quadratic=True,
+        name=kernel.name,
+    )
+
+
+def is_symmetric(mat: np.ndarray, block_size: int = 256) -> bool:
+    """Check that a square matrix is symmetric, comparing its row blocks with its column blocks.
+
+    :param mat: Square matrix.
+    :param block_size: Number of rows compared at once.
+    """
+    return all(
+        np.allclose(mat[start:start + block_size], mat[:, start:start + block_size].T)
+        for start in range(0, mat.shape[0], block_size)
+    )
+
+
+def kernel_nbytes(kernel: Matrix) -> int:
+    """Return the memory used by the values of a kernel, whatever its representation.
+
+    :param kernel: Network as a kernel.
+    """
+    if hasattr(kernel.mat, 'nnz'):
+        return kernel.mat.data.nbytes + kernel.mat.indices.nbytes + kernel.mat.indptr.nbytes
+
+    return kernel.mat.nbytes
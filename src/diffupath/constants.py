@@ -36,6 +36,8 @@ ensure_output_dirs()
 BY_METHOD = 'method'
 BY_DB = 'database'
 LTOO = 'ltoo'
+LOO = 'loo'
+KFOLD = 'kfold'
 
 BY_ENTITY = 'entity'
 BY_ENTITY_METHOD = 'by_entity_method'
@@ -43,6 +45,8 @@ BY_ENTITY_DB = 'by_entity_db'
 
 EVALUATION_COMPARISONS = {
     LTOO,
+    LOO,
+    KFOLD,
     BY_METHOD,
     BY_DB,
     BY_ENTITY,
@@ -50,6 +54,10 @@ EVALUATION_COMPARISONS = {
     BY_ENTITY_DB
 }
 
+#: Baseline rankings of the validations
+RANDOM = 'random'
+PAGE_RANK = 'page_rank'
+
 # Rename DiffuPy methods
 DIFFUPY_METHODS = METHODS
 
@@ -108,12 +116,75 @@ DATABASE_LINKS = {
     'pathme_mirtarbase': '1qt_a0R_DpCEBGVXZMywKpr7sKEOShXB3',
 }
 
-PATHME_DRUGBANK = frozenset(['kegg', 'reactome', 'wikipathways'])
-PATHME_MIRTARBASE = frozenset(['kegg', 'reactome', 'wikipathways'])
 PATHME_DB = frozenset(['kegg', 'reactome', 'wikipathways'])
+PATHME_DRUGBANK = PATHME_DB.union(['drugbank'])
+PATHME_MIRTARBASE = PATHME_DB.union(['mirtarbase'])
 
 PATHME_MAPPING = {
     PATHME_DB: 'pathme',
     PATHME_DRUGBANK: 'pathme_drugbank',
     PATHME_MIRTARBASE: 'pathme_mirtarbase',
 }
+
+"""Entities in WikiPathways that required manual curation"""
+
+#: Biological processes captured as genes or abundances
+WIKIPATHWAYS_BIOL_PROCESS = {'lipid biosynthesis', 'hsc survival', 'glycolysis & gluconeogenesis',
+                             'triacylglyceride  synthesis', 'wnt canonical signaling',
+                             'regulation of actin skeleton', 'fatty acid metabolism',
+                             'mrna processing major splicing pathway', 'senescence', 'monocyte differentiation',
+                             'pentose phosphate pathway', 'ethanolamine  phosphate', 'hsc differentiation',
+                             'actin, stress fibers and adhesion', 'regulation of actin cytoskeleton',
+                             's-phase progression', 'g1-s transition', 'toll-like receptor signaling pathway',
+                             'regulation of  actin cytoskeleton', 'proteasome degradation', 'apoptosis',
+                             'bmp pathway', 'ampk activation', 'g1/s checkpoint arrest', 'mapk signaling pathway',
+                             'chromatin remodeling and  epigenetic modifications', 'wnt signaling pathway',
+                             'ros production', 'erbb signaling pathway', 'shh pathway', 'inflammation',
+                             'dna replication', 'mrna translation', 'oxidative stress',
+                             'cell cycle checkpoint activation', 'gi/go pathway', 'wnt pathway',
+                             'g1/s transition of mitotic cell cycle', 'modulation of estrogen receptor signalling',
+                             'dna repair', 'bmp canonical signaling', 'igf and insuline signaling',
+                             'unfolded protein response', 'cell death', 'p38/mapk  pathway', 'glycogen metabolism',
+                             'gnrh signal pathway',
+                             'the intra-s-phase checkpoint mediated arrest of cell cycle progression', 'tca cycle',
+                             'mtor protein kinase signaling pathway', 'proteasome  degradation pathway',
+                             'morphine metabolism', 'hsc aging', 'gastric pepsin release',
+                             'parietal cell production', 'prostaglandin pathway', 'cell cycle (g1/s)  progression',
+                             'notch pathway', 'g2/m progression', 'wnt signaling', 'cell adhesion',
+                             'cell cycle progression', 'egfr pathway', 'cell cycle', 'angiogenesis',
+                             'g2/m-phase checkpoint', 'hsc self renewal', '26s proteasome  degradation',
+                             'mapk signaling', 'immune system up or down regulation', 'm-phase progression',
+                             'insulin signaling', 'nf kappa b pathway', 'cell cycle  progression', 'gi pathway',
+                             'cd45+ hematopoietic-    derived cell    proliferation', "kreb's cycle",
+                             'glycogen synthesis', 'apoptosis pathway', 'g1/s progression',
+                             'inflammasome activation', 'melanin biosynthesis', 'proteasomal degradation',
+                             'g2/m checkpoint arrest', 'g1/s cell cycle transition', 'dna damage response',
+                             'gastric histamine release'}
+
+#: Metabolites with non-chemical namespaces
+WIKIPATHWAYS_METAB = {'2,8-dihydroxyadenine', '8,11-dihydroxy-delta-9-thc', 'adp-ribosyl', 'cocaethylene',
+                      'dhcer1p', 'ecgonidine', 'f2-isoprostane', 'fumonisins b1', 'iodine', 'l-glutamate',
+                      'lactosylceramide', 'methylecgonidine', 'n-acetyl-l-aspartate', 'nad+', 'nadph oxidase',
+                      'neuromelanin', 'nicotinic acid (na)', 'nmn', 'pip2', 'sphingomyelin', 'thf'}
+
+#: Names of duplicate entities
+WIKIPATHWAYS_NAME_NORMALIZATION = {"Ca 2+": "ca 2+", "acetyl coa": "acetyl-coa", "acetyl-coa(mit)": "acetyl-coa",
+                                   "h20": "h2o"}
+
+"""Entities in Reactome that required manual curation"""
+
+#: Entities in black list
+REACTOME_BLACK_LIST = {"5'"}
+
+#: Proteins coded as metabolites
+REACTOME_PROT = {'phospho-g2/m transition proteins', 'integrin alpha5beta1, integrin alphavbeta3, cd47',
+                 'food proteins', 'activated fgfr2', 'adherens junction-associated proteins',
+                 'pi3k mutants,activator:pi3k', 'prolyl 3-hydroxylases', 'gpi-anchored proteins', 'c3d, c3dg, ic3b',
+                 'c4s/c6s chains', 'activated fgfr1 mutants and fusions', 'activated fgfr3 mutants', 'protein',
+                 'cyclin a2:cdk2 phosphorylated g2/m transition protein', 'c4c, c3f', 'activated raf/ksr1',
+                 'activated fgfr1 mutants', 'g2/m transition proteins', 'lman family receptors', 'cyclin',
+                 'usp12:wdr48:wdr20,usp26', 'proteins with cleaved gpi-anchors', 'activated fgfr2 mutants',
+                 'c4d, ic3b', 'c5b:c6:c7, c8, c9', 'cyclin a1:cdk2 phosphorylated g2/m transition protein',
+                 'genetically or chemically inactive braf', 'il13-downregulated proteins',
+                 'activated fgfr4 mutants', 'rna-binding protein in rnp (ribonucleoprotein) complexes',
+                 'effector proteins', 'usp3, saga complex', 'dephosphorylated "receiver" raf/ksr1'}
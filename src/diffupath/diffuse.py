@@ -2,24 +2,44 @@
 
 """Command line interface."""
 
-import json
 import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional, Union, Callable, List
 
 import click
 import networkx as nx
-from diffupy.constants import EMOJI, RAW, CSV, JSON, GRAPH_FORMATS
+from diffupy.constants import EMOJI, RAW, ML, GM, Z, BER_S, MC, BER_P, CSV, GRAPH_FORMATS
 from diffupy.diffuse import diffuse
 from diffupy.kernels import regularised_laplacian_kernel
 from diffupy.matrix import Matrix
-from diffupy.process_input import process_map_and_format_input_data_for_diff
+from diffupy.process_input import process_input_data
 from diffupy.process_network import get_kernel_from_network_path, process_graph_from_file, filter_graph
+from diffupy.utils import get_label_list_graph
 from google_drive_downloader import GoogleDriveDownloader
 from pathme.export_utils import generate_universe
 from pybel.struct import get_subgraph_by_annotation_value
 
+from .cache import record_access, warm_artifacts
+from .compact_kernel import compact_kernel
 from .constants import *
-from .utils import get_or_create_dir, to_pickle, get_files_list, get_kernel_from_graph
+from .kernel_diffusion import (
+    concatenate_columns, diffuse_by_blocks, diffuse_by_method, diffuse_by_methods, get_input_codification,
+)
+from .kernel_build import get_node_types
+from .kernel_io import (
+    get_rows_end, is_kernel_file, prefer_kernel_file, read_kernel_file, read_kernel_header, read_label_index,
+)
+from .label_index import LabelIndex
+from .permutations import PERMUTATION_BATCH_SIZE, diffuse_by_permutations
+from .resources import AUTO, limit_blas_threads, plan_resources, write_run_report
+from .result_cache import (
+    RESULTS_CACHE_DIR, RESULTS_CACHE_SIZE, cache_results, get_cached_results, get_network_fingerprint, get_request_key,
+)
+from .results import (
+    EXTENSION_FORMATS, get_format, get_results_node_types, select_scores, write_scores, write_table,
+)
+from .utils import get_or_create_dir, to_pickle, get_kernel_from_graph
 
 logger = logging.getLogger(__name__)
 
@@ -30,12 +50,15 @@ GRAPH_PATH = os.path.join(DEFAULT_DIFFUPATH_DIR, 'graphs', 'universe',
 KERNELS_PATH = os.path.join(DEFAULT_DIFFUPATH_DIR, 'kernels')
 KERNEL_PATH = os.path.join(DEFAULT_DIFFUPATH_DIR, 'kernels', 'Homo_sapiens_kernel_regularized_pathme_universe.pickle')
 
+#: Number of row blocks of memory-mapped kernels paged in while the input is processed
+PAGE_IN_BLOCKS = 2
+
 
 def run_diffusion(
     input: str,
     network: Optional[str] = None,
     output: Optional[str] = None,
-    method: Union[str, Callable] = RAW,
+    method: Union[str, Callable, List[str]] = RAW,
     binarize: Optional[bool] = False,
     threshold: Optional[float] = None,
     absolute_value: Optional[bool] = False,
@@ -44,22 +67,60 @@ def run_diffusion(
     kernel_method: Optional[Callable] = regularised_laplacian_kernel,
     database: Optional[Union[List[str], str]] = None,
     filter_network_omic: Optional[List[str]] = None,
-    specie: Optional[str] = HSA
+    specie: Optional[str] = HSA,
+    kernel_dtype: Optional[str] = None,
+    packed_kernel: Optional[bool] = False,
+    block_size: Optional[int] = None,
+    n_permutations: Optional[int] = 10000,
+    workers: Union[int, str, None] = 1,
+    blas_threads: Union[int, str, None] = AUTO,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+    entity_types: Optional[List[str]] = None,
+    compression: Optional[str] = None,
+    cache: Optional[bool] = False,
+    cache_dir: Optional[str] = RESULTS_CACHE_DIR,
+    cache_size: Optional[int] = RESULTS_CACHE_SIZE,
+    pipeline: Optional[bool] = False,
 ):
     """Run a diffusion method for the provided input_scores over (by default) PathMeUniverse integrated network.
 
     :param input: Path or miscellaneous format data input to be processed/formatted.
-    :param network: Path to the network or the network Object, as a (NetworkX) graph or as a (diffuPy.Matrix) kernel. By default 'KERNEL_PATH', pointing to PathMeUniverse kernel
+    :param network: Path to the network or the network Object, as a (NetworkX) graph or as a (diffuPy.Matrix) kernel, either dense, sparse (SparseKernel) or packed (PackedKernel). By default 'KERNEL_PATH', pointing to PathMeUniverse kernel
     :param output: Path (with file name) for the generated scores output file. By default '$OUTPUT/diffusion_scores.csv'
-    :param method:  Elected method ["raw", "ml", "gm", "ber_s", "ber_p", "mc", "z"]. By default 'raw'
+    :param method:  Elected method ["raw", "ml", "gm", "ber_s", "ber_p", "mc", "z"], or a list of them to compute them
+     all from a shared kernel product, as one column per method. By default 'raw'
     :param binarize: If logFC provided in dataset, convert logFC to binary. By default False
     :param threshold: Codify node labels by applying a threshold to logFC in input. By default None
     :param absolute_value: Codify node labels by applying threshold to | logFC | in input. By default False
     :param p_value: Statistical significance. By default 0.05
+    :param format_output: Output format ["csv", "tsv", "json", "parquet", "feather", "npz", "h5"]. By default inferred
+     from the output extension for parquet, feather, npz and h5 outputs, CSV otherwise.
     :param kernel_method: Callable method for kernel computation.
     :param database: List (or a single database str) of selected network databases to construct/filter the network.
     :param filter_network_omic: List of omic network databases to filter the network.
     :param specie: Specie id name to retrieve network and perform diffusion on.
+    :param kernel_dtype: Optional dtype to store and multiply the kernel with (e.g. 'float32').
+    :param packed_kernel: Flag to store the (symmetric) kernel as its packed upper triangle.
+    :param block_size: Number of kernel rows diffused at once. If given, kernel files (.dpk) are memory-mapped and the
+     output rows are written as they are computed, bounding the memory used by the kernel to the block size.
+    :param n_permutations: Number of input permutations of the Monte Carlo methods ("mc" and "ber_p").
+    :param workers: Number of worker processes the permutations are sharded over, or "auto" to split the cores between
+     workers and BLAS threads from the kernel size.
+    :param blas_threads: Number of BLAS threads of each worker, or "auto" for the cores left by the workers. The split
+     is recorded in a run report next to the output ('<output>.run.json').
+    :param top_k: Output only the top-k scoring nodes of each scores column.
+    :param score_threshold: Output only the nodes scoring above the threshold.
+    :param entity_types: Output only the nodes of the given entity types (genes, mirna, metabolites or bps), for kernel
+     files and graphs whose node types are known.
+    :param compression: Optional compression of the output (e.g. 'zstd' for parquet or 'gzip' for CSV).
+    :param cache: Flag to reuse the scores of identical requests (same network, input, methods and input processing),
+     stored in the results cache, and to store the scores otherwise. Streamed block outputs are not cached.
+    :param cache_dir: Directory of the results cache.
+    :param cache_size: Disk budget of the results cache in bytes, beyond which the least recently used results are
+     evicted.
+    :param pipeline: Flag to load the kernel (paging in memory-mapped kernels) on a background thread while the input
+     is processed and, for kernel files, mapped to the kernel labels of their header.
     """
     click.secho(f'{EMOJI} Loading network {EMOJI}')
 
@@ -84,6 +145,234 @@ def run_diffusion(
             network = KERNEL_PATH
 
     if isinstance(network, str):
+        network = prefer_kernel_file(network)
+        record_access(network)
+
+    kernel_params = (database, filter_network_omic, kernel_method, block_size, kernel_dtype, packed_kernel)
+
+    # Pipelined, the kernel is loaded on a background thread while the input is processed. With the results cache, the
+    # loading only starts once the cache is missed, so that hits do not load the kernel
+    kernel_future = _submit_kernel(network, *kernel_params) if pipeline and not cache else None
+
+    methods = [method] if isinstance(method, str) or callable(method) else list(method)
+
+    click.secho(f'{EMOJI} Processing data input from {input}. {EMOJI}')
+
+    # Input is processed once per codification, shared by the methods requiring it
+    processed_inputs = {
+        codification: process_input_data(input,
+                                         codification,
+                                         binarize,
+                                         absolute_value,
+                                         p_value,
+                                         threshold,
+                                         )
+        for codification in dict.fromkeys(get_input_codification(method) for method in methods)
+    }
+
+    select_output = top_k is not None or score_threshold is not None or bool(entity_types)
+
+    results, kernel = None, None
+
+    if cache:
+        cache_key = get_request_key(
+            get_network_fingerprint(
+                network,
+                database=database,
+                filter_network_omic=filter_network_omic,
+                kernel_method=kernel_method,
+            ),
+            processed_inputs,
+            methods=methods,
+            binarize=binarize,
+            threshold=threshold,
+            absolute_value=absolute_value,
+            p_value=p_value,
+            kernel_dtype=kernel_dtype,
+            packed_kernel=packed_kernel,
+            n_permutations=n_permutations if {MC, BER_P}.intersection(methods) else None,
+        )
+        results = get_cached_results(cache_key, cache_dir)
+
+    if results is not None:
+        click.secho(f'{EMOJI} Diffusion scores loaded from the results cache.{EMOJI}\n')
+    else:
+        start = time.time()
+
+        if kernel_future is None:
+            kernel_future = _submit_kernel(network, *kernel_params, background=pipeline)
+
+        # Kernel files store their label index in their header, so the input is mapped while the kernel is loading.
+        # Otherwise it is built from the kernel labels
+        if is_kernel_file(network):
+            label_index = read_label_index(network)
+        else:
+            network, kernel = kernel_future.result()
+            label_index = LabelIndex.from_kernel(kernel)
+
+        input_scores_by_codification = {}
+
+        for codification, processed_input in processed_inputs.items():
+            for col_label, col_report in label_index.mapping_report(processed_input).items():
+                click.secho(
+                    f'{EMOJI} {col_label}: {col_report["mapped"]} of {col_report["total"]} input labels mapped. {EMOJI}'
+                )
+                logger.debug(f'Unmapped {col_label} labels: {col_report["unmapped"]}')
+
+            input_scores_by_codification[codification] = label_index.format_input(processed_input)
+
+        network, kernel = kernel_future.result()
+
+        click.secho(f'{EMOJI} Computing the diffusion algorithm. {EMOJI}')
+
+        # The workers of the Monte Carlo methods and their BLAS threads share the cores, without oversubscribing them
+        permutation_batches = -(-n_permutations // PERMUTATION_BATCH_SIZE) if {MC, BER_P}.intersection(methods) else 1
+        resources = plan_resources(workers, blas_threads, n_nodes=len(kernel.rows_labels), n_tasks=permutation_batches)
+        logger.info(f'{resources.workers} workers with {resources.blas_threads} BLAS threads each.')
+
+        with limit_blas_threads(resources.blas_threads):
+            input_scores_dict = input_scores_by_codification[get_input_codification(methods[0])]
+
+            if len(methods) > 1:
+                results = concatenate_columns([
+                    diffuse_by_methods(
+                        input_scores,
+                        [method for method in methods if get_input_codification(method) == codification],
+                        kernel,
+                        n_permutations=n_permutations,
+                        workers=resources.workers,
+                        blas_threads=resources.blas_threads,
+                    )
+                    for codification, input_scores in input_scores_by_codification.items()
+                ])
+
+            elif block_size and methods[0] in {RAW, Z, ML}:
+                block_output = output and not select_output and _is_block_output(output, format_output)
+
+                results = diffuse_by_blocks(
+                    input_scores_dict,
+                    methods[0],
+                    kernel,
+                    block_size=block_size,
+                    output=output if block_output else None,
+                )
+
+                if isinstance(results, str):
+                    write_run_report(output, resources, methods=methods, seconds=time.time() - start)
+                    click.secho(f'{EMOJI} Diffusion performed with success. Output located at {output} {EMOJI}\n')
+                    return
+
+            elif methods[0] in {RAW, Z, ML}:
+                results = diffuse_by_method(input_scores_dict, methods[0], kernel)
+
+            elif methods[0] in {MC, BER_P}:
+                results = diffuse_by_permutations(
+                    input_scores_dict,
+                    methods[0],
+                    kernel,
+                    n_permutations=n_permutations,
+                    workers=resources.workers,
+                    blas_threads=resources.blas_threads,
+                )
+
+            elif methods[0] in {GM, BER_S}:
+                results = diffuse_by_methods(input_scores_dict, methods, kernel)
+
+            else:
+                results = diffuse(
+                    input_scores_dict,
+                    methods[0],
+                    k=kernel
+                )
+
+        click.secho(f'{EMOJI} Diffusion performed with success.{EMOJI}\n')
+
+        if output:
+            write_run_report(output, resources, methods=methods, seconds=time.time() - start)
+
+        if cache and isinstance(results, Matrix):
+            cache_results(cache_key, results, cache_dir, max_size=cache_size, build_seconds=time.time() - start)
+
+    if select_output:
+        node_types = _get_node_types(network, results, kernel) if entity_types else None
+
+        results = select_scores(results, top_k, score_threshold, node_types=node_types, entity_types=entity_types)
+
+        if not output:
+            return results
+
+        write_table(results, output, output_format=_get_output_format(output, format_output), compression=compression)
+        click.secho(f'{EMOJI} {len(results)} selected scores located at {output} {EMOJI}\n')
+        return
+
+    if not output:
+        return results
+
+    write_scores(results, output, output_format=_get_output_format(output, format_output), compression=compression)
+
+    click.secho(f'{EMOJI} Output located at {output} {EMOJI}\n')
+
+
+"""Helper functions"""
+
+
+def _is_block_output(output: str, format_output: Optional[str] = None) -> bool:
+    """Return whether the output rows can be written as they are computed by blocks (.npy and CSV outputs)."""
+    return (format_output or get_format(output, formats={'npy'})) in {'npy', CSV}
+
+
+def _get_output_format(output: str, format_output: Optional[str] = None) -> str:
+    """Return the format of an output: the requested one, or the one of its extension for binary formats, else CSV."""
+    return format_output or get_format(output, formats=EXTENSION_FORMATS)
+
+
+def _get_stored_kernel(path: str) -> Optional[str]:
+    """Return a kernel of the kernel store, preferring its kernel file (.dpk), if it has been built or downloaded."""
+    path = prefer_kernel_file(path)
+
+    return path if os.path.isfile(path) else None
+
+
+def _submit_kernel(network, *kernel_params, background: bool = True) -> Future:
+    """Load the kernel of a network on a background thread, or in the current one, returning a future of it."""
+    if not background:
+        future = Future()
+        future.set_result(_load_kernel(network, *kernel_params))
+        return future
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='diffupath-kernel')
+    future = executor.submit(_load_kernel, network, *kernel_params, page_in=True)
+    executor.shutdown(wait=False)
+
+    return future
+
+
+def _load_kernel(
+    network,
+    database: Optional[Union[List[str], str]],
+    filter_network_omic: Optional[List[str]],
+    kernel_method: Callable,
+    block_size: Optional[int] = None,
+    kernel_dtype: Optional[str] = None,
+    packed_kernel: Optional[bool] = False,
+    page_in: bool = False,
+) -> tuple:
+    """Return the (filtered) network and its kernel, loaded from kernel files, network files, graphs or kernels.
+
+    The first row blocks of memory-mapped kernel files are paged in if page_in is set, e.g. while the input is
+    processed.
+    """
+    if is_kernel_file(network):
+        click.secho(f'{EMOJI}Loading from {network} {EMOJI}')
+
+        kernel = read_kernel_file(network, mmap=bool(block_size))
+
+        # Only the first row blocks are paged in: the kernel may not fit in memory, and the next blocks are read while
+        # the first ones are diffused
+        if block_size and page_in:
+            warm_artifacts([network], max_bytes=get_rows_end(network, PAGE_IN_BLOCKS * block_size))
+
+    elif isinstance(network, str):
         click.secho(f'{EMOJI}Loading from {network} {EMOJI}')
 
         kernel = get_kernel_from_network_path(network, False,
@@ -93,48 +382,38 @@ def run_diffusion(
 
     elif isinstance(network, Matrix):
         kernel = network
+
+    elif isinstance(network, nx.Graph):
+        network = filter_graph(network, database, filter_network_omic)
+        kernel = get_kernel_from_graph(network, kernel_method)
+
     else:
         raise IOError(
             f'{EMOJI} The selected network format is not valid neither as a graph or as a kernel. Please ensure you use one of the following formats: '
             f'{GRAPH_FORMATS}'
         )
 
-    if isinstance(network, Matrix):
-        kernel = network
-    if isinstance(network, nx.Graph):
-        kernel = get_kernel_from_graph(filter_graph(network, database, filter_network_omic), kernel_method)
-
-    click.secho(f'{EMOJI} Processing data input from {input}. {EMOJI}')
+    if kernel_dtype or packed_kernel:
+        kernel = compact_kernel(kernel, dtype=kernel_dtype, packed=packed_kernel)
 
-    input_scores_dict = process_map_and_format_input_data_for_diff(input,
-                                                                   kernel,
-                                                                   method,
-                                                                   binarize,
-                                                                   absolute_value,
-                                                                   p_value,
-                                                                   threshold,
-                                                                   )
-
-    click.secho(f'{EMOJI} Computing the diffusion algorithm. {EMOJI}')
-
-    results = diffuse(
-        input_scores_dict,
-        method,
-        k=kernel
-    )
+    return network, kernel
 
-    click.secho(f'{EMOJI} Diffusion performed with success.{EMOJI}\n')
 
-    if not format_output and not output:
-        return results
-
-    elif format_output == CSV or output:
-        results.as_csv(output)
+def _get_node_types(network, results: Matrix, kernel: Optional[Matrix] = None) -> List[Optional[str]]:
+    """Return the entity types of the results rows, stored in kernel file headers or derived from graphs."""
+    if is_kernel_file(network):
+        header = read_kernel_header(network)
+        node_types, rows_labels = header.get('node_types'), header['rows_labels']
+    elif isinstance(network, nx.Graph):
+        node_types = get_node_types(network)
+        rows_labels = kernel.rows_labels if kernel is not None else get_label_list_graph(network, 'name')
+    else:
+        node_types = None
 
-    elif format_output == JSON:
-        json.dump(results, output, indent=2)
+    if node_types is None:
+        raise ValueError('Entity types are only known for kernel files and graphs, the results cannot be restricted.')
 
-    click.secho(f'{EMOJI} utput located at {output} {EMOJI}\n')
+    return get_results_node_types(results, rows_labels, node_types)
 
 
 """Pipeline for process/generate network either by given specie, database or enntity-type/omic."""
@@ -144,21 +423,19 @@ def _process_network_specie(specie: str) -> str:
     """Process network by specie."""
     click.secho(
         f'{EMOJI} Loading and processing specie {specie} network for KEGG, Reactome and WP. {EMOJI}')
-    files = get_files_list(path=os.path.join(KERNELS_PATH))
 
-    kernel_file = f'{specie}_kernel_regularized_pathme_universe.pickle'
+    kernel_path = _get_stored_kernel(
+        os.path.join(KERNELS_PATH, f'{specie}_kernel_regularized_pathme_universe.pickle')
+    )
 
-    if kernel_file in files:
-        network = os.path.join(KERNELS_PATH, kernel_file)
+    if kernel_path:
+        network = kernel_path
     else:
-        files = get_files_list(path=GRAPHS_PATH)
-        graph_file = f'{specie}_pathme_universe.pickle'
+        network = os.path.join(GRAPHS_PATH, f'{specie}_pathme_universe.pickle')
 
-        if graph_file not in files:
+        if not os.path.isfile(network):
             generate_universe(specie=specie)
 
-        network = os.path.join(GRAPHS_PATH, graph_file)
-
     return network
 
 
@@ -239,6 +516,10 @@ def _pipeline_network_multiple_database(database: List[str], kernel_method: Call
                 network = os.path.join(DEFAULT_DIFFUPATH_DIR, 'kernels', 'by_db', f'{db_norm}.pickle')
                 break
 
+        # Kernels prebuilt in the kernel store (see :mod:`diffupath.kernel_build`)
+        if not network:
+            network = _get_stored_kernel(os.path.join(DEFAULT_DIFFUPATH_DIR, 'kernels', 'by_db', f'{db_norm}.pickle'))
+
         if not network:
             network = os.path.join(DEFAULT_DIFFUPATH_DIR, 'kernels', 'by_db', f'{db_norm}.pickle')
             GoogleDriveDownloader.download_file_from_google_drive(file_id=DATABASE_LINKS[db_norm],
@@ -246,10 +527,7 @@ def _pipeline_network_multiple_database(database: List[str], kernel_method: Call
                                                                   unzip=True)
     else:
         intersecc_db = db_norm.intersection(PATHME_DB)
-        intersecc_db_str = ''
-
-        for db_name in intersecc_db:
-            intersecc_db_str += f'_{db_name}'
+        intersecc_db_str = ''.join(f'_{db_name}' for db_name in sorted(intersecc_db))
 
         if intersecc_db:
 
@@ -257,7 +535,7 @@ def _pipeline_network_multiple_database(database: List[str], kernel_method: Call
             kernels_files_list = get_or_create_dir(kernels_db_path)
 
             for kernel_file in kernels_files_list:
-                if intersecc_db_str == kernel_file:
+                if intersecc_db_str == os.path.splitext(kernel_file)[0]:
                     network = os.path.join(DEFAULT_DIFFUPATH_DIR, 'kernels', 'by_db',
                                            f'{intersecc_db_str}.pickle')
                     break
@@ -288,7 +566,7 @@ def _pipeline_network_multiple_database(database: List[str], kernel_method: Call
                         click.secho(f'{EMOJI}Kernel generated {EMOJI}')
 
                         to_pickle(network, os.path.join(DEFAULT_DIFFUPATH_DIR, 'kernels', 'by_db',
-                                                        f'{db_norm}.pickle'))
+                                                        f'{intersecc_db_str}.pickle'))
 
         else:
             raise ValueError(
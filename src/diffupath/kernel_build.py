@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+"""Parallel prebuild of the kernels of the kernel store, within a memory budget."""
+
+import inspect
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import networkx as nx
+from diffupy.kernels import regularised_laplacian_kernel
+from diffupy.process_network import process_graph_from_file
+from pybel import BELGraph
+from pybel.constants import ABUNDANCE, BIOPROCESS, GENE, MIRNA, PROTEIN, RNA
+from pybel.struct.mutation.induction.annotations import get_subgraph_by_annotation_value
+
+from .constants import PATHME_DB, PATHME_MAPPING
+from .kernel_io import KERNEL_FILE_EXTENSION, write_kernel_file_atomically
+from .utils import get_kernel_from_graph
+
+log = logging.getLogger(__name__)
+
+#: Entity types of the BEL node functions, as grouped in the PathMe processing
+BEL_NODE_TYPES = {
+    GENE: 'genes',
+    RNA: 'genes',
+    PROTEIN: 'genes',
+    MIRNA: 'mirna',
+    ABUNDANCE: 'metabolites',
+    BIOPROCESS: 'bps',
+}
+
+#: Estimated number of dense (nodes x nodes) float64 matrices held at once while computing a kernel
+KERNEL_BUILD_MEMORY_FACTOR = 4
+
+
+class KernelBuildJob(NamedTuple):
+    """Kernel to be built from a graph."""
+
+    #: Name of the kernel
+    name: str
+    #: Graph the kernel is computed on
+    graph: nx.Graph
+    #: Output path of the kernel file
+    output: str
+    #: Databases the graph covers
+    databases: List[str]
+
+    @property
+    def memory(self) -> int:
+        """Return the estimated peak memory (in bytes) of the kernel computation."""
+        return estimate_kernel_memory(self.graph.number_of_nodes())
+
+
+class KernelBuildReport(NamedTuple):
+    """Outcome of a kernel build."""
+
+    #: Name of the kernel
+    name: str
+    #: Output path of the kernel file
+    output: str
+    #: Number of nodes of the kernel
+    n_nodes: int
+    #: Time spent computing and writing the kernel
+    build_seconds: float
+
+
+def estimate_kernel_memory(n_nodes: int) -> int:
+    """Return the estimated peak memory (in bytes) needed to compute a dense kernel.
+
+    :param n_nodes: Number of nodes of the graph.
+    """
+    return KERNEL_BUILD_MEMORY_FACTOR * 8 * n_nodes ** 2
+
+
+def get_database_kernel_name(databases: Iterable[str]) -> str:
+    """Return the kernel store name of a database (or a combination of databases), as used in the diffusion pipeline.
+
+    :param databases: Database names.
+    """
+    databases = frozenset(database.lower().replace(' ', '_') for database in databases)
+
+    # Combinations with a name of their own (e.g. the whole PathMe) are stored under it
+    if databases in PATHME_MAPPING:
+        return PATHME_MAPPING[databases]
+
+    if len(databases) == 1:
+        return next(iter(databases))
+
+    return ''.join(f'_{database}' for database in sorted(databases))
+
+
+def plan_kernel_builds(
+    graph_path: str,
+    kernels_dir: str,
+    databases: Optional[List[List[str]]] = None,
+    species: Optional[List[str]] = None,
+    graphs_dir: Optional[str] = None,
+    overwrite: bool = False,
+) -> List[KernelBuildJob]:
+    """Plan the kernels to be built for the requested databases (and combinations) and species.
+
+    :param graph_path: Path to the universe graph, annotated by database.
+    :param kernels_dir: Kernel store directory.
+    :param databases: List of databases combinations (each one a list of database names). By default every single
+     PathMe database.
+    :param species: Optional list of species, whose universe graphs are looked up in the graphs directory.
+    :param graphs_dir: Directory with the species universe graphs.
+    :param overwrite: Flag to rebuild kernels already in the store.
+    """
+    if databases is None:
+        databases = [[database] for database in sorted(PATHME_DB)]
+
+    jobs = []
+
+    if databases:
+        graph = process_graph_from_file(graph_path)
+
+        for combination in databases:
+            name = get_database_kernel_name(combination)
+
+            jobs.append(KernelBuildJob(
+                name=name,
+                graph=get_subgraph_by_annotation_value(graph, 'database', set(combination)),
+                output=os.path.join(kernels_dir, 'by_db', f'{name}{KERNEL_FILE_EXTENSION}'),
+                databases=sorted(combination),
+            ))
+
+    for specie in species or []:
+        specie_graph_path = os.path.join(graphs_dir, f'{specie}_pathme_universe.pickle')
+
+        if not os.path.isfile(specie_graph_path):
+            log.warning(f'No universe graph found for {specie} in {graphs_dir}, its kernel is not built.')
+            continue
+
+        jobs.append(KernelBuildJob(
+            name=specie,
+            graph=process_graph_from_file(specie_graph_path),
+            output=os.path.join(kernels_dir, f'{specie}_kernel_regularized_pathme_universe{KERNEL_FILE_EXTENSION}'),
+            databases=sorted(PATHME_DB),
+        ))
+
+    if overwrite:
+        return jobs
+
+    return [job for job in jobs if not os.path.isfile(job.output)]
+
+
+def build_kernels(
+    jobs: List[KernelBuildJob],
+    kernel_method: Callable = regularised_laplacian_kernel,
+    workers: Optional[int] = None,
+    memory_budget: Optional[int] = None,
+    kernel_dtype: Optional[str] = None,
+) -> List[KernelBuildReport]:
+    """Build kernels in parallel worker processes, never running at once jobs whose estimated memory exceeds the budget.
+
+    Jobs are started from the largest to the smallest. A job exceeding the budget on its own is run alone.
+
+    :param jobs: Kernels to build.
+    :param kernel_method: Callable method for kernel computation.
+    :param workers: Maximum number of worker processes. By default the number of CPUs.
+    :param memory_budget: Optional memory budget (in bytes) shared by the running jobs.
+    :param kernel_dtype: Optional dtype to store the kernels with (e.g. 'float32').
+    """
+    workers = workers or os.cpu_count() or 1
+
+    pending = sorted(jobs, key=lambda job: job.memory, reverse=True)
+    running, reports = {}, []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            used_memory = sum(job.memory for job in running.values())
+
+            for job in list(pending):
+                if len(running) >= workers:
+                    break
+
+                if running and memory_budget is not None and used_memory + job.memory > memory_budget:
+                    continue
+
+                if memory_budget is not None and job.memory > memory_budget:
+                    log.warning(f'Kernel {job.name} is estimated to exceed the memory budget, it is built alone.')
+
+                running[executor.submit(build_kernel, job, kernel_method, kernel_dtype)] = job
+                pending.remove(job)
+                used_memory += job.memory
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                running.pop(future)
+                report = future.result()
+                reports.append(report)
+
+                log.info(f'Kernel {report.name} ({report.n_nodes} nodes) built in {report.build_seconds:.1f}s.')
+
+    return reports
+
+
+def build_kernel(
+    job: KernelBuildJob,
+    kernel_method: Callable = regularised_laplacian_kernel,
+    kernel_dtype: Optional[str] = None,
+) -> KernelBuildReport:
+    """Build a kernel and write it atomically to the kernel store.
+
+    :param job: Kernel to build.
+    :param kernel_method: Callable method for kernel computation.
+    :param kernel_dtype: Optional dtype to store the kernel with (e.g. 'float32').
+    """
+    start = time.time()
+
+    kernel = get_kernel_from_graph(job.graph, kernel_method, dtype=kernel_dtype)
+    kernel.name = job.name
+
+    build_seconds = time.time() - start
+
+    write_kernel_file_atomically(
+        kernel,
+        job.output,
+        node_types=get_node_types(job.graph),
+        databases=job.databases,
+        kernel_method=kernel_method.__name__,
+        kernel_params=get_kernel_params(kernel_method),
+        metadata={'build_seconds': build_seconds},
+    )
+
+    return KernelBuildReport(job.name, job.output, len(kernel.rows_labels), time.time() - start)
+
+
+def get_node_types(graph: nx.Graph) -> List[Optional[str]]:
+    """Return the entity type of each node, in the order of the kernel rows.
+
+    BEL nodes are typed by their function, grouped as in :mod:`diffupath.pathme_processing` (genes, mirna,
+    metabolites and bps). Other graphs use the 'type' node attribute, when present.
+
+    :param graph: Network as a graph.
+    """
+    if isinstance(graph, BELGraph):
+        return [BEL_NODE_TYPES.get(node.function, node.function.lower()) for node in graph]
+
+    return [data.get('type') for _, data in graph.nodes(data=True)]
+
+
+def get_kernel_params(kernel_method: Callable) -> Dict[str, Any]:
+    """Return the (default) parameters of a kernel method, besides the graph.
+
+    :param kernel_method: Callable method for kernel computation.
+    """
+    return {
+        name: parameter.default
+        for name, parameter in inspect.signature(kernel_method).parameters.items()
+        if parameter.default is not inspect.Parameter.empty
+    }
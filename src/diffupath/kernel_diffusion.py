@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+
+"""Kernel product utilities shared by the diffusion and validation pipelines."""
+
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from diffupy.constants import BER_P, BER_S, GM, MC, ML, RAW, Z
+from diffupy.matrix import Matrix
+from scipy import sparse, stats
+from sklearn import metrics
+
+from .compact_kernel import PackedKernel
+
+log = logging.getLogger(__name__)
+
+"""Kernel products"""
+
+
+def kernel_product(kernel: Matrix, mat: np.ndarray) -> np.ndarray:
+    """Multiply the kernel by a dense (nodes x columns) score matrix, whatever the kernel representation.
+
+    :param kernel: Network as a kernel (dense, sparse or packed).
+    :param mat: Input scores array, with rows matching the kernel rows.
+    """
+    if isinstance(kernel, PackedKernel):
+        return kernel.dot(mat)
+
+    if sparse.issparse(kernel.mat):
+        return np.asarray(kernel.mat @ mat)
+
+    return np.matmul(kernel.mat, mat)
+
+
+def kernel_row_sums(kernel: Matrix) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the kernel row sums and squared row sums needed for the z-score normalization.
+
+    :param kernel: Network as a kernel (dense, sparse or packed).
+    """
+    if isinstance(kernel, PackedKernel):
+        row_sums, row_sums_2 = kernel.row_sums()
+
+        # Rounded as in diffupy, so that z-scores match the reference implementation
+        return np.round(row_sums, 2), row_sums_2
+
+    return _get_row_sums(kernel.mat)
+
+
+def kernel_diagonal(kernel: Matrix) -> np.ndarray:
+    """Return the diagonal of a kernel, i.e. the contribution of each node input to its own score.
+
+    :param kernel: Network as a kernel (dense, sparse, packed or memory-mapped).
+    """
+    if isinstance(kernel, PackedKernel):
+        nodes = np.arange(kernel.shape[0])
+
+        # Column-major upper packing: diagonal entry (j, j) is stored at j + j * (j + 1) / 2
+        return np.asarray(kernel.mat[nodes + nodes * (nodes + 1) // 2], dtype=float)
+
+    return np.asarray(kernel.mat.diagonal(), dtype=float)
+
+
+def kernel_row_block(kernel: Matrix, start: int, stop: int):
+    """Return a block of kernel rows, as a dense array (or a CSR matrix for sparse kernels).
+
+    For memory-mapped kernels, only the rows of the block are read from disk.
+
+    :param kernel: Network as a kernel (dense, sparse, packed or memory-mapped).
+    :param start: First row of the block.
+    :param stop: Row after the last row of the block.
+    """
+    if isinstance(kernel, PackedKernel):
+        return kernel.get_rows(start, stop)
+
+    return kernel.mat[start:stop]
+
+
+def z_normalize(
+    raw_scores: np.ndarray,
+    input_scores: np.ndarray,
+    row_sums: np.ndarray,
+    row_sums_2: np.ndarray,
+) -> np.ndarray:
+    """Normalize raw diffusion scores as z-scores, for all the input columns at once.
+
+    :param raw_scores: Raw diffusion scores (nodes x columns).
+    :param input_scores: Input scores the raw scores stem from (nodes x columns).
+    :param row_sums: Kernel row sums.
+    :param row_sums_2: Kernel squared row sums.
+    """
+    n = input_scores.shape[0]
+
+    # Means and variances depend on the first and second moments of each input column
+    s1 = np.sum(input_scores, axis=0)
+    s2 = np.sum(input_scores ** 2, axis=0)
+
+    const_mean = row_sums / n
+    const_var = np.subtract(n * row_sums_2, row_sums ** 2) / ((n - 1) * (n ** 2))
+
+    score_means = np.outer(const_mean, s1)
+    score_vars = np.outer(const_var, n * s2 - s1 ** 2)
+
+    return np.subtract(raw_scores, score_means) / np.sqrt(score_vars)
+
+
+"""Diffusion over kernels"""
+
+
+def diffuse_on_kernel(
+    scores: Matrix,
+    kernel: Matrix,
+    z: bool = False,
+    row_sums: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Matrix:
+    """Compute raw (or z-normalized) diffusion scores over a precomputed kernel, either dense, sparse or packed.
+
+    :param scores: Input scores as a Matrix.
+    :param kernel: Network as a kernel.
+    :param z: Flag to compute z-scores instead of raw scores.
+    :param row_sums: Optional precomputed kernel row sums and squared row sums (see :func:`kernel_row_sums`).
+    """
+    scores = scores.match_rows(kernel)
+    input_mat = np.asarray(scores.mat, dtype=float)
+
+    diffused = kernel_product(kernel, input_mat)
+    log.info('Matrix product for raw scores performed.')
+
+    if z:
+        diffused = z_normalize(diffused, input_mat, *(row_sums or kernel_row_sums(kernel)))
+
+    return Matrix(
+        diffused,
+        rows_labels=scores.rows_labels,
+        cols_labels=_get_output_cols_labels(scores),
+        name=scores.name,
+    )
+
+
+def diffuse_by_method(
+    scores: Matrix,
+    method: str,
+    kernel: Matrix,
+) -> Matrix:
+    """Run a kernel-based diffusion method that only requires the kernel product.
+
+    :param scores: Input scores as a Matrix.
+    :param method: Elected method ["raw", "ml", "z"].
+    :param kernel: Network as a kernel.
+    """
+    if method == RAW:
+        return diffuse_on_kernel(scores, kernel)
+
+    elif method == Z:
+        return diffuse_on_kernel(scores, kernel, z=True)
+
+    elif method == ML:
+        return diffuse_on_kernel(_to_ml_labels(scores), kernel)
+
+    raise ValueError(f'Method not supported for kernel-level diffusion: {method}')
+
+
+def diffuse_by_methods(
+    scores: Matrix,
+    methods: List[str],
+    kernel: Matrix,
+    n_permutations: int = 10000,
+    workers: Optional[int] = 1,
+    seed: Optional[int] = None,
+    row_sums: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    blas_threads: Optional[int] = None,
+) -> Matrix:
+    """Run several kernel-based diffusion methods on the same input, sharing a single (stacked) kernel product.
+
+    Every method is a cheap transform of the products of the kernel with the input and with its zero indicator:
+
+    - raw: K·y
+    - ml, gm: K·y - K·[y == 0], the zeros being codified as -1 (the gm bias vanishes, inputs covering all the nodes)
+    - z: raw scores normalized by the kernel row sums
+    - ber_s: raw scores divided by the (non-negative) input scores + 1
+    - mc, ber_p: raw scores compared with those of permuted inputs (see :mod:`diffupath.permutations`)
+
+    :param scores: Input scores as a Matrix.
+    :param methods: Elected methods among ["raw", "ml", "gm", "z", "ber_s", "mc", "ber_p"].
+    :param kernel: Network as a kernel.
+    :param n_permutations: Number of input permutations of the Monte Carlo methods.
+    :param workers: Number of worker processes the permutations are sharded over.
+    :param seed: Seed of the permutations.
+    :param row_sums: Optional precomputed kernel row sums and squared row sums (see :func:`kernel_row_sums`).
+    :param blas_threads: Optional number of BLAS threads of each permutation worker.
+    :return: Scores with a column per method (or per input column and method, as 'column_method').
+    """
+    unsupported = set(methods) - {RAW, ML, GM, Z, BER_S, MC, BER_P}
+    if unsupported:
+        raise ValueError(f'Methods not supported for kernel-level diffusion: {unsupported}')
+
+    scores = scores.match_rows(kernel)
+    input_mat = np.asarray(scores.mat, dtype=float)
+    n_cols = input_mat.shape[1]
+
+    binary = {ML, GM}.intersection(methods)
+    if binary and not np.isin(input_mat, [-1, 0, 1]).all():
+        raise ValueError('Input scores must be binary.')
+
+    # Input and zero indicator columns stacked, so that the kernel is traversed once
+    stacked = np.hstack([input_mat, input_mat == 0]) if binary else input_mat
+    products = kernel_product(kernel, stacked)
+    raw = products[:, :n_cols]
+
+    if MC in methods or BER_P in methods:
+        from .permutations import permutation_test
+
+        p_values = permutation_test(
+            input_mat, kernel, n_permutations=n_permutations, workers=workers, seed=seed, blas_threads=blas_threads,
+        ).p_values
+
+    diffused = {}
+
+    for method in methods:
+        if method == RAW:
+            diffused[method] = raw
+        elif method in binary:
+            diffused[method] = raw - products[:, n_cols:]
+        elif method == Z:
+            diffused[method] = z_normalize(raw, input_mat, *(row_sums or kernel_row_sums(kernel)))
+        elif method == BER_S:
+            diffused[method] = raw / (np.maximum(input_mat, 0) + 1)
+        elif method == MC:
+            diffused[method] = 1 - p_values
+        elif method == BER_P:
+            diffused[method] = raw * -np.log10(p_values)
+
+    if n_cols == 1:
+        cols_labels = list(diffused)
+    else:
+        cols_labels = [f'{col_label}_{method}' for method in diffused for col_label in scores.cols_labels]
+
+    return Matrix(
+        np.hstack(list(diffused.values())),
+        rows_labels=scores.rows_labels,
+        cols_labels=cols_labels,
+        name=scores.name,
+    )
+
+
+def get_input_codification(method: str) -> str:
+    """Return the input codification of a method: binary for ml and gm, quantitative (as for raw) otherwise.
+
+    :param method: Diffusion method.
+    """
+    if method in {ML, GM}:
+        return ML
+
+    return RAW
+
+
+def concatenate_columns(results: List[Matrix]) -> Matrix:
+    """Concatenate the columns of scores sharing their rows.
+
+    :param results: Diffusion scores as Matrices.
+    """
+    return Matrix(
+        np.hstack([result.mat for result in results]),
+        rows_labels=results[0].rows_labels,
+        cols_labels=[col_label for result in results for col_label in result.cols_labels],
+        name=results[0].name,
+    )
+
+
+def diffuse_by_blocks(
+    scores: Matrix,
+    method: str,
+    kernel: Matrix,
+    block_size: int = 1024,
+    output: Optional[str] = None,
+) -> Union[Matrix, str]:
+    """Run a kernel-based diffusion method streaming the kernel in row blocks, for kernels larger than memory.
+
+    Each block of output rows only depends on the same block of kernel rows (z-scores included), so peak memory is
+    bounded by the block size when the kernel is memory-mapped (see :func:`diffupath.kernel_io.read_kernel_file`).
+
+    :param scores: Input scores as a Matrix.
+    :param method: Elected method ["raw", "ml", "z"].
+    :param kernel: Network as a kernel.
+    :param block_size: Number of kernel rows processed at once.
+    :param output: Optional output path (.npy or .csv) where the score rows are written as they are computed.
+    :return: Diffusion scores as a Matrix or, if an output is given, the output path.
+    """
+    if method not in {RAW, Z, ML}:
+        raise ValueError(f'Method not supported for kernel-level diffusion: {method}')
+
+    if method == ML:
+        scores = _to_ml_labels(scores)
+
+    scores = scores.match_rows(kernel)
+    input_mat = np.asarray(scores.mat, dtype=float)
+
+    rows_labels = scores.rows_labels
+    cols_labels = _get_output_cols_labels(scores)
+
+    if output is None:
+        diffused = np.empty(input_mat.shape)
+    elif output.endswith('.npy'):
+        diffused = np.lib.format.open_memmap(output, mode='w+', dtype=float, shape=input_mat.shape)
+    else:
+        diffused = None
+        pd.DataFrame(columns=cols_labels).rename_axis('Node').to_csv(output)
+
+    for start in range(0, input_mat.shape[0], block_size):
+        block = kernel_row_block(kernel, start, start + block_size)
+
+        block_scores = np.asarray(block @ input_mat)
+
+        if method == Z:
+            block_scores = z_normalize(block_scores, input_mat, *_get_row_sums(block))
+
+        if diffused is not None:
+            diffused[start:start + block_size] = block_scores
+        else:
+            pd.DataFrame(
+                block_scores,
+                index=rows_labels[start:start + block_size],
+                columns=cols_labels,
+            ).to_csv(output, mode='a', header=False)
+
+        log.debug(f'Diffused kernel rows {start} to {start + block_scores.shape[0]}.')
+
+    if output is None:
+        return Matrix(diffused, rows_labels=rows_labels, cols_labels=cols_labels, name=scores.name)
+
+    if diffused is not None:
+        diffused.flush()
+
+    return output
+
+
+"""Kernel approximation checks"""
+
+
+def kernel_ranking_agreement(
+    reference_kernel: Matrix,
+    approximate_kernel: Matrix,
+    input_scores: Matrix,
+    z: bool = False,
+    top_fraction: float = 0.05,
+) -> Dict[str, Dict[str, float]]:
+    """Compare the rankings obtained diffusing the same input over a reference kernel and an approximation of it.
+
+    For each input column, report the Kendall tau between both score vectors, the AUROC of the approximate scores
+    recovering the top ranked nodes of the reference scores and the maximum absolute error between scores.
+
+    :param reference_kernel: Network as a dense (float64) kernel.
+    :param approximate_kernel: Approximated version of the same kernel (e.g. sparse, float32 or packed).
+    :param input_scores: Input scores to diffuse.
+    :param z: Flag to compare z-scores instead of raw scores.
+    :param top_fraction: Fraction of top reference-ranked nodes considered as positives for the AUROC.
+    """
+    reference_scores = diffuse_on_kernel(input_scores, reference_kernel, z=z).mat
+    approximate_scores = diffuse_on_kernel(input_scores, approximate_kernel, z=z).mat
+
+    n_top = max(1, int(top_fraction * reference_scores.shape[0]))
+
+    agreement = {}
+
+    for j, col_label in enumerate(input_scores.cols_labels):
+        reference_col, approximate_col = reference_scores[:, j], approximate_scores[:, j]
+
+        top_labels = np.zeros(len(reference_col), dtype=int)
+        top_labels[np.argpartition(-reference_col, n_top - 1)[:n_top]] = 1
+
+        agreement[col_label] = {
+            'kendall_tau': stats.kendalltau(reference_col, approximate_col)[0],
+            'auroc': metrics.roc_auc_score(top_labels, approximate_col),
+            'max_abs_error': float(np.max(np.abs(reference_col - approximate_col))),
+        }
+
+    return agreement
+
+
+def check_kernel_precision(
+    reference_kernel: Matrix,
+    compact_kernel: Matrix,
+    input_scores: Optional[Matrix] = None,
+    z: bool = True,
+    min_kendall_tau: float = 0.999,
+) -> Dict[str, float]:
+    """Check that a compact (e.g. float32 or packed) kernel preserves the rankings of its float64 reference.
+
+    :param reference_kernel: Network as a dense float64 kernel.
+    :param compact_kernel: Compact version of the same kernel.
+    :param input_scores: Input scores to diffuse. By default a random probe input.
+    :param z: Flag to compare z-scores instead of raw scores.
+    :param min_kendall_tau: Kendall tau below which a warning is logged.
+    """
+    if input_scores is None:
+        input_scores = random_probe_input(reference_kernel, seed=0)
+
+    agreement = kernel_ranking_agreement(reference_kernel, compact_kernel, input_scores, z=z)
+
+    precision = {
+        'kendall_tau': min(col['kendall_tau'] for col in agreement.values()),
+        'auroc': min(col['auroc'] for col in agreement.values()),
+        'max_abs_error': max(col['max_abs_error'] for col in agreement.values()),
+    }
+
+    if precision['kendall_tau'] < min_kendall_tau:
+        log.warning(f'The compact kernel alters the diffusion rankings (Kendall tau {precision["kendall_tau"]:.4f}).')
+
+    return precision
+
+
+def random_probe_input(
+    kernel: Matrix,
+    n_positives: int = 50,
+    seed: Optional[int] = None,
+) -> Matrix:
+    """Generate a random binary input over the kernel nodes, to probe kernel approximations without real data.
+
+    :param kernel: Network as a kernel.
+    :param n_positives: Number of randomly chosen positive nodes.
+    :param seed: Seed of the random generator.
+    """
+    n = len(kernel.rows_labels)
+
+    probe = np.zeros((n, 1))
+    probe[np.random.RandomState(seed).choice(n, min(n_positives, n), replace=False)] = 1
+
+    return Matrix(probe, rows_labels=kernel.rows_labels, cols_labels=['probe'], name='random probe')
+
+
+"""Helper functions"""
+
+
+def _get_row_sums(mat) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the row sums and squared row sums of a dense or sparse (block of) kernel rows."""
+    if sparse.issparse(mat):
+        row_sums = np.asarray(mat.sum(axis=1)).ravel()
+        row_sums_2 = np.asarray(mat.multiply(mat).sum(axis=1)).ravel()
+    else:
+        row_sums = np.sum(mat, axis=1, dtype=float)
+        row_sums_2 = np.sum(np.square(mat, dtype=float), axis=1)
+
+    # Rounded as in diffupy, so that z-scores match the reference implementation
+    return np.round(row_sums, 2), row_sums_2
+
+
+def _to_ml_labels(scores: Matrix) -> Matrix:
+    """Codify binary input scores as {-1, 1} labels, as required by the ml method."""
+    if not np.isin(scores.mat, [-1, 0, 1]).all():
+        raise ValueError('Input scores must be binary.')
+
+    ml_scores = scores.__copy__()
+    ml_scores.mat = np.where(ml_scores.mat == 0, -1, ml_scores.mat)
+
+    return ml_scores
+
+
+def _get_output_cols_labels(scores: Matrix) -> List[str]:
+    """Return the column labels for the diffused scores, following diffupy naming for single vectors."""
+    if len(scores.cols_labels) == 1:
+        return ['output diffusion scores']
+
+    return list(scores.cols_labels)
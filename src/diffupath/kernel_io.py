@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+"""Single-file kernel format (.dpk), whose matrix body can be memory-mapped instead of loaded in memory.
+
+A kernel file is laid out as:
+
+- 8 bytes magic string (b'DPKERNEL')
+- 8 bytes little-endian unsigned integer with the header length
+- JSON header (labels, layout, arrays offsets/dtypes/shapes and metadata), padded to a 64 bytes boundary
+- raw arrays of the kernel body, each aligned to 64 bytes
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from diffupy.matrix import Matrix
+from scipy import sparse
+
+from .compact_kernel import PackedKernel
+from .label_index import LabelIndex
+from .sparse_kernel import SparseKernel
+
+log = logging.getLogger(__name__)
+
+#: Extension of the kernel files
+KERNEL_FILE_EXTENSION = '.dpk'
+#: Magic string opening every kernel file
+KERNEL_FILE_MAGIC = b'DPKERNEL'
+#: Version of the kernel file format
+KERNEL_FILE_VERSION = 1
+#: Alignment (in bytes) of the header end and of each array of the body
+KERNEL_FILE_ALIGNMENT = 64
+
+DENSE_LAYOUT = 'dense'
+PACKED_LAYOUT = 'packed'
+CSR_LAYOUT = 'csr'
+
+
+class MappedKernel(Matrix):
+    """Dense kernel Matrix whose values are kept as given (e.g. a read-only memory map) instead of copied."""
+
+    def __init__(
+        self,
+        mat,
+        rows_labels,
+        name: str = '',
+    ):
+        """Initialize the mapped kernel.
+
+        :param mat: Square kernel array, such as a numpy memmap.
+        :param rows_labels: Node labels, shared by rows and columns.
+        :param name: Name of the kernel.
+        """
+        self.rows_labels = list(rows_labels)
+        self.name = name
+        self.quadratic = True
+
+        self.mat = mat
+
+        self.get_labels = True
+        self.get_indices = False
+
+        self.validate_labels()
+
+    def __copy__(self):
+        """Return an in-memory copy of the kernel."""
+        return Matrix(np.array(self.mat), rows_labels=self.rows_labels, quadratic=True, name=self.name)
+
+
+def write_kernel_file(
+    kernel: Matrix,
+    path: str,
+    node_types: Optional[List[Optional[str]]] = None,
+    databases: Optional[List[str]] = None,
+    kernel_method: Optional[str] = None,
+    kernel_params: Optional[Dict[str, Any]] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Write a kernel (dense, sparse or packed) as a kernel file.
+
+    :param kernel: Network as a kernel.
+    :param path: Output path of the kernel file.
+    :param node_types: Optional entity type of each node, aligned to the kernel rows.
+    :param databases: Optional databases the kernel network stems from.
+    :param kernel_method: Optional name of the method the kernel was computed with.
+    :param kernel_params: Optional parameters of the kernel method.
+    :param metadata: Optional JSON serializable metadata stored in the header.
+    """
+    if node_types is not None and len(node_types) != len(kernel.rows_labels):
+        raise ValueError('The node types should be aligned to the kernel rows.')
+
+    if isinstance(kernel, PackedKernel):
+        layout, arrays = PACKED_LAYOUT, {'values': kernel.mat}
+    elif sparse.issparse(kernel.mat):
+        csr = sparse.csr_matrix(kernel.mat)
+        layout, arrays = CSR_LAYOUT, {'data': csr.data, 'indices': csr.indices, 'indptr': csr.indptr}
+    else:
+        layout, arrays = DENSE_LAYOUT, {'values': kernel.mat}
+
+    arrays = {array_name: np.ascontiguousarray(array) for array_name, array in arrays.items()}
+
+    # Offsets are relative to the start of the body
+    arrays_info, offset = {}, 0
+    body_hash = hashlib.sha256()
+    for array_name, array in arrays.items():
+        arrays_info[array_name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += _aligned(array.nbytes)
+
+        body_hash.update(array)
+        body_hash.update(_padding(array.nbytes))
+
+    header = {
+        'version': KERNEL_FILE_VERSION,
+        'layout': layout,
+        'name': kernel.name,
+        'shape': [len(kernel.rows_labels), len(kernel.rows_labels)],
+        'dtype': kernel.mat.dtype.str,
+        'rows_labels': list(kernel.rows_labels),
+        'node_types': list(node_types) if node_types is not None else None,
+        'databases': sorted(databases) if databases is not None else None,
+        'kernel_method': kernel_method,
+        'kernel_params': kernel_params or {},
+        'label_index': LabelIndex.from_kernel(kernel).to_dict(),
+        'arrays': arrays_info,
+        'body_size': offset,
+        'checksum': {'algorithm': 'sha256', 'body': body_hash.hexdigest()},
+        'metadata': metadata or {},
+    }
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (_aligned(16 + len(header_bytes)) - 16 - len(header_bytes))
+
+    with open(path, 'wb') as file:
+        file.write(KERNEL_FILE_MAGIC)
+        file.write(np.uint64(len(header_bytes)).tobytes())
+        file.write(header_bytes)
+
+        for array in arrays.values():
+            array.tofile(file)
+            file.write(_padding(array.nbytes))
+
+    log.info(f'Kernel written to {path} ({layout} layout).')
+
+    return path
+
+
+def write_kernel_file_atomically(kernel: Matrix, path: str, **kwargs) -> str:
+    """Write a kernel file through a temporary file in the same directory, so that readers never see partial files.
+
+    :param kernel: Network as a kernel.
+    :param path: Output path of the kernel file.
+    :param kwargs: Header fields, as in :func:`write_kernel_file`.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix=f'{KERNEL_FILE_EXTENSION}.tmp')
+    os.close(fd)
+
+    try:
+        write_kernel_file(kernel, tmp_path, **kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return path
+
+
+def read_kernel_header(path: str) -> Dict[str, Any]:
+    """Read the header of a kernel file, without reading its body.
+
+    :param path: Path to the kernel file.
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(KERNEL_FILE_MAGIC)) != KERNEL_FILE_MAGIC:
+            raise IOError(f'{path} is not a kernel file.')
+
+        header_length = int(np.frombuffer(file.read(8), dtype='<u8')[0])
+        header = json.loads(file.read(header_length).decode('utf-8'))
+
+    if header['version'] > KERNEL_FILE_VERSION:
+        raise IOError(f'Kernel file version {header["version"]} is not supported by this version of DiffuPath.')
+
+    header['body_offset'] = len(KERNEL_FILE_MAGIC) + 8 + header_length
+
+    return header
+
+
+def read_kernel_labels(path: str) -> List[str]:
+    """Read the node labels of a kernel file from its header.
+
+    :param path: Path to the kernel file.
+    """
+    return read_kernel_header(path)['rows_labels']
+
+
+def read_label_index(path: str) -> LabelIndex:
+    """Read the label index stored in the header of a kernel file.
+
+    :param path: Path to the kernel file.
+    """
+    header = read_kernel_header(path)
+
+    if 'label_index' not in header:
+        return LabelIndex(header['rows_labels'])
+
+    return LabelIndex.from_dict(header['rows_labels'], header['label_index'])
+
+
+def get_kernel_info(path: str) -> Dict[str, Any]:
+    """Summarize a kernel file from its header: shape, layout, dtype, provenance, node types and checksum.
+
+    :param path: Path to the kernel file.
+    """
+    header = read_kernel_header(path)
+
+    node_types = header.get('node_types')
+
+    return {
+        'name': header['name'],
+        'n_nodes': header['shape'][0],
+        'layout': header['layout'],
+        'dtype': header.get('dtype'),
+        'file_size': os.path.getsize(path),
+        'databases': header.get('databases'),
+        'kernel_method': header.get('kernel_method'),
+        'kernel_params': header.get('kernel_params', {}),
+        'node_types': dict(Counter(node_types)) if node_types is not None else None,
+        'checksum': header.get('checksum', {}).get('body'),
+        'metadata': header['metadata'],
+    }
+
+
+def get_label_coverage(path: str, labels: Iterable[str]) -> Dict[Optional[str], Tuple[int, int]]:
+    """Count, by node type, the kernel nodes covered by a list of (already normalized) labels, from the header only.
+
+    :param path: Path to the kernel file.
+    :param labels: Input labels.
+    :return: Number of covered nodes and number of nodes, by node type (None if the kernel has no node types).
+    """
+    header = read_kernel_header(path)
+
+    labels = set(labels)
+    node_types = header.get('node_types') or [None] * len(header['rows_labels'])
+
+    coverage = defaultdict(lambda: [0, 0])
+
+    for label, node_type in zip(header['rows_labels'], node_types):
+        coverage[node_type][1] += 1
+        if label in labels:
+            coverage[node_type][0] += 1
+
+    return {node_type: tuple(counts) for node_type, counts in coverage.items()}
+
+
+def read_kernel_file(path: str, mmap: bool = True) -> Matrix:
+    """Read a kernel file, by default memory-mapping its body so that only the accessed blocks are loaded.
+
+    :param path: Path to the kernel file.
+    :param mmap: Flag to memory-map the kernel body. Otherwise, the body is fully loaded in memory.
+    """
+    header = read_kernel_header(path)
+
+    arrays = {
+        array_name: _read_array(path, header['body_offset'] + info['offset'], info, mmap)
+        for array_name, info in header['arrays'].items()
+    }
+
+    if header['layout'] == PACKED_LAYOUT:
+        return PackedKernel(arrays['values'], rows_labels=header['rows_labels'], name=header['name'])
+
+    if header['layout'] == CSR_LAYOUT:
+        return SparseKernel(
+            sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=header['shape']),
+            rows_labels=header['rows_labels'],
+            name=header['name'],
+        )
+
+    if header['layout'] == DENSE_LAYOUT:
+        if mmap:
+            return MappedKernel(arrays['values'], rows_labels=header['rows_labels'], name=header['name'])
+
+        return Matrix(arrays['values'], rows_labels=header['rows_labels'], quadratic=True, name=header['name'])
+
+    raise IOError(f'Unknown kernel layout: {header["layout"]}')
+
+
+def verify_kernel_file(path: str, chunk_size: int = 2 ** 24) -> bool:
+    """Check the kernel file body against the checksum of its header, streaming the body instead of loading it.
+
+    :param path: Path to the kernel file.
+    :param chunk_size: Number of bytes read at once.
+    """
+    header = read_kernel_header(path)
+
+    if 'checksum' not in header:
+        raise IOError(f'{path} has no checksum.')
+
+    body_hash = hashlib.new(header['checksum']['algorithm'])
+    remaining = header['body_size']
+
+    with open(path, 'rb') as file:
+        file.seek(header['body_offset'])
+
+        while remaining:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                return False
+
+            body_hash.update(chunk)
+            remaining -= len(chunk)
+
+    return body_hash.hexdigest() == header['checksum']['body']
+
+
+def is_kernel_file(path: str) -> bool:
+    """Check if a path points to a kernel file.
+
+    :param path: Path to check.
+    """
+    return isinstance(path, str) and path.endswith(KERNEL_FILE_EXTENSION)
+
+
+def get_rows_end(path: str, n_rows: int) -> int:
+    """Return the offset of a kernel file up to which its header and first rows are stored, e.g. to page them in.
+
+    Dense and packed kernels store their rows in order (the offset being an upper bound for packed ones). The rows of
+    sparse kernels are spread over several arrays, so only their header is covered.
+
+    :param path: Path to the kernel file.
+    :param n_rows: Number of first rows.
+    """
+    header = read_kernel_header(path)
+
+    if header['layout'] == CSR_LAYOUT:
+        return header['body_offset']
+
+    info = header['arrays']['values']
+    n_rows = min(n_rows, header['shape'][0])
+
+    return header['body_offset'] + info['offset'] + n_rows * header['shape'][1] * np.dtype(info['dtype']).itemsize
+
+
+def get_kernel_file_path(path: str) -> str:
+    """Return the kernel file path corresponding to another kernel path (e.g. a pickle).
+
+    :param path: Path to a kernel.
+    """
+    return os.path.splitext(path)[0] + KERNEL_FILE_EXTENSION
+
+
+def prefer_kernel_file(path: str) -> str:
+    """Return the kernel file (.dpk) sibling of a kernel path if it has been built, otherwise the given path.
+
+    :param path: Path to a kernel (e.g. a pickle).
+    """
+    kernel_file_path = get_kernel_file_path(path)
+
+    if kernel_file_path != path and os.path.isfile(kernel_file_path):
+        return kernel_file_path
+
+    return path
+
+
+"""Helper functions"""
+
+
+def _aligned(nbytes: int) -> int:
+    """Round a number of bytes up to the file alignment."""
+    return -(-nbytes // KERNEL_FILE_ALIGNMENT) * KERNEL_FILE_ALIGNMENT
+
+
+def _padding(nbytes: int) -> bytes:
+    """Return the zero bytes aligning an array of the given size."""
+    return b'\0' * (_aligned(nbytes) - nbytes)
+
+
+def _read_array(path: str, offset: int, info: Dict[str, Any], mmap: bool) -> np.ndarray:
+    """Read (or memory-map) an array of the kernel body."""
+    dtype, shape = np.dtype(info['dtype']), tuple(info['shape'])
+
+    if mmap:
+        if not int(np.prod(shape)):
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        return np.fromfile(file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""Stratified k-fold cross-validation, diffusing all the folds (and repeats) as the columns of a single seed matrix."""
+
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import networkx as nx
+import numpy as np
+from diffupy.constants import RAW, Z
+from diffupy.matrix import Matrix
+from diffupy.process_input import process_input_data
+
+from .constants import PAGE_RANK, RANDOM
+from .kernel_diffusion import kernel_product, kernel_row_sums, z_normalize
+from .label_index import LabelIndex
+from .metrics import get_metrics_by_column
+from .topological_analyses import generate_pagerank_baseline
+
+log = logging.getLogger(__name__)
+
+
+def get_fold_assignment(
+    strata: np.ndarray,
+    k: int = 10,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Randomly assign labels to k folds, with each stratum spread evenly over the folds.
+
+    :param strata: Stratum (e.g. omic type) code of each label.
+    :param k: Number of folds.
+    :param rng: Random generator of the assignment.
+    :return: Fold of each label, from 0 to k - 1.
+    """
+    rng = rng or np.random.default_rng()
+    strata = np.asarray(strata)
+
+    # Labels shuffled and grouped by stratum are dealt to the folds in turn, so folds get the same share of each stratum
+    order = rng.permutation(len(strata))
+    order = order[np.argsort(strata[order], kind='stable')]
+
+    folds = np.empty(len(strata), dtype=int)
+    folds[order] = np.arange(len(strata)) % k
+
+    return folds
+
+
+def validation_by_kfold(
+    mapping_input: Union[List, Dict[str, float], Dict[str, Union[List, Dict[str, float]]]],
+    kernel: Matrix,
+    graph: Optional[nx.Graph] = None,
+    k: int = 10,
+    repeats: int = 1,
+    seed: Optional[int] = None,
+    label_index: Optional[LabelIndex] = None,
+    row_sums: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Tuple[Dict[str, list], Dict[str, list]]:
+    """K-fold cross-validation by diffusion method, optionally stratified by omic type.
+
+    Each fold is ranked by diffusing the labels of the other folds. The folds of every repeat are diffused as the
+    columns of a single kernel product and their metrics computed column-wise.
+
+    :param mapping_input: List or value dictionary of labels {'label':value}, or a dictionary of them by omic type to
+     stratify the folds. Held-out values are binned (threshold 0.5) into validation labels.
+    :param kernel: Network as a kernel (dense, sparse, packed or memory-mapped).
+    :param graph: Optional network as a graph, for the PageRank baseline.
+    :param k: Number of folds.
+    :param repeats: Number of repeats, each with its own random folds.
+    :param seed: Seed of the random folds and baseline.
+    :param label_index: Label index of the kernel. By default built from the kernel labels.
+    :param row_sums: Optional precomputed kernel row sums and squared row sums (see :func:`kernel_row_sums`).
+    :return: AUROC and AUPRC metrics by method, one per fold and repeat.
+    """
+    label_index = label_index or LabelIndex.from_kernel(kernel)
+    rows, values, validation_values, strata = _get_labelled_rows(mapping_input, label_index)
+
+    if len(rows) < k:
+        raise ValueError(f'{len(rows)} mapped labels can not be split into {k} folds.')
+
+    rng = np.random.default_rng(seed)
+
+    n_nodes, n_columns = len(kernel.rows_labels), k * repeats
+    input_mat = np.full((n_nodes, n_columns), -1, dtype=float)
+    validation_mat = np.full((n_nodes, n_columns), -1, dtype=float)
+
+    for repeat in range(repeats):
+        folds = get_fold_assignment(strata, k, rng)
+
+        # Column of each fold: the labels of the other folds as input, the labels of the fold as validation
+        columns = repeat * k + np.arange(k)
+        held_out = folds[:, np.newaxis] == np.arange(k)
+
+        input_mat[rows, columns[:, np.newaxis]] = np.where(held_out, -1, values[:, np.newaxis]).T
+        validation_mat[rows, columns[:, np.newaxis]] = np.where(held_out, validation_values[:, np.newaxis], -1).T
+
+    raw_scores = kernel_product(kernel, input_mat)
+
+    method_scores = {
+        RAW: raw_scores,
+        Z: z_normalize(raw_scores, input_mat, *(row_sums or kernel_row_sums(kernel))),
+        RANDOM: rng.random((n_nodes, n_columns)),
+    }
+    if graph is not None:
+        method_scores[PAGE_RANK] = np.repeat(generate_pagerank_baseline(graph, kernel).mat, n_columns, axis=1)
+
+    auroc_metrics, auprc_metrics = {}, {}
+
+    for method, scores in method_scores.items():
+        auroc, auprc = get_metrics_by_column(validation_mat, scores)
+        auroc_metrics[method], auprc_metrics[method] = auroc.tolist(), auprc.tolist()
+
+    return auroc_metrics, auprc_metrics
+
+
+"""Helper functions"""
+
+
+def _get_labelled_rows(
+    mapping_input,
+    label_index: LabelIndex,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Return the kernel rows, input values, validation values and stratum codes of the mapped input labels.
+
+    Validation values are binned as in :func:`diffupath.repeated_holdout.validation_by_method`. Each row is returned
+    once.
+    """
+    stratified = isinstance(mapping_input, dict) and all(
+        isinstance(labels, (list, set, dict)) for labels in mapping_input.values()
+    )
+    strata_inputs = list(mapping_input.values()) if stratified else [mapping_input]
+
+    labels, values, validation_values, strata = [], [], [], []
+
+    for stratum, stratum_input in enumerate(strata_inputs):
+        scores = stratum_input if isinstance(stratum_input, dict) else dict.fromkeys(stratum_input, 1)
+        binned = process_input_data(scores, binning=True, threshold=0.5)
+
+        labels.extend(scores)
+        values.extend(scores.values())
+        validation_values.extend(binned[label] for label in scores)
+        strata.extend([stratum] * len(scores))
+
+    rows = label_index.get_rows(labels)
+    mapped = rows >= 0
+
+    # Labels mapped to the same row (e.g. in several omics) keep their first occurrence
+    rows, positions = np.unique(rows[mapped], return_index=True)
+
+    values = np.asarray(values, dtype=float)[mapped][positions]
+    validation_values = np.asarray(validation_values, dtype=float)[mapped][positions]
+
+    return rows, values, validation_values, np.asarray(strata)[mapped][positions]
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+"""Label index mapping normalized input labels to kernel rows, shared by the input mapping and formatting."""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from diffupy.matrix import Matrix
+
+from .constants import REACTOME_BLACK_LIST, REACTOME_PROT, WIKIPATHWAYS_NAME_NORMALIZATION
+
+log = logging.getLogger(__name__)
+
+#: Characters removed from labels, as in the diffupy input munging
+REMOVED_CHARACTERS = ['*', ' ', '|', '-', '"', "'", '↑', '↓', '\n']
+
+#: Column label of single vector inputs, as in diffupy
+SCORES_COLUMN = 'scores'
+
+#: Suffixes that may follow a kernel label in input labels (after normalization), e.g. 'tp53 gene' or 'mir-21-5p'
+DECORATION_SUFFIXES = {'gene', 'genes', 'protein', 'proteins', 'mrna', '5p', '3p'}
+
+
+class LabelIndex:
+    """Hash index from normalized labels (and aliases) to kernel rows, with a prefix trie fallback."""
+
+    def __init__(
+        self,
+        rows_labels: List[str],
+        aliases: Optional[Dict[str, str]] = None,
+    ):
+        """Initialize the label index.
+
+        :param rows_labels: Kernel node labels.
+        :param aliases: Optional mapping from alias to kernel node label.
+        """
+        self.rows_labels = list(rows_labels)
+
+        keys = normalize_labels(self.rows_labels)
+        rows = np.arange(len(self.rows_labels))
+
+        if aliases:
+            row_by_label = pd.Index(self.rows_labels)
+            alias_rows = row_by_label.get_indexer(list(aliases.values()))
+            keys = np.append(keys, normalize_labels(list(aliases))[alias_rows >= 0])
+            rows = np.append(rows, alias_rows[alias_rows >= 0])
+
+        # Node labels take precedence over aliases, which are appended after them
+        index = pd.Series(rows, index=keys)
+        index = index[~index.index.duplicated(keep='first')]
+
+        self._keys = index.index
+        self._rows = index.values
+        self._trie = None
+
+    @classmethod
+    def from_kernel(cls, kernel: Matrix, aliases: Optional[Dict[str, str]] = None) -> 'LabelIndex':
+        """Build the label index of a kernel.
+
+        :param kernel: Network as a kernel.
+        :param aliases: Mapping from alias to kernel node label. By default compiled from the PathMe curation rules.
+        """
+        if aliases is None:
+            aliases = build_alias_index(kernel.rows_labels)
+
+        return cls(kernel.rows_labels, aliases=aliases)
+
+    def __len__(self) -> int:
+        """Return the number of indexed keys."""
+        return len(self._keys)
+
+    def get_rows(self, labels: Iterable[str]) -> np.ndarray:
+        """Return the kernel row of each label, -1 for unmapped labels, in a single vectorized pass.
+
+        :param labels: Input labels.
+        """
+        keys = normalize_labels(labels)
+        positions = self._keys.get_indexer(keys)
+
+        if not len(self._rows):
+            return positions
+
+        rows = np.where(positions >= 0, self._rows[positions], -1)
+
+        # Unmapped labels may still be a kernel label followed by a known decoration (e.g. 'tp53gene' or 'mir215p')
+        for i in np.flatnonzero(rows < 0):
+            match = self.trie.longest_prefix(keys[i])
+            if match is not None and keys[i][len(match[0]):] in DECORATION_SUFFIXES:
+                rows[i] = match[1]
+
+        return rows
+
+    @property
+    def trie(self) -> 'LabelTrie':
+        """Return the prefix trie of the index keys, built on first use."""
+        if self._trie is None:
+            self._trie = LabelTrie(zip(self._keys, self._rows))
+
+        return self._trie
+
+    def get_unmapped(self, labels: Iterable[str]) -> List[str]:
+        """Return the labels not mapped to any kernel row.
+
+        :param labels: Input labels.
+        """
+        labels = _flatten_labels(labels)
+
+        return [label for label, row in zip(labels, self.get_rows(labels)) if row < 0]
+
+    def map_labels(self, processed_input) -> Dict[str, Dict[str, float]]:
+        """Map a processed input onto the kernel labels, as column label -> kernel label -> score.
+
+        :param processed_input: Processed input as a label list, a label-scores dict or a type dict of any of them.
+        """
+        mapped = {}
+
+        for col_label, (labels, scores) in _get_input_columns(processed_input).items():
+            rows = self.get_rows(labels)
+            mapped[col_label] = {
+                self.rows_labels[row]: score
+                for row, score in zip(rows, scores)
+                if row >= 0
+            }
+
+        return mapped
+
+    def mapping_report(self, processed_input) -> Dict[str, Dict[str, Union[int, List[str]]]]:
+        """Report, for each input column, the number of mapped labels and the unmapped ones.
+
+        :param processed_input: Processed input as a label list, a label-scores dict or a type dict of any of them.
+        """
+        report = {}
+
+        for col_label, (labels, _) in _get_input_columns(processed_input).items():
+            rows = self.get_rows(labels)
+            report[col_label] = {
+                'mapped': int(np.sum(rows >= 0)),
+                'total': len(labels),
+                'unmapped': [label for label, row in zip(labels, rows) if row < 0],
+            }
+
+        return report
+
+    def format_input(
+        self,
+        processed_input,
+        missing_value: int = -1,
+        title: str = '',
+    ) -> Matrix:
+        """Format a processed input as a Matrix matching the kernel rows, mapping each column in a vectorized pass.
+
+        Drop-in for diffupy's format_input_for_diffusion: label lists are codified as 1, nodes absent from the input
+        take the missing value and type dicts are formatted as one column per type.
+
+        :param processed_input: Processed input as a label list, a label-scores dict or a type dict of any of them.
+        :param missing_value: Value of the kernel nodes absent from the input.
+        :param title: Name of the input Matrix.
+        """
+        columns = _get_input_columns(processed_input)
+
+        mat = np.full((len(self.rows_labels), len(columns)), missing_value, dtype=float)
+
+        for j, (col_label, (labels, scores)) in enumerate(columns.items()):
+            rows = self.get_rows(labels)
+            mapped = rows >= 0
+
+            mat[rows[mapped], j] = np.asarray(scores, dtype=float)[mapped]
+
+            log.info(f'{col_label}: {int(np.sum(mapped))} of {len(labels)} input labels mapped to the kernel.')
+
+        return Matrix(mat, rows_labels=self.rows_labels, cols_labels=list(columns), name=title)
+
+    def to_dict(self) -> Dict[str, list]:
+        """Serialize the index keys and rows (e.g. for kernel file headers)."""
+        return {'keys': list(self._keys), 'rows': self._rows.tolist()}
+
+    @classmethod
+    def from_dict(cls, rows_labels: List[str], index: Dict[str, list]) -> 'LabelIndex':
+        """Load a serialized label index without normalizing the labels again.
+
+        :param rows_labels: Kernel node labels.
+        :param index: Serialized index keys and rows.
+        """
+        label_index = cls.__new__(cls)
+        label_index.rows_labels = list(rows_labels)
+        label_index._keys = pd.Index(index['keys'])
+        label_index._rows = np.asarray(index['rows'], dtype=int)
+        label_index._trie = None
+
+        return label_index
+
+
+def normalize_labels(labels: Iterable[str]) -> np.ndarray:
+    """Normalize labels in a vectorized way: lower case and without the characters removed by the diffupy munging.
+
+    Kernel labels and input labels (already munged by diffupy) are both normalized, so that they meet halfway (e.g.
+    'mir-21' and 'mir21').
+
+    :param labels: Labels to normalize.
+    """
+    labels = pd.Series(list(labels), dtype=object).astype(str).str.lower().str.strip()
+
+    for character in REMOVED_CHARACTERS:
+        labels = labels.str.replace(character, '', regex=False)
+
+    return labels.values
+
+
+class LabelTrie:
+    """Character trie over normalized labels, for longest prefix lookups."""
+
+    def __init__(self, items: Iterable[tuple] = ()):
+        """Initialize the trie.
+
+        :param items: Pairs of label and kernel row.
+        """
+        self._root = {}
+
+        for label, row in items:
+            self.insert(label, row)
+
+    def insert(self, label: str, row: int):
+        """Insert a label and its kernel row.
+
+        :param label: Normalized label.
+        :param row: Kernel row.
+        """
+        node = self._root
+        for character in label:
+            node = node.setdefault(character, {})
+        node[None] = row
+
+    def longest_prefix(self, label: str) -> Optional[tuple]:
+        """Return the longest inserted label that is a prefix of the given label, with its row, if any.
+
+        :param label: Normalized label.
+        """
+        node, match = self._root, None
+
+        for i, character in enumerate(label):
+            node = node.get(character)
+            if node is None:
+                break
+            if None in node:
+                match = (label[:i + 1], node[None])
+
+        return match
+
+
+def build_alias_index(rows_labels: List[str]) -> Dict[str, str]:
+    """Compile the PathMe curation rules into an alias to kernel label mapping.
+
+    - each identifier of Reactome cells with multiple identifiers (e.g. 'htr1a,b,d'), besides protein complexes
+    - the WikiPathways names of duplicate entities
+    - KEGG 'title:' prefixed names
+
+    :param rows_labels: Kernel node labels.
+    """
+    aliases = {}
+    labels = set(rows_labels)
+
+    for label in rows_labels:
+        if label in REACTOME_PROT:
+            continue
+
+        if ',' in label or '/' in label:
+            identifiers = munge_reactome_gene(label)
+            if not isinstance(identifiers, list):
+                continue
+
+            for identifier in identifiers:
+                identifier = identifier.strip().strip('(').strip(')')
+                if identifier and identifier not in REACTOME_BLACK_LIST and identifier not in labels:
+                    aliases.setdefault(identifier, label)
+
+        elif label.startswith('title:') and label[6:] not in labels:
+            aliases[label[6:]] = label
+
+    for alias, name in WIKIPATHWAYS_NAME_NORMALIZATION.items():
+        if name in labels and alias.lower() not in labels:
+            aliases[alias.lower()] = name
+
+    return aliases
+
+
+"""Reactome multiple identifiers"""
+
+
+def process_reactome_multiple_genes(genes):
+    """Process a wrong ID with multiple identifiers."""
+    gene_list = []
+
+    for counter, gene in enumerate(genes):
+
+        # Strip the ' gene' prefix
+        gene = gene.strip().strip(' gene').strip(' genes')
+
+        # First element is always OK
+        if counter == 0:
+            gene_list.append(gene)
+
+        # If the identifier starts the same than the first one, it is right
+        elif gene[:2] == genes[0][:2]:
+            gene_list.append(gene)
+
+        # If the identifier is longer than 2 it is a valid HGNC symbol
+        elif len(gene) > 2:
+            gene_list.append(gene)
+
+        # If they start different, it might have only a number (e.g., 'ABC1, 2, 3') so it needs to be appended
+        elif gene.isdigit():
+            gene_list.append(genes[0][:-1] + gene)
+
+        # If the have only one letter (e.g., HTR1A,B,D,E,F,HTR5A)
+        elif len(gene) == 1:
+            gene_list.append(genes[0][:-1] + gene)
+
+    return gene_list
+
+
+def munge_reactome_gene(gene):
+    """Process/munge Reactome gene."""
+    if "," in gene:
+        return process_reactome_multiple_genes(gene.split(","))
+
+    elif "/" in gene:
+        return process_reactome_multiple_genes(gene.split("/"))
+
+    return gene
+
+
+"""Helper functions"""
+
+
+def _flatten_labels(labels: Iterable[Union[str, tuple]]) -> List[str]:
+    """Flatten the label tuples diffupy generates when splitting labels."""
+    flat_labels = []
+
+    for label in labels:
+        if isinstance(label, (tuple, set, list)):
+            flat_labels.extend(label)
+        else:
+            flat_labels.append(label)
+
+    return flat_labels
+
+
+def _get_input_columns(processed_input) -> Dict[str, tuple]:
+    """Return the (labels, scores) of each column of a processed input."""
+    if isinstance(processed_input, dict) and processed_input and all(
+        isinstance(value, (dict, list, set, tuple)) for value in processed_input.values()
+    ):
+        return {
+            col_label: _get_labels_and_scores(col_input)
+            for col_label, col_input in processed_input.items()
+        }
+
+    return {SCORES_COLUMN: _get_labels_and_scores(processed_input)}
+
+
+def _get_labels_and_scores(col_input) -> tuple:
+    """Return the labels and scores of a label list (scored as 1) or a label-scores dict."""
+    if isinstance(col_input, dict):
+        labels, scores = [], []
+        for label, score in col_input.items():
+            sublabels = _flatten_labels([label])
+            labels.extend(sublabels)
+            scores.extend([score] * len(sublabels))
+        return labels, scores
+
+    labels = _flatten_labels(col_input)
+
+    return labels, [1] * len(labels)
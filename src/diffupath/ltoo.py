@@ -8,13 +8,14 @@ from collections import defaultdict
 from typing import Union, Tuple, Dict, Optional
 
 import numpy as np
-from diffupy.diffuse_raw import diffuse_raw
 from diffupy.matrix import Matrix
 from diffupy.process_input import format_input_for_diffusion
 from sklearn import metrics
 from tqdm import tqdm
 
+from .bootstrap import store_scores
 from .constants import OUTPUT_DIR
+from .kernel_diffusion import diffuse_on_kernel
 from .topological_analyses import generate_pagerank_baseline
 
 """Leave two omics out  validation datasets functions"""
@@ -25,9 +26,14 @@ def ltoo_by_method(
         graph,
         kernel,
         k=100,
-        output: Optional[str] = os.path.join(OUTPUT_DIR, 'count_not_empty.csv')
+        output: Optional[str] = os.path.join(OUTPUT_DIR, 'count_not_empty.csv'),
+        scores_store: Optional[Dict[Tuple[str, str, str], list]] = None,
 ):
-    """Cross validation by method."""
+    """Cross validation by method.
+
+    :param scores_store: Optional dictionary keeping the validation labels and scores of every iteration by (entity,
+     validation entity, method), for the bootstrap confidence intervals (see :mod:`diffupath.bootstrap`).
+    """
     auroc_metrics = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
     auprc_metrics = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
 
@@ -40,8 +46,8 @@ def ltoo_by_method(
                 mapping_input, kernel, entity
             )
 
-            scores_z = diffuse_raw(graph=None, scores=input_diff, k=kernel, z=True)
-            scores_raw = diffuse_raw(graph=None, scores=input_diff, k=kernel, z=False)
+            scores_z = diffuse_on_kernel(input_diff, kernel, z=True)
+            scores_raw = diffuse_on_kernel(input_diff, kernel, z=False)
             scores_page_rank = generate_pagerank_baseline(graph, kernel)
 
             method_validation_scores_by_type = {
@@ -70,6 +76,8 @@ def ltoo_by_method(
 
             for entity_label, method_validation_scores in method_validation_scores_by_type.items():
                 for method, validation_set in method_validation_scores.items():
+                    store_scores(scores_store, (entity, entity_label, method), *validation_set)
+
                     try:
                         auroc, auprc = _get_metrics(validation_set[0], validation_set[1])
                     except ValueError:
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""Vectorized ranking metrics, computing the AUROC and AUPRC of every validation column at once."""
+
+import logging
+from typing import Tuple
+
+import numpy as np
+from scipy import stats
+
+log = logging.getLogger(__name__)
+
+
+def auroc_by_column(labels: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """Return the area under the ROC curve of each column, as the Mann-Whitney U statistic of its positives.
+
+    Tied scores get their average rank, as in :func:`sklearn.metrics.roc_auc_score`.
+
+    :param labels: Validation labels (nodes x columns), positive labels being greater than zero.
+    :param scores: Scores to rank (nodes x columns).
+    :return: AUROC of each column, NaN for columns without positives or negatives.
+    """
+    positives = np.asarray(labels) > 0
+    n_positives = positives.sum(axis=0)
+    n_negatives = positives.shape[0] - n_positives
+
+    ranks = stats.rankdata(scores, axis=0)
+    rank_sums = np.sum(ranks * positives, axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (rank_sums - n_positives * (n_positives + 1) / 2) / (n_positives * n_negatives)
+
+
+def auprc_by_column(labels: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """Return the average precision of each column.
+
+    Tied scores share a threshold, as in :func:`sklearn.metrics.average_precision_score`.
+
+    :param labels: Validation labels (nodes x columns), positive labels being greater than zero.
+    :param scores: Scores to rank (nodes x columns).
+    :return: Average precision of each column, NaN for columns without positives.
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[0]
+
+    order = np.argsort(-scores, axis=0, kind='stable')
+    sorted_scores = np.take_along_axis(scores, order, axis=0)
+    sorted_positives = np.take_along_axis(np.asarray(labels) > 0, order, axis=0)
+
+    # Every node is thresholded at the last node of its group of tied scores
+    group_ends = np.ones(scores.shape, dtype=bool)
+    group_ends[:-1] = sorted_scores[:-1] != sorted_scores[1:]
+    ends = np.where(group_ends, np.arange(n)[:, np.newaxis], n)
+    ends = np.minimum.accumulate(ends[::-1], axis=0)[::-1]
+
+    true_positives = np.cumsum(sorted_positives, axis=0)
+    precision = np.take_along_axis(true_positives, ends, axis=0) / (ends + 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sum(precision * sorted_positives, axis=0) / sorted_positives.sum(axis=0)
+
+
+def get_metrics_by_column(labels: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the AUROC and AUPRC of each column, 0 for the columns they can not be calculated for.
+
+    :param labels: Validation labels (nodes x columns), positive labels being greater than zero.
+    :param scores: Scores to rank (nodes x columns).
+    """
+    auroc, auprc = auroc_by_column(labels, scores), auprc_by_column(labels, scores)
+
+    undefined = np.isnan(auroc)
+    if undefined.any():
+        log.warning(f'ROC AUC unable to calculate for {undefined.sum()} columns without positives or negatives')
+
+    return np.nan_to_num(auroc), np.nan_to_num(auprc)
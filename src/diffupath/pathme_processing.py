@@ -10,6 +10,12 @@ from pathme.constants import KEGG_BEL, REACTOME_BEL, WIKIPATHWAYS_BEL
 from pybel.constants import ANNOTATIONS
 from pybel.dsl import Abundance, BiologicalProcess, CentralDogma, ListAbundance, Reaction
 
+from .constants import (
+    REACTOME_BLACK_LIST, REACTOME_PROT, WIKIPATHWAYS_BIOL_PROCESS, WIKIPATHWAYS_METAB, WIKIPATHWAYS_NAME_NORMALIZATION,
+)
+# Reactome identifier helpers, shared with the label index and still importable from here
+from .label_index import munge_reactome_gene, process_reactome_multiple_genes  # noqa: F401
+
 
 def calculate_database_sets_as_dict(nodes, database):
     """Export as dict databse sets."""
@@ -35,104 +41,8 @@ def get_nodes_in_database(folder):
     }
 
 
-def process_reactome_multiple_genes(genes):
-    """Process a wrong ID with multiple identifiers."""
-    gene_list = []
-
-    for counter, gene in enumerate(genes):
-
-        # Strip the ' gene' prefix
-        gene = gene.strip().strip(' gene').strip(' genes')
-
-        # First element is always OK
-        if counter == 0:
-            gene_list.append(gene)
-
-        # If the identifier starts the same than the first one, it is right
-        elif gene[:2] == genes[0][:2]:
-            gene_list.append(gene)
-
-        # If the identifier is longer than 2 it is a valid HGNC symbol
-        elif len(gene) > 2:
-            gene_list.append(gene)
-
-        # If they start different, it might have only a number (e.g., 'ABC1, 2, 3') so it needs to be appended
-        elif gene.isdigit():
-            gene_list.append(genes[0][:-1] + gene)
-
-        # If the have only one letter (e.g., HTR1A,B,D,E,F,HTR5A)
-        elif len(gene) == 1:
-            gene_list.append(genes[0][:-1] + gene)
-
-    return gene_list
-
-
-def munge_reactome_gene(gene):
-    """Process/munge Reactome gene."""
-    if "," in gene:
-        return process_reactome_multiple_genes(gene.split(","))
-
-    elif "/" in gene:
-        return process_reactome_multiple_genes(gene.split("/"))
-
-    return gene
-
-
 def calculate_database_sets(nodes, database):
     """Calculate node sets for each modality in the database."""
-    # Entities in WikiPathways that required manual curation
-    wikipathways_biol_process = {'lipid biosynthesis', 'hsc survival', 'glycolysis & gluconeogenesis',
-                                 'triacylglyceride  synthesis', 'wnt canonical signaling',
-                                 'regulation of actin skeleton', 'fatty acid metabolism',
-                                 'mrna processing major splicing pathway', 'senescence', 'monocyte differentiation',
-                                 'pentose phosphate pathway', 'ethanolamine  phosphate', 'hsc differentiation',
-                                 'actin, stress fibers and adhesion', 'regulation of actin cytoskeleton',
-                                 's-phase progression', 'g1-s transition', 'toll-like receptor signaling pathway',
-                                 'regulation of  actin cytoskeleton', 'proteasome degradation', 'apoptosis',
-                                 'bmp pathway', 'ampk activation', 'g1/s checkpoint arrest', 'mapk signaling pathway',
-                                 'chromatin remodeling and  epigenetic modifications', 'wnt signaling pathway',
-                                 'ros production', 'erbb signaling pathway', 'shh pathway', 'inflammation',
-                                 'dna replication', 'mrna translation', 'oxidative stress',
-                                 'cell cycle checkpoint activation', 'gi/go pathway', 'wnt pathway',
-                                 'g1/s transition of mitotic cell cycle', 'modulation of estrogen receptor signalling',
-                                 'dna repair', 'bmp canonical signaling', 'igf and insuline signaling',
-                                 'unfolded protein response', 'cell death', 'p38/mapk  pathway', 'glycogen metabolism',
-                                 'gnrh signal pathway',
-                                 'the intra-s-phase checkpoint mediated arrest of cell cycle progression', 'tca cycle',
-                                 'mtor protein kinase signaling pathway', 'proteasome  degradation pathway',
-                                 'morphine metabolism', 'hsc aging', 'gastric pepsin release',
-                                 'parietal cell production', 'prostaglandin pathway', 'cell cycle (g1/s)  progression',
-                                 'notch pathway', 'g2/m progression', 'wnt signaling', 'cell adhesion',
-                                 'cell cycle progression', 'egfr pathway', 'cell cycle', 'angiogenesis',
-                                 'g2/m-phase checkpoint', 'hsc self renewal', '26s proteasome  degradation',
-                                 'mapk signaling', 'immune system up or down regulation', 'm-phase progression',
-                                 'insulin signaling', 'nf kappa b pathway', 'cell cycle  progression', 'gi pathway',
-                                 'cd45+ hematopoietic-    derived cell    proliferation', "kreb's cycle",
-                                 'glycogen synthesis', 'apoptosis pathway', 'g1/s progression',
-                                 'inflammasome activation', 'melanin biosynthesis', 'proteasomal degradation',
-                                 'g2/m checkpoint arrest', 'g1/s cell cycle transition', 'dna damage response',
-                                 'gastric histamine release'}
-    wikipathways_metab = {'2,8-dihydroxyadenine', '8,11-dihydroxy-delta-9-thc', 'adp-ribosyl', 'cocaethylene',
-                          'dhcer1p', 'ecgonidine', 'f2-isoprostane', 'fumonisins b1', 'iodine', 'l-glutamate',
-                          'lactosylceramide', 'methylecgonidine', 'n-acetyl-l-aspartate', 'nad+', 'nadph oxidase',
-                          'neuromelanin', 'nicotinic acid (na)', 'nmn', 'pip2', 'sphingomyelin', 'thf'}
-    wikipathways_name_normalization = {"Ca 2+": "ca 2+", "acetyl coa": "acetyl-coa", "acetyl-coa(mit)": "acetyl-coa",
-                                       "h20": "h2o"}
-
-    # Entities in Reactome that required manual curation
-    black_list_reactome = {"5'"}
-    reactome_prot = {'phospho-g2/m transition proteins', 'integrin alpha5beta1, integrin alphavbeta3, cd47',
-                     'food proteins', 'activated fgfr2', 'adherens junction-associated proteins',
-                     'pi3k mutants,activator:pi3k', 'prolyl 3-hydroxylases', 'gpi-anchored proteins', 'c3d, c3dg, ic3b',
-                     'c4s/c6s chains', 'activated fgfr1 mutants and fusions', 'activated fgfr3 mutants', 'protein',
-                     'cyclin a2:cdk2 phosphorylated g2/m transition protein', 'c4c, c3f', 'activated raf/ksr1',
-                     'activated fgfr1 mutants', 'g2/m transition proteins', 'lman family receptors', 'cyclin',
-                     'usp12:wdr48:wdr20,usp26', 'proteins with cleaved gpi-anchors', 'activated fgfr2 mutants',
-                     'c4d, ic3b', 'c5b:c6:c7, c8, c9', 'cyclin a1:cdk2 phosphorylated g2/m transition protein',
-                     'genetically or chemically inactive braf', 'il13-downregulated proteins',
-                     'activated fgfr4 mutants', 'rna-binding protein in rnp (ribonucleoprotein) complexes',
-                     'effector proteins', 'usp3, saga complex', 'dephosphorylated "receiver" raf/ksr1'}
-
     gene_nodes = set()
     mirna_nodes = set()
     metabolite_nodes = set()
@@ -178,7 +88,7 @@ def calculate_database_sets(nodes, database):
                     reactome_cell = munge_reactome_gene(name)
                     if isinstance(reactome_cell, list):
                         for name in reactome_cell:
-                            if name in black_list_reactome:  # Filter entities in black list
+                            if name in REACTOME_BLACK_LIST:  # Filter entities in black list
                                 continue
                             elif name.startswith("("):  # remove redundant parentheses
                                 name = name.strip("(").strip(")")
@@ -189,7 +99,7 @@ def calculate_database_sets(nodes, database):
                     continue
 
                 # WikiPathways and KEGG do not require any processing of genes
-                if name in wikipathways_biol_process:
+                if name in WIKIPATHWAYS_BIOL_PROCESS:
                     bp_nodes.add(name)
                     continue
                 gene_nodes.add(name)
@@ -202,21 +112,21 @@ def calculate_database_sets(nodes, database):
 
             if database == 'wikipathways':
                 # Biological processes that are captured as abundance in BEL since they were characterized wrong in WikiPathways
-                if name in wikipathways_biol_process:
+                if name in WIKIPATHWAYS_BIOL_PROCESS:
                     bp_nodes.add(name)
                     continue
 
-                elif node.namespace in {'WIKIDATA', 'WIKIPATHWAYS', 'REACTOME'} and name not in wikipathways_metab:
+                elif node.namespace in {'WIKIDATA', 'WIKIPATHWAYS', 'REACTOME'} and name not in WIKIPATHWAYS_METAB:
                     bp_nodes.add(name)
                     continue
 
                 # Fix naming in duplicate entity
-                if name in wikipathways_name_normalization:
-                    name = wikipathways_name_normalization[name]
+                if name in WIKIPATHWAYS_NAME_NORMALIZATION:
+                    name = WIKIPATHWAYS_NAME_NORMALIZATION[name]
 
             elif database == 'reactome':
                 # Curated proteins that were coded as metabolites
-                if name in reactome_prot:
+                if name in REACTOME_PROT:
                     gene_nodes.add(name)
                     continue
 
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+"""Batched permutation engine for the Monte Carlo normalization of diffusion scores."""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+import numpy as np
+from diffupy.constants import BER_P, MC
+from diffupy.matrix import Matrix
+
+from .kernel_diffusion import _get_output_cols_labels, kernel_product
+from .resources import init_worker, limit_blas_threads
+
+log = logging.getLogger(__name__)
+
+#: Number of permuted input columns diffused with a single kernel product
+PERMUTATION_BATCH_SIZE = 256
+
+#: Kernel and input shared by the permutation batches of a worker process
+_worker_state = {}
+
+
+class PermutationResult(NamedTuple):
+    """Raw diffusion scores and their permutation null distribution, as (nodes x input columns) arrays."""
+
+    #: Raw diffusion scores of the input
+    raw: np.ndarray
+    #: Empirical p-values, as (number of permuted scores >= raw scores + 1) / (number of permutations + 1)
+    p_values: np.ndarray
+    #: Means of the permuted scores
+    means: np.ndarray
+    #: Standard deviations of the permuted scores
+    stds: np.ndarray
+    #: Number of permutations
+    n_permutations: int
+
+
+def permutation_test(
+    input_scores: np.ndarray,
+    kernel: Matrix,
+    n_permutations: int = 10000,
+    batch_size: int = PERMUTATION_BATCH_SIZE,
+    workers: Optional[int] = 1,
+    seed: Optional[int] = None,
+    background: Optional[np.ndarray] = None,
+    blas_threads: Optional[int] = None,
+) -> PermutationResult:
+    """Compare the raw diffusion scores of the input columns with those of permuted inputs.
+
+    Permuted inputs are generated in batches, each batch of every input column diffused with one kernel product. The
+    exceedance counts and the moments of the permuted scores are accumulated batch by batch, so memory only depends on
+    the batch size. Each batch draws from its own stream, spawned from the seed, so results do not depend on the number
+    of workers.
+
+    :param input_scores: Input scores (nodes x columns), with rows matching the kernel rows.
+    :param kernel: Network as a kernel (dense, sparse or packed).
+    :param n_permutations: Number of permutations of each input column.
+    :param batch_size: Number of permutations diffused at once.
+    :param workers: Number of worker processes the batches are sharded over. None for the number of CPUs, 1 to run
+     the batches in the current process.
+    :param seed: Seed of the random streams.
+    :param background: Optional boolean mask of the nodes whose scores are permuted (by default all the nodes).
+    :param blas_threads: Optional number of BLAS threads of each worker (see :mod:`diffupath.resources`).
+    """
+    input_scores = np.asarray(input_scores, dtype=float)
+    if input_scores.ndim == 1:
+        input_scores = input_scores[:, np.newaxis]
+
+    raw = kernel_product(kernel, input_scores)
+
+    batch_sizes = [min(batch_size, n_permutations - start) for start in range(0, n_permutations, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+    state = (kernel, input_scores, raw, background)
+    workers = workers or os.cpu_count() or 1
+
+    n, exceedances, means, m2 = 0, np.zeros(raw.shape), np.zeros(raw.shape), np.zeros(raw.shape)
+
+    # Folded in as they arrive, in batch order, so that the moments are reproducible and no batch is kept
+    batches = _iter_batches(state, batch_sizes, seeds, workers, blas_threads)
+    for batch_n, batch_exceedances, batch_means, batch_m2 in batches:
+        exceedances += batch_exceedances
+        n, means, m2 = _combine_moments(n, means, m2, batch_n, batch_means, batch_m2)
+
+    log.info(f'{n_permutations} permutations of {input_scores.shape[1]} input columns diffused.')
+
+    return PermutationResult(
+        raw=raw,
+        p_values=(exceedances + 1) / (n_permutations + 1),
+        means=means,
+        stds=np.sqrt(m2 / max(n - 1, 1)),
+        n_permutations=n_permutations,
+    )
+
+
+def diffuse_by_permutations(
+    scores: Matrix,
+    method: str,
+    kernel: Matrix,
+    n_permutations: int = 10000,
+    batch_size: int = PERMUTATION_BATCH_SIZE,
+    workers: Optional[int] = 1,
+    seed: Optional[int] = None,
+    blas_threads: Optional[int] = None,
+) -> Matrix:
+    """Run a permutation-based diffusion method over a precomputed kernel.
+
+    - mc: 1 - the empirical p-value of the raw scores
+    - ber_p: raw scores weighted by -log10 of their empirical p-value
+
+    :param scores: Input scores as a Matrix.
+    :param method: Elected method ["mc", "ber_p"].
+    :param kernel: Network as a kernel.
+    :param n_permutations: Number of permutations of each input column.
+    :param batch_size: Number of permutations diffused at once.
+    :param workers: Number of worker processes the batches are sharded over.
+    :param seed: Seed of the random streams.
+    :param blas_threads: Optional number of BLAS threads of each worker.
+    """
+    if method not in {MC, BER_P}:
+        raise ValueError(f'Method not supported for permutation-based diffusion: {method}')
+
+    scores = scores.match_rows(kernel)
+
+    result = permutation_test(
+        scores.mat,
+        kernel,
+        n_permutations=n_permutations,
+        batch_size=batch_size,
+        workers=workers,
+        seed=seed,
+        blas_threads=blas_threads,
+    )
+
+    if method == MC:
+        diffused = 1 - result.p_values
+    else:
+        diffused = result.raw * -np.log10(result.p_values)
+
+    return Matrix(
+        diffused,
+        rows_labels=scores.rows_labels,
+        cols_labels=_get_output_cols_labels(scores),
+        name=scores.name,
+    )
+
+
+"""Helper functions"""
+
+
+def _init_worker(kernel: Matrix, input_scores: np.ndarray, raw: np.ndarray, background: Optional[np.ndarray]):
+    """Share the kernel and input with the batches run by a (worker) process, so they are only transferred once."""
+    _worker_state.update(kernel=kernel, input_scores=input_scores, raw=raw, background=background)
+
+
+def _iter_batches(state: tuple, batch_sizes: list, seeds: list, workers: int, blas_threads: Optional[int]):
+    """Yield the results of the permutation batches in batch order, run in this process or in worker processes."""
+    if workers == 1 or len(batch_sizes) == 1:
+        _init_worker(*state)
+        try:
+            with limit_blas_threads(blas_threads):
+                for size, batch_seed in zip(batch_sizes, seeds):
+                    yield _run_batch(size, batch_seed)
+        finally:
+            _worker_state.clear()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(blas_threads, _init_worker, state),
+        ) as executor:
+            yield from executor.map(_run_batch, batch_sizes, seeds)
+
+
+def _run_batch(size: int, seed: np.random.SeedSequence) -> tuple:
+    """Diffuse a batch of permutations of every input column, returning its exceedance counts and moments."""
+    kernel, input_scores, raw = _worker_state['kernel'], _worker_state['input_scores'], _worker_state['raw']
+    background = _worker_state['background']
+
+    rng = np.random.default_rng(seed)
+    n_nodes, n_cols = input_scores.shape
+
+    # Permuted columns stacked as (nodes x (columns * batch size)), the permutations of each column contiguous
+    permuted = np.repeat(input_scores, size, axis=1)
+
+    if background is None:
+        permuted = rng.permuted(permuted, axis=0)
+    else:
+        permuted[background] = rng.permuted(permuted[background], axis=0)
+
+    diffused = kernel_product(kernel, permuted).reshape(n_nodes, n_cols, size)
+
+    means = diffused.mean(axis=2)
+
+    return (
+        size,
+        np.sum(diffused >= raw[:, :, np.newaxis], axis=2),
+        means,
+        np.sum(np.square(diffused - means[:, :, np.newaxis]), axis=2),
+    )
+
+
+def _combine_moments(n_a: int, means_a: np.ndarray, m2_a: np.ndarray, n_b: int, means_b: np.ndarray, m2_b: np.ndarray):
+    """Combine the counts, means and sums of squared deviations of two samples (Chan et al. parallel algorithm)."""
+    n = n_a + n_b
+    delta = means_b - means_a
+
+    return n, means_a + delta * n_b / n, m2_a + m2_b + np.square(delta) * n_a * n_b / n
@@ -6,13 +6,14 @@ from typing import Union, Tuple, List, Dict, Optional
 
 import networkx as nx
 import numpy as np
-from diffupy.diffuse_raw import diffuse_raw
 from diffupy.matrix import Matrix
 from diffupy.process_input import format_input_for_diffusion, process_input_data, \
     _type_dict_label_scores_dict_data_struct_check, _type_dict_label_list_data_struct_check, map_labels_input
 from sklearn import metrics
 from tqdm import tqdm
 
+from .bootstrap import store_scores
+from .kernel_diffusion import diffuse_on_kernel
 from .topological_analyses import generate_pagerank_baseline
 from .utils import split_random_two_subsets
 
@@ -22,14 +23,17 @@ from .utils import split_random_two_subsets
 def validation_by_method(mapping_input: Union[List, Dict[str, List]],
                          graph: nx.Graph,
                          kernel: Matrix,
-                         k: Optional[int] = 100
+                         k: Optional[int] = 100,
+                         scores_store: Optional[Dict[str, list]] = None,
                          ) -> Tuple[Dict[str, list], Dict[str, list]]:
     """Repeated holdout validation by diffustion method.
 
     :param mapping_input: List or value dictionary of labels {'label':value}.
     :param graph: Network as a graph object.
-    :param kernel: Network as a kernel.
+    :param kernel: Network as a kernel (dense or sparse).
     :param k: Iterations for the repeated_holdout validation.
+    :param scores_store: Optional dictionary keeping the validation labels and scores of every iteration by method,
+     for the bootstrap confidence intervals (see :mod:`diffupath.bootstrap`).
     """
     auroc_metrics = defaultdict(list)
     auprc_metrics = defaultdict(list)
@@ -39,8 +43,8 @@ def validation_by_method(mapping_input: Union[List, Dict[str, List]],
             mapping_input, kernel
         )
 
-        scores_z = diffuse_raw(graph=None, scores=input_diff, k=kernel, z=True)
-        scores_raw = diffuse_raw(graph=None, scores=input_diff, k=kernel, z=False)
+        scores_z = diffuse_on_kernel(input_diff, kernel, z=True)
+        scores_raw = diffuse_on_kernel(input_diff, kernel, z=False)
         scores_page_rank = generate_pagerank_baseline(graph, kernel)
 
         method_validation_scores = {
@@ -62,6 +66,8 @@ def validation_by_method(mapping_input: Union[List, Dict[str, List]],
         }
 
         for method, validation_set in method_validation_scores.items():
+            store_scores(scores_store, method, *validation_set)
+
             try:
                 auroc, auprc = _get_metrics(*validation_set)
             except ValueError:
@@ -78,7 +84,8 @@ def validation_by_subgraph(mapping_input,
                            kernels: Dict[str, List[Matrix]],
                            universe_kernel: Optional[Matrix] = None,
                            z_normalization: Optional[bool] = True,
-                           k: Optional[int] = 100
+                           k: Optional[int] = 100,
+                           scores_store: Optional[Dict[Tuple[str, str], list]] = None,
                            ) -> Tuple[Dict[str, Dict[str, List]], Dict[str, Dict[str, List]]]:
     """Repeated holdout validation by subgraph.
 
@@ -87,6 +94,8 @@ def validation_by_subgraph(mapping_input,
     :param universe_kernel: Network as an integrated kernel.
     :param z_normalization: Flag for the statistical normalization option.
     :param k: Iterations for the repeated_holdout validation.
+    :param scores_store: Optional dictionary keeping the validation labels and scores of every iteration by
+     (background, database), for the bootstrap confidence intervals (see :mod:`diffupath.bootstrap`).
     """
     auroc_metrics = defaultdict(lambda: defaultdict(lambda: list()))
     auprc_metrics = defaultdict(lambda: defaultdict(lambda: list()))
@@ -122,14 +131,12 @@ def validation_by_subgraph(mapping_input,
                 input_diff_universe, validation_diff_universe = _get_random_cv_split_input_and_validation(data_input_i,
                                                                                                           universe_kernel)
 
-                scores_on_subgraph = diffuse_raw(graph=None,
-                                                 scores=input_diff,
-                                                 k=kernel,
-                                                 z=z_normalization)
-                scores_on_universe = diffuse_raw(graph=None,
-                                                 scores=input_diff_universe,
-                                                 k=universe_kernel,
-                                                 z=z_normalization)
+                scores_on_subgraph = diffuse_on_kernel(input_diff,
+                                                       kernel,
+                                                       z=z_normalization)
+                scores_on_universe = diffuse_on_kernel(input_diff_universe,
+                                                       universe_kernel,
+                                                       z=z_normalization)
 
                 subgraph_validation_scores[type]['subgraph'] = (validation_diff, scores_on_subgraph)
                 subgraph_validation_scores[type]['PathMeUniverse'] = (validation_diff_universe, scores_on_universe)
@@ -143,6 +150,9 @@ def validation_by_subgraph(mapping_input,
                 auroc_sg, auprc_sg = (0, 0)
                 auroc_pu, auprc_pu = (0, 0)
             else:
+                store_scores(scores_store, ('subgraph', type), *validation_set['subgraph'])
+                store_scores(scores_store, ('PathMeUniverse', type), *validation_set['PathMeUniverse'])
+
                 try:
                     auroc_sg, auprc_sg = _get_metrics(*validation_set['subgraph'])
                     auroc_pu, auprc_pu = _get_metrics(*validation_set['PathMeUniverse'])
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""Headless rendering of the figures of a metrics table, as files, on worker processes.
+
+Figures are drawn on standalone matplotlib figures (Agg canvas), without pyplot nor its interactive backends. The
+frame of every figure is fingerprinted, so that re-rendering a report only redraws the figures whose data changed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .resources import AUTO, map_tasks, plan_resources
+from .results import ITERATION_COLUMN, VALUE_COLUMN
+from .statistic_tests import TTEST, get_paired_tests
+
+log = logging.getLogger(__name__)
+
+#: Figure kinds: metric box plots and FDR bar charts of the paired tests between methods
+BOX_PLOT = 'box'
+FDR_BARCHART = 'fdr'
+
+#: Default format of the figure files
+FIGURE_FORMAT = 'png'
+
+#: File of the rendered figures fingerprints, in the report directory
+REPORT_MANIFEST_FILE_NAME = '.report.json'
+
+#: Column of the compared pairs and of their -log10(q) in the FDR bar chart frames
+COMPARISON_COLUMN = 'comparison'
+SIGNIFICANCE_COLUMN = '-log10(q)'
+
+#: Column of the subplots of the figures
+PANEL_COLUMN = 'dataset'
+
+
+class ReportFigure(NamedTuple):
+    """Data and layout of a report figure."""
+
+    #: Figure kind, box plot or FDR bar chart
+    kind: str
+    #: Long frame of the plotted values
+    frame: pd.DataFrame
+    #: Column of the abscissa
+    x: str
+    #: Column of the ordinates
+    y: str
+    #: Column of the subplots, if any
+    panel: Optional[str] = None
+    #: Column of the colors, if any
+    hue: Optional[str] = None
+    #: Title of the figure
+    title: str = ''
+    #: Ordinate of the significance threshold line, if any
+    threshold: Optional[float] = None
+
+
+def get_report_figures(
+    table: pd.DataFrame,
+    test: str = TTEST,
+    alpha: float = 0.05,
+) -> Dict[str, ReportFigure]:
+    """Split a metrics table into the figures of its report.
+
+    The last level of the table (e.g. method or database) is compared on the abscissa, datasets are plotted as
+    subplots and the level before the compared one (e.g. background or entity type), if any, as colors. Every other
+    level (e.g. metric) gets its own figures: a box plot of the metrics and a bar chart of the FDR-corrected paired
+    tests between the compared levels.
+
+    :param table: Long metrics table (see :func:`diffupath.results.metrics_to_table`).
+    :param test: Paired test of the bar charts, "t" or "wilcoxon".
+    :param alpha: False discovery rate of the bar charts.
+    :return: Figures by name.
+    """
+    levels = [column for column in table.columns if column not in {ITERATION_COLUMN, VALUE_COLUMN}]
+
+    x = levels[-1]
+    panel = PANEL_COLUMN if PANEL_COLUMN in levels[:-1] else None
+    hue = levels[-2] if len(levels) > 1 and levels[-2] not in {panel, 'metric'} else None
+    figure_levels = [level for level in levels if level not in {x, panel, hue}]
+
+    tests = get_paired_tests(
+        table, method_column=x, strata=figure_levels + [level for level in (panel, hue) if level], test=test,
+        alpha=alpha,
+    )
+
+    # Labels of the compared pairs, built column-wise
+    comparisons = tests['method_a'].astype(str) + ' vs ' + tests['method_b'].astype(str)
+    if hue is not None:
+        comparisons = tests[hue].astype(str) + ': ' + comparisons
+
+    tests[COMPARISON_COLUMN] = comparisons
+    with np.errstate(divide='ignore'):
+        tests[SIGNIFICANCE_COLUMN] = -np.log10(tests['q_value'])
+
+    figures = {}
+
+    for keys, frame in _split(table, figure_levels):
+        name = _get_figure_name(keys)
+        title = ' '.join(str(key) for key in keys)
+
+        figures[f'{name}_{BOX_PLOT}'] = ReportFigure(
+            BOX_PLOT, frame[[level for level in (panel, hue, x) if level] + [VALUE_COLUMN]].reset_index(drop=True),
+            x=x, y=VALUE_COLUMN, panel=panel, hue=hue, title=title,
+        )
+
+    for keys, frame in _split(tests, figure_levels):
+        columns = [level for level in (panel,) if level] + [COMPARISON_COLUMN, SIGNIFICANCE_COLUMN]
+
+        figures[f'{_get_figure_name(keys)}_{FDR_BARCHART}'] = ReportFigure(
+            FDR_BARCHART, frame[columns].reset_index(drop=True),
+            x=COMPARISON_COLUMN, y=SIGNIFICANCE_COLUMN, hue=panel,
+            title=f'{" ".join(str(key) for key in keys)} paired {test}-tests (FDR {alpha})'.strip(),
+            threshold=float(-np.log10(alpha)),
+        )
+
+    return figures
+
+
+def get_figure_fingerprint(figure: ReportFigure, figure_format: str = FIGURE_FORMAT) -> str:
+    """Return the fingerprint of the data and layout of a figure.
+
+    :param figure: Report figure.
+    :param figure_format: Format of the figure file.
+    """
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(figure.frame, index=False).values.tobytes())
+    digest.update(json.dumps([list(figure.frame.columns), figure._replace(frame=None), figure_format]).encode())
+
+    return digest.hexdigest()
+
+
+def render_figure(figure: ReportFigure, path: str) -> str:
+    """Draw a figure on an Agg canvas and save it.
+
+    :param figure: Report figure.
+    :param path: Path to the figure file, its extension giving the format.
+    :return: Path to the figure file.
+    """
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    panels = list(figure.frame[figure.panel].unique()) if figure.kind == BOX_PLOT and figure.panel else [None]
+
+    fig = Figure(figsize=(6 * len(panels), 6) if figure.kind == BOX_PLOT else (14.5, 7.5))
+    axs = fig.subplots(1, len(panels), squeeze=False)[0]
+
+    for i, (ax, panel) in enumerate(zip(axs, panels)):
+        frame = figure.frame if panel is None else figure.frame[figure.frame[figure.panel] == panel]
+
+        if figure.kind == BOX_PLOT:
+            sns.boxplot(x=figure.x, y=figure.y, hue=figure.hue, data=frame, ax=ax)
+            ax.set_ylim([0, 1])
+            ax.set_title(panel or '', fontweight='bold')
+        else:
+            sns.barplot(x=figure.x, y=figure.y, hue=figure.hue, data=frame, ax=ax)
+
+        if figure.threshold is not None:
+            ax.axhline(figure.threshold, color='k', linestyle='--')
+
+        ax.yaxis.grid(True)
+        ax.set_xlabel(figure.x, fontweight='bold')
+        ax.set_ylabel(figure.y if i == 0 else '', fontweight='bold')
+
+        for label in ax.get_xticklabels():
+            label.set_rotation(-25)
+            label.set_horizontalalignment('left')
+            label.set_rotation_mode('anchor')
+
+    fig.suptitle(figure.title, fontweight='bold')
+    fig.savefig(path, bbox_inches='tight')
+
+    return path
+
+
+def render_report(
+    table: pd.DataFrame,
+    output: str,
+    figure_format: str = FIGURE_FORMAT,
+    workers: Union[int, str, None] = AUTO,
+    force: bool = False,
+    **kwargs,
+) -> Dict[str, str]:
+    """Render the figures of a metrics table to a directory, redrawing only the figures whose data changed.
+
+    :param table: Long metrics table (see :func:`diffupath.results.metrics_to_table`).
+    :param output: Directory of the figures.
+    :param figure_format: Format of the figure files (e.g. png, svg or pdf).
+    :param workers: Number of worker processes the figures are rendered on, or "auto".
+    :param force: Flag to redraw every figure.
+    :param kwargs: Options of :func:`get_report_figures` (test and alpha).
+    :return: Paths to the redrawn figure files, by figure name.
+    """
+    os.makedirs(output, exist_ok=True)
+
+    manifest_path = os.path.join(output, REPORT_MANIFEST_FILE_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+
+    figures = get_report_figures(table, **kwargs)
+    fingerprints = {name: get_figure_fingerprint(figure, figure_format) for name, figure in figures.items()}
+    paths = {name: os.path.join(output, f'{name}.{figure_format}') for name in figures}
+
+    stale = [
+        name
+        for name in figures
+        if manifest.get(name) != fingerprints[name] or not os.path.exists(paths[name])
+    ]
+    log.info(f'{len(stale)} of {len(figures)} figures to redraw')
+
+    resources = plan_resources(workers, blas_threads=1, n_tasks=len(stale))
+    map_tasks(render_figure, [(figures[name], paths[name]) for name in stale], resources)
+
+    with open(manifest_path, 'w') as file:
+        json.dump(fingerprints, file, indent=2)
+
+    return {name: paths[name] for name in stale}
+
+
+"""Helper functions"""
+
+
+def _split(frame: pd.DataFrame, levels: List[str]):
+    """Iterate over the (keys, frame) groups of the levels, the whole frame if there are no levels."""
+    if not levels:
+        yield (), frame
+        return
+
+    for keys, group in frame.groupby(levels, sort=False):
+        yield (keys if isinstance(keys, tuple) else (keys,)), group
+
+
+def _get_figure_name(keys: tuple) -> str:
+    """Return a file name for the figures of the given keys."""
+    name = '_'.join(str(key) for key in keys) or 'metrics'
+
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
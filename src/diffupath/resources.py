@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""Split of the cores between worker processes and the BLAS threads of each of them, so they do not oversubscribe."""
+
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+
+from threadpoolctl import threadpool_limits
+
+log = logging.getLogger(__name__)
+
+#: Value of the workers and BLAS threads options chosen from the kernel size and the number of cores
+AUTO = 'auto'
+
+#: Kernel nodes per BLAS thread in the auto mode, smaller kernel products do not gain from more threads
+NODES_PER_BLAS_THREAD = 4000
+
+#: Suffix of the run reports, written next to the outputs
+RUN_REPORT_SUFFIX = '.run.json'
+
+#: Limits of the BLAS thread pools of a worker process, kept for the worker lifetime
+_worker_limits = []
+
+
+class ResourceConfig(NamedTuple):
+    """Number of worker processes and BLAS threads per worker of a run."""
+
+    #: Number of worker processes
+    workers: int
+    #: Number of BLAS threads of each worker
+    blas_threads: int
+    #: Number of cores available to the run
+    n_cores: int
+    #: Number of kernel nodes the split was chosen for, if known
+    n_nodes: Optional[int] = None
+    #: Whether the split was (partially) chosen automatically
+    auto: bool = False
+
+
+def get_n_cores() -> int:
+    """Return the number of cores available to the current process."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def plan_resources(
+    workers: Union[int, str, None] = AUTO,
+    blas_threads: Union[int, str, None] = AUTO,
+    n_nodes: Optional[int] = None,
+    n_tasks: Optional[int] = None,
+    n_cores: Optional[int] = None,
+) -> ResourceConfig:
+    """Split the cores between worker processes and BLAS threads.
+
+    In the auto mode, kernel products are given a BLAS thread per NODES_PER_BLAS_THREAD kernel nodes and the rest of
+    cores go to worker processes (at most one per task), any core left being given back to the BLAS threads. If only
+    one of both is given, the other takes the rest of cores.
+
+    :param workers: Number of worker processes, or "auto" (None as "auto").
+    :param blas_threads: Number of BLAS threads per worker, or "auto" (None as "auto").
+    :param n_nodes: Number of kernel nodes, if known.
+    :param n_tasks: Number of tasks the workers share, if known.
+    :param n_cores: Number of cores. By default those available to the current process.
+    """
+    n_cores = n_cores or get_n_cores()
+    workers, blas_threads = _parse_option(workers), _parse_option(blas_threads)
+    auto = workers is None or blas_threads is None
+
+    if workers is None and blas_threads is None:
+        blas_threads = min(n_cores, max(1, (n_nodes or 0) // NODES_PER_BLAS_THREAD))
+        workers = max(1, min(n_cores // blas_threads, n_tasks or n_cores))
+        blas_threads = max(1, n_cores // workers)
+
+    elif workers is None:
+        workers = max(1, min(n_cores // blas_threads, n_tasks or n_cores))
+
+    elif blas_threads is None:
+        blas_threads = max(1, n_cores // workers)
+
+    if workers * blas_threads > n_cores:
+        log.warning(f'{workers} workers with {blas_threads} BLAS threads each oversubscribe the {n_cores} cores.')
+
+    return ResourceConfig(workers=workers, blas_threads=blas_threads, n_cores=n_cores, n_nodes=n_nodes, auto=auto)
+
+
+@contextmanager
+def limit_blas_threads(blas_threads: Optional[int]):
+    """Limit the BLAS thread pools of the current process within the context.
+
+    :param blas_threads: Number of BLAS threads. None for no limit.
+    """
+    if blas_threads is None:
+        yield
+        return
+
+    with threadpool_limits(limits=blas_threads, user_api='blas'):
+        yield
+
+
+def init_worker(blas_threads: Optional[int], initializer: Optional[Callable] = None, initargs: tuple = ()):
+    """Limit the BLAS threads of a worker process for its lifetime, then run its own initializer.
+
+    Meant as the initializer of process pools, e.g. ``ProcessPoolExecutor(initializer=init_worker, initargs=...)``.
+
+    :param blas_threads: Number of BLAS threads of the worker. None for no limit.
+    :param initializer: Optional initializer of the worker.
+    :param initargs: Arguments of the initializer.
+    """
+    if blas_threads is not None:
+        _worker_limits.append(threadpool_limits(limits=blas_threads, user_api='blas'))
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def map_tasks(function: Callable, tasks: List[tuple], resources: ResourceConfig) -> list:
+    """Run a function over tasks (its argument tuples) on the workers, each limited to its BLAS threads.
+
+    :param function: Picklable function run for each task.
+    :param tasks: Arguments of each call.
+    :param resources: Workers and BLAS threads split.
+    :return: Results, in the order of the tasks.
+    """
+    if resources.workers == 1 or len(tasks) <= 1:
+        with limit_blas_threads(resources.blas_threads):
+            return [function(*task) for task in tasks]
+
+    with ProcessPoolExecutor(
+        max_workers=min(resources.workers, len(tasks)),
+        initializer=init_worker,
+        initargs=(resources.blas_threads,),
+    ) as executor:
+        return list(executor.map(function, *zip(*tasks)))
+
+
+def write_run_report(output: str, resources: ResourceConfig, **fields: Any) -> str:
+    """Record the resources (and other fields) of a run next to its output, as '<output>.run.json'.
+
+    :param output: Path to the output of the run.
+    :param resources: Workers and BLAS threads split of the run.
+    :param fields: Other fields of the report.
+    :return: Path to the run report.
+    """
+    path = f'{os.path.splitext(output)[0]}{RUN_REPORT_SUFFIX}'
+
+    report: Dict[str, Any] = {'resources': resources._asdict()}
+    report.update(fields)
+
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2, default=str)
+
+    return path
+
+
+"""Helper functions"""
+
+
+def _parse_option(value: Union[int, str, None]) -> Optional[int]:
+    """Parse a workers or BLAS threads option, returning None for the auto mode."""
+    if value is None or value == AUTO:
+        return None
+
+    value = int(value)
+    if value < 1:
+        raise ValueError(f'The number of workers and BLAS threads must be positive or "{AUTO}", not {value}.')
+
+    return value
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""On-disk cache of diffusion results, keyed by kernel and input fingerprints, with least recently used eviction."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+import networkx as nx
+import numpy as np
+from diffupy.matrix import Matrix
+from scipy import sparse
+
+from .cache import prune_cache, record_access
+from .constants import DEFAULT_DIFFUPATH_DIR
+from .kernel_io import is_kernel_file, read_kernel_header
+from .label_index import _get_input_columns, normalize_labels
+from .results import NPZ, read_scores, write_scores
+
+log = logging.getLogger(__name__)
+
+#: Directory of the cached results
+RESULTS_CACHE_DIR = os.path.join(DEFAULT_DIFFUPATH_DIR, 'results')
+
+#: Default disk budget of the cached results, in bytes
+RESULTS_CACHE_SIZE = 2 * 1024 ** 3
+
+
+def get_network_fingerprint(network, **params: Any) -> str:
+    """Return a fingerprint of the network the kernel stems from, without loading it when it is a file.
+
+    - kernel files: the checksum of their body, stored in their header
+    - other files: their path, size and modification time
+    - graphs: a hash of their nodes and edges (with their attributes)
+    - kernels: a hash of their labels and matrix
+
+    :param network: Path to the network, or the network as a graph or as a kernel.
+    :param params: Parameters the kernel is computed (or filtered) with, e.g. the kernel method or databases.
+    """
+    network_hash = hashlib.sha256()
+
+    if isinstance(network, str) and is_kernel_file(network):
+        network_hash.update(read_kernel_header(network)['checksum']['body'].encode())
+
+    elif isinstance(network, str):
+        stat = os.stat(network)
+        network_hash.update(f'{os.path.abspath(network)}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+
+    elif isinstance(network, Matrix):
+        network_hash.update(json.dumps(list(network.rows_labels)).encode())
+
+        if sparse.issparse(network.mat):
+            for array in (network.mat.data, network.mat.indices, network.mat.indptr):
+                network_hash.update(np.ascontiguousarray(array).data)
+        else:
+            network_hash.update(np.ascontiguousarray(network.mat).data)
+
+    elif isinstance(network, nx.Graph):
+        network_hash.update(_dumps(sorted(map(str, network.nodes))).encode())
+        edges = sorted(
+            _dumps([str(u), str(v), data] if network.is_directed() else sorted([str(u), str(v)]) + [data])
+            for u, v, data in network.edges(data=True)
+        )
+        network_hash.update(_dumps(edges).encode())
+
+    else:
+        raise ValueError(f'Networks of type {type(network).__name__} can not be fingerprinted.')
+
+    network_hash.update(_dumps(params).encode())
+
+    return network_hash.hexdigest()
+
+
+def get_input_fingerprint(processed_input) -> str:
+    """Return a fingerprint of a processed input, independent of the order and munging of its labels.
+
+    :param processed_input: Processed input as a label list, a label-scores dict or a type dict of any of them.
+    """
+    columns = {}
+
+    for col_label, (labels, scores) in _get_input_columns(processed_input).items():
+        columns[str(col_label)] = sorted(zip(normalize_labels(labels).tolist(), np.asarray(scores, float).tolist()))
+
+    return hashlib.sha256(_dumps(columns).encode()).hexdigest()
+
+
+def get_request_key(network_fingerprint: str, processed_inputs: Dict[str, Any], **params: Any) -> str:
+    """Return the cache key of a diffusion request.
+
+    :param network_fingerprint: Fingerprint of the network.
+    :param processed_inputs: Processed inputs, by codification.
+    :param params: Parameters of the request, e.g. the methods and the input processing flags.
+    """
+    request = {
+        'network': network_fingerprint,
+        'inputs': {
+            codification: get_input_fingerprint(processed_input)
+            for codification, processed_input in processed_inputs.items()
+        },
+        'params': params,
+    }
+
+    return hashlib.sha256(_dumps(request).encode()).hexdigest()
+
+
+def get_cached_results(key: str, cache_dir: str = RESULTS_CACHE_DIR) -> Optional[Matrix]:
+    """Return the cached results of a request, if any, recording the access for the eviction.
+
+    :param key: Cache key of the request.
+    :param cache_dir: Directory of the cached results.
+    """
+    path = _get_results_path(key, cache_dir)
+
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        results = read_scores(path)
+    except (IOError, ValueError, KeyError):
+        log.warning(f'Unreadable cached results are ignored: {path}')
+        return None
+
+    record_access(path, cache_dir)
+
+    return results
+
+
+def cache_results(
+    key: str,
+    results: Matrix,
+    cache_dir: str = RESULTS_CACHE_DIR,
+    max_size: Optional[int] = RESULTS_CACHE_SIZE,
+    build_seconds: Optional[float] = None,
+) -> str:
+    """Store the results of a request, evicting the least recently used results beyond the disk budget.
+
+    :param key: Cache key of the request.
+    :param results: Diffusion scores as a Matrix.
+    :param cache_dir: Directory of the cached results.
+    :param max_size: Disk budget of the cached results, in bytes. None for no eviction.
+    :param build_seconds: Optional time spent computing the results.
+    :return: Path to the cached results.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    path = _get_results_path(key, cache_dir)
+
+    # Written to a temporary file first, so that concurrent requests never read partial results
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.', suffix=f'.{NPZ}')
+    os.close(fd)
+
+    write_scores(results, tmp_path, output_format=NPZ)
+    os.replace(tmp_path, path)
+
+    record_access(path, cache_dir, build_seconds=build_seconds)
+
+    if max_size is not None:
+        prune_cache(max_size, cache_dir)
+
+    return path
+
+
+"""Helper functions"""
+
+
+def _get_results_path(key: str, cache_dir: str) -> str:
+    """Return the path to the cached results of a request."""
+    return os.path.join(cache_dir, f'{key}.{NPZ}')
+
+
+def _dumps(obj) -> str:
+    """Serialize to JSON deterministically, with non serializable values (e.g. callables) by their name."""
+    return json.dumps(obj, sort_keys=True, default=lambda value: getattr(value, '__name__', str(value)))
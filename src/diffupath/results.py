@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+
+"""Output of the diffusion results and validation metrics: selection of the top nodes, columnar files and tables."""
+
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from diffupy.constants import CSV, JSON, TSV
+from diffupy.matrix import Matrix
+
+from .constants import BY_DB, BY_ENTITY_DB, BY_ENTITY_METHOD, BY_METHOD, KFOLD, LOO, LTOO
+
+log = logging.getLogger(__name__)
+
+#: Columns of the selected scores table
+NODE_COLUMN = 'Node'
+TYPE_COLUMN = 'Type'
+SCORES_COLUMN = 'Column'
+SCORE_COLUMN = 'Score'
+
+#: Output formats, besides CSV, TSV and JSON
+PARQUET = 'parquet'
+FEATHER = 'feather'
+NPZ = 'npz'
+HDF5 = 'h5'
+
+#: Formats given by the extension of diffusion outputs, which are otherwise written as CSV unless requested
+EXTENSION_FORMATS = frozenset([PARQUET, FEATHER, NPZ, HDF5])
+
+#: Key of the tables in HDF5 files
+HDF5_KEY = 'table'
+
+#: Columns of the metrics tables, besides the levels of the nested metrics
+ITERATION_COLUMN = 'iteration'
+VALUE_COLUMN = 'value'
+
+#: Levels of the nested metrics of each evaluation comparison
+METRICS_LEVELS = {
+    BY_METHOD: ['metric', 'dataset', 'method'],
+    LTOO: ['metric', 'dataset', 'method'],
+    LOO: ['metric', 'dataset', 'method'],
+    KFOLD: ['metric', 'dataset', 'method'],
+    BY_DB: ['metric', 'dataset', 'background', 'database'],
+    BY_ENTITY_METHOD: ['metric', 'dataset', 'entity_type', 'method'],
+    BY_ENTITY_DB: ['entity_type', 'metric', 'dataset', 'background', 'database'],
+}
+
+"""Selection"""
+
+
+def select_nodes(
+    scores: np.ndarray,
+    top_k: Optional[int] = None,
+    threshold: Optional[float] = None,
+    mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Return the positions of the selected nodes of a score vector, from the highest to the lowest score.
+
+    Only the selected nodes are sorted: the top-k are found with a partial sort (argpartition) in linear time.
+
+    :param scores: Score vector.
+    :param top_k: Optional maximum number of nodes.
+    :param threshold: Optional minimum score.
+    :param mask: Optional boolean mask of the candidate nodes.
+    """
+    candidates = np.ones(len(scores), dtype=bool) if mask is None else np.array(mask, dtype=bool)
+
+    if threshold is not None:
+        candidates &= scores >= threshold
+
+    # NaN scores (e.g. undefined z-scores) are never selected
+    candidates = np.flatnonzero(candidates & ~np.isnan(scores))
+
+    if top_k is not None and top_k < len(candidates):
+        candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def select_scores(
+    results: Matrix,
+    top_k: Optional[int] = None,
+    threshold: Optional[float] = None,
+    node_types: Optional[List[Optional[str]]] = None,
+    entity_types: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """Select the top scoring nodes of each column of the diffusion results, as a long table sorted by column and score.
+
+    :param results: Diffusion scores as a Matrix.
+    :param top_k: Optional maximum number of nodes per column.
+    :param threshold: Optional minimum score.
+    :param node_types: Entity type of each results row (e.g. 'genes', 'mirna', 'metabolites' or 'bps').
+    :param entity_types: Optional entity types the selection is restricted to.
+    :return: Table with the node, its type (if node types are given), the results column and the score.
+    """
+    mask = None
+
+    if entity_types:
+        if node_types is None:
+            raise ValueError('Entity types of the nodes are needed to restrict the results to entity types.')
+
+        mask = np.isin(np.asarray(node_types, dtype=object), list(entity_types))
+
+    rows_labels = np.asarray(results.rows_labels, dtype=object)
+    mat = np.asarray(results.mat, dtype=float)
+
+    tables = []
+
+    for j, col_label in enumerate(results.cols_labels):
+        selected = select_nodes(mat[:, j], top_k=top_k, threshold=threshold, mask=mask)
+
+        table = pd.DataFrame({NODE_COLUMN: rows_labels[selected]})
+        if node_types is not None:
+            table[TYPE_COLUMN] = np.asarray(node_types, dtype=object)[selected]
+        table[SCORES_COLUMN] = col_label
+        table[SCORE_COLUMN] = mat[selected, j]
+
+        tables.append(table)
+
+        log.debug(f'{len(selected)} nodes selected for {col_label}.')
+
+    return pd.concat(tables, ignore_index=True)
+
+
+def get_results_node_types(results: Matrix, rows_labels: List[str], node_types: List[Optional[str]]) -> List[str]:
+    """Align the entity types of the kernel nodes with the results rows.
+
+    :param results: Diffusion scores as a Matrix.
+    :param rows_labels: Kernel node labels.
+    :param node_types: Entity type of each kernel node.
+    """
+    return list(pd.Series(node_types, index=rows_labels).reindex(results.rows_labels).values)
+
+
+"""Diffusion scores files"""
+
+
+def write_scores(
+    results: Matrix,
+    path: str,
+    output_format: Optional[str] = None,
+    compression: Optional[str] = None,
+):
+    """Write diffusion scores, as a table with a node column and a column per scores column.
+
+    :param results: Diffusion scores as a Matrix.
+    :param path: Output path.
+    :param output_format: Output format ["csv", "tsv", "json", "parquet", "feather", "npz", "h5"]. By default inferred
+     from the path extension.
+    :param compression: Optional compression (e.g. 'zstd' or 'snappy' for parquet, 'gzip' for CSV). For npz, any value
+     compresses the arrays.
+    """
+    output_format = (output_format or get_format(path)).lower()
+
+    if output_format == NPZ:
+        save = np.savez_compressed if compression else np.savez
+        save(
+            path,
+            mat=np.asarray(results.mat),
+            rows_labels=np.asarray(results.rows_labels, dtype=str),
+            cols_labels=np.asarray(results.cols_labels, dtype=str),
+        )
+
+    elif output_format == JSON:
+        with open(path, 'w') as file:
+            json.dump(
+                {
+                    col_label: dict(zip(results.rows_labels, np.asarray(results.mat)[:, j].tolist()))
+                    for j, col_label in enumerate(results.cols_labels)
+                },
+                file,
+                indent=2,
+            )
+
+    else:
+        scores = pd.DataFrame(np.asarray(results.mat), index=results.rows_labels, columns=results.cols_labels)
+        write_table(scores.rename_axis(NODE_COLUMN).reset_index(), path, output_format, compression)
+
+
+def read_scores(path: str, columns: Optional[List[str]] = None) -> Matrix:
+    """Read diffusion scores written by :func:`write_scores`, optionally only some of its columns.
+
+    :param path: Path to the scores.
+    :param columns: Optional scores columns to read. Columnar formats do not read the rest of columns.
+    """
+    output_format = get_format(path)
+
+    if output_format == NPZ:
+        with np.load(path) as scores:
+            cols_labels = scores['cols_labels'].tolist()
+            positions = [cols_labels.index(column) for column in columns] if columns else slice(None)
+
+            return Matrix(
+                scores['mat'][:, positions],
+                rows_labels=scores['rows_labels'].tolist(),
+                cols_labels=columns or cols_labels,
+            )
+
+    if output_format == JSON:
+        with open(path) as file:
+            scores = pd.DataFrame(json.load(file))
+    else:
+        scores = read_table(path, columns=[NODE_COLUMN] + columns if columns else None).set_index(NODE_COLUMN)
+
+    if columns:
+        scores = scores[columns]
+
+    return Matrix(scores.values, rows_labels=list(scores.index), cols_labels=list(scores.columns))
+
+
+"""Tables"""
+
+
+def write_table(
+    table: pd.DataFrame,
+    path: str,
+    output_format: Optional[str] = None,
+    compression: Optional[str] = None,
+    append: bool = False,
+):
+    """Write a table as CSV, TSV, parquet, feather or HDF5.
+
+    Appended parquet outputs are datasets: directories where each write adds a part file, read back as one table.
+
+    :param table: Table to write.
+    :param path: Output path.
+    :param output_format: Output format. By default inferred from the path extension.
+    :param compression: Optional compression (e.g. 'zstd' for parquet and feather, 'gzip' for CSV, 'blosc' for HDF5).
+    :param append: Flag to append the rows to an existing output instead of overwriting it.
+    """
+    output_format = (output_format or get_format(path)).lower()
+
+    if output_format == PARQUET:
+        if append:
+            os.makedirs(path, exist_ok=True)
+            path = os.path.join(path, f'part-{len(os.listdir(path)):05d}.parquet')
+
+        table.to_parquet(path, index=False, compression=compression)
+
+    elif output_format == FEATHER:
+        if append:
+            raise ValueError('Feather files can not be appended, use parquet instead.')
+
+        table.to_feather(path, compression=compression)
+
+    elif output_format == HDF5:
+        table.to_hdf(
+            path,
+            key=HDF5_KEY,
+            mode='a' if append else 'w',
+            format='table',
+            append=append,
+            complevel=9 if compression else None,
+            complib=compression,
+        )
+
+    elif output_format in {CSV, TSV}:
+        exists = append and os.path.isfile(path)
+        table.to_csv(
+            path,
+            sep='\t' if output_format == TSV else ',',
+            mode='a' if exists else 'w',
+            header=not exists,
+            index=False,
+            compression=compression,
+        )
+
+    else:
+        raise ValueError(f'Output format not supported for tables: {output_format}')
+
+
+def read_table(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """Read a table written by :func:`write_table`, optionally only some columns and rows.
+
+    Parquet tables are filtered while reading, without loading the filtered out row groups.
+
+    :param path: Path to the table (or parquet dataset).
+    :param columns: Optional columns to read.
+    :param filters: Optional column values (or lists of values) the rows are restricted to.
+    """
+    filters = {
+        column: list(values) if isinstance(values, (list, set, tuple)) else [values]
+        for column, values in (filters or {}).items()
+    }
+
+    output_format = get_format(path)
+
+    if output_format == PARQUET:
+        return pd.read_parquet(
+            path,
+            columns=columns,
+            filters=[(column, 'in', values) for column, values in filters.items()] or None,
+        )
+
+    if output_format == FEATHER:
+        table = pd.read_feather(path, columns=columns)
+    elif output_format == HDF5:
+        table = pd.read_hdf(path, HDF5_KEY, columns=columns)
+    elif output_format in {CSV, TSV}:
+        table = pd.read_csv(path, sep='\t' if output_format == TSV else ',', usecols=columns)
+    else:
+        raise ValueError(f'Output format not supported for tables: {output_format}')
+
+    for column, values in filters.items():
+        table = table[table[column].isin(values)]
+
+    return table.reset_index(drop=True)
+
+
+"""Metrics tables"""
+
+
+def metrics_to_table(metrics: Dict[str, Any], levels: Optional[List[str]] = None) -> pd.DataFrame:
+    """Flatten nested validation metrics into a long table, with a row per metric value.
+
+    :param metrics: Nested metrics (e.g. metric -> dataset -> method -> values of each iteration).
+    :param levels: Names of the nesting levels. By default 'level_0', 'level_1'...
+    """
+    keys, values = [], []
+
+    def flatten(nested, nested_keys):
+        if isinstance(nested, dict):
+            for key, value in nested.items():
+                flatten(value, nested_keys + [key])
+            return
+
+        keys.append(nested_keys)
+        values.append(np.atleast_1d(np.asarray(nested, dtype=float)))
+
+    flatten(metrics, [])
+
+    depth = len(keys[0]) if keys else len(levels or [])
+    if levels is None or len(levels) != depth:
+        levels = [f'level_{i}' for i in range(depth)]
+
+    # Keys repeated and iterations numbered for all the values of each leaf at once
+    lengths = np.array([len(leaf_values) for leaf_values in values], dtype=int)
+    table = pd.DataFrame(
+        np.repeat(np.array(keys, dtype=object).reshape(len(keys), depth), lengths, axis=0),
+        columns=list(levels),
+    )
+    table[ITERATION_COLUMN] = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    table[VALUE_COLUMN] = np.concatenate(values) if values else np.array([], dtype=float)
+
+    return table
+
+
+def table_to_metrics(table: pd.DataFrame, levels: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Nest a metrics table back into nested metrics, as consumed by :mod:`diffupath.statistic_tests` and views.
+
+    :param table: Metrics table.
+    :param levels: Columns to nest by. By default every column but the iteration and value columns.
+    """
+    levels = levels or [column for column in table.columns if column not in {ITERATION_COLUMN, VALUE_COLUMN}]
+
+    metrics = {}
+
+    for keys, group in table.sort_values(ITERATION_COLUMN, kind='stable').groupby(levels, sort=False):
+        keys = keys if isinstance(keys, tuple) else (keys,)
+
+        nested = metrics
+        for key in keys[:-1]:
+            nested = nested.setdefault(key, {})
+        nested[keys[-1]] = group[VALUE_COLUMN].tolist()
+
+    return metrics
+
+
+def write_metrics(
+    metrics: Dict[str, Any],
+    path: str,
+    levels: Optional[List[str]] = None,
+    compression: Optional[str] = None,
+    append: bool = False,
+):
+    """Write nested validation metrics as a long table (see :func:`write_table` for the formats).
+
+    :param metrics: Nested metrics.
+    :param path: Output path.
+    :param levels: Names of the nesting levels.
+    :param compression: Optional compression.
+    :param append: Flag to append the metrics to an existing table (e.g. of previous evaluations).
+    """
+    write_table(metrics_to_table(metrics, levels), path, compression=compression, append=append)
+
+
+def read_metrics(path: str, **filters: Union[str, List[str]]) -> Dict[str, Any]:
+    """Read a metrics table as nested metrics, reading only the rows matching the filters.
+
+    :param path: Path to the metrics table.
+    :param filters: Values (or lists of values) of the levels the metrics are restricted to (e.g. metric='auroc').
+    """
+    return table_to_metrics(read_table(path, filters=filters))
+
+
+def get_format(path: str, formats: Optional[Iterable[str]] = None) -> str:
+    """Return the output format of a path, from its extension (parquet datasets are directories).
+
+    :param path: Output path.
+    :param formats: Optional formats given by the extension, CSV being returned for other (or missing) extensions.
+    """
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+
+    if extension == 'hdf5':
+        extension = HDF5
+
+    if formats is not None and extension not in formats:
+        return CSV
+
+    return extension
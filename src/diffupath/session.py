@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+"""Diffusion sessions, holding a loaded kernel and the state derived from it across repeated diffusions."""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import networkx as nx
+import numpy as np
+from diffupy.constants import BER_P, MC, ML, RAW, Z
+from diffupy.matrix import Matrix
+from diffupy.process_input import process_input_data
+
+from .constants import PAGE_RANK, RANDOM
+from .kernel_diffusion import (
+    _to_ml_labels, concatenate_columns, diffuse_by_methods, diffuse_on_kernel, get_input_codification,
+    kernel_product, kernel_row_sums, z_normalize,
+)
+from .kernel_io import is_kernel_file, prefer_kernel_file, read_kernel_file, read_label_index
+from .label_index import LabelIndex
+from .permutations import diffuse_by_permutations
+from .metrics import get_metrics_by_column
+from .topological_analyses import generate_pagerank_baseline
+from .utils import from_pickle
+
+log = logging.getLogger(__name__)
+
+
+class DiffusionSession:
+    """Kernel, label index, baselines and normalization statistics shared by the diffusions of a session.
+
+    The derived state is computed on first use and then reused by every call. Calls only read the kernel and that
+    state, so a session can be shared by several threads (e.g. the requests of a service).
+    """
+
+    def __init__(
+        self,
+        kernel: Matrix,
+        label_index: Optional[LabelIndex] = None,
+        graph: Optional[nx.Graph] = None,
+    ):
+        """Initialize the session.
+
+        :param kernel: Network as a kernel (dense, sparse, packed or memory-mapped).
+        :param label_index: Label index of the kernel. By default built from the kernel labels.
+        :param graph: Optional network as a graph, needed by the PageRank baseline.
+        """
+        self.kernel = kernel
+        self.label_index = label_index if label_index is not None else LabelIndex.from_kernel(kernel)
+        self.graph = graph
+
+        self._lock = threading.Lock()
+        self._row_sums = None
+        self._baselines = {}
+
+    @classmethod
+    def from_network(cls, path: str, mmap: bool = True, graph: Optional[nx.Graph] = None) -> 'DiffusionSession':
+        """Start a session from a kernel file (.dpk, preferred when converted) or a pickled kernel.
+
+        :param path: Path to the kernel.
+        :param mmap: Flag to memory-map the body of kernel files, so that sessions share the pages of the kernel.
+        :param graph: Optional network as a graph, needed by the PageRank baseline.
+        """
+        path = prefer_kernel_file(path)
+
+        if is_kernel_file(path):
+            return cls(read_kernel_file(path, mmap=mmap), label_index=read_label_index(path), graph=graph)
+
+        return cls(from_pickle(path), graph=graph)
+
+    @property
+    def row_sums(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the kernel row sums and squared row sums of the z-score normalization, computed on first use."""
+        if self._row_sums is None:
+            with self._lock:
+                if self._row_sums is None:
+                    self._row_sums = kernel_row_sums(self.kernel)
+
+        return self._row_sums
+
+    def get_baseline(self, name: str = PAGE_RANK) -> Matrix:
+        """Return a baseline ranking of the kernel nodes, computed on first use.
+
+        :param name: Baseline name. Only "page_rank" is available, for sessions with a graph.
+        """
+        if name != PAGE_RANK:
+            raise ValueError(f'Unknown baseline: {name}')
+
+        if self.graph is None:
+            raise ValueError('The PageRank baseline requires the network as a graph.')
+
+        if name not in self._baselines:
+            with self._lock:
+                if name not in self._baselines:
+                    self._baselines[name] = generate_pagerank_baseline(self.graph, self.kernel)
+
+        return self._baselines[name]
+
+    def format_input(
+        self,
+        input,
+        codification: str = RAW,
+        binarize: bool = False,
+        threshold: Optional[float] = None,
+        absolute_value: bool = False,
+        p_value: float = 0.05,
+    ) -> Matrix:
+        """Process an input and format it as a Matrix matching the kernel rows.
+
+        :param input: Path or miscellaneous format data input to be processed/formatted.
+        :param codification: Input codification, "ml" for binary labels or "raw" for quantitative scores.
+        :param binarize: If logFC provided in dataset, convert logFC to binary.
+        :param threshold: Codify node labels by applying a threshold to logFC in input.
+        :param absolute_value: Codify node labels by applying threshold to | logFC | in input.
+        :param p_value: Statistical significance.
+        """
+        if isinstance(input, Matrix):
+            return input
+
+        processed_input = process_input_data(input, codification, binarize, absolute_value, p_value, threshold)
+
+        return self.label_index.format_input(processed_input)
+
+    def diffuse(
+        self,
+        input,
+        method: Union[str, List[str]] = RAW,
+        n_permutations: int = 10000,
+        workers: Optional[int] = 1,
+        **processing: Any,
+    ) -> Matrix:
+        """Diffuse an input over the session kernel.
+
+        :param input: Path or miscellaneous format data input, or an already formatted input Matrix.
+        :param method: Elected method ["raw", "ml", "gm", "ber_s", "ber_p", "mc", "z"], or a list of them to compute
+         them all from a shared kernel product, as one column per method.
+        :param n_permutations: Number of input permutations of the Monte Carlo methods ("mc" and "ber_p").
+        :param workers: Number of worker processes the permutations are sharded over.
+        :param processing: Input processing flags (binarize, threshold, absolute_value and p_value).
+        """
+        if isinstance(method, str):
+            scores = self.format_input(input, get_input_codification(method), **processing)
+
+            return self._diffuse_scores(scores, method, n_permutations=n_permutations, workers=workers)
+
+        methods = list(method)
+
+        # Input is processed once per codification, shared by the methods requiring it
+        return concatenate_columns([
+            self._diffuse_scores(
+                self.format_input(input, codification, **processing),
+                [method for method in methods if get_input_codification(method) == codification],
+                n_permutations=n_permutations,
+                workers=workers,
+            )
+            for codification in dict.fromkeys(get_input_codification(method) for method in methods)
+        ])
+
+    def diffuse_batch(self, inputs: Dict[str, Any], method: str = RAW, **processing: Any) -> Matrix:
+        """Diffuse several inputs at once, as the columns of a single kernel product.
+
+        :param inputs: Inputs by name, each a path, miscellaneous format data input or an already formatted Matrix.
+        :param method: Elected method ["raw", "ml", "z"].
+        :param processing: Input processing flags (binarize, threshold, absolute_value and p_value).
+        :return: Scores with a column per input (or per input and column, as 'name_column', for multi-column inputs).
+        """
+        if method not in {RAW, ML, Z}:
+            raise ValueError(f'Method not supported for batch diffusion: {method}')
+
+        mats, cols_labels = [], []
+
+        for name, input in inputs.items():
+            scores = self.format_input(input, get_input_codification(method), **processing).match_rows(self.kernel)
+
+            mats.append(scores.mat)
+            if len(scores.cols_labels) == 1:
+                cols_labels.append(name)
+            else:
+                cols_labels.extend(f'{name}_{col_label}' for col_label in scores.cols_labels)
+
+        scores = Matrix(np.hstack(mats), rows_labels=self.kernel.rows_labels, cols_labels=cols_labels)
+
+        return self._diffuse_scores(scores, method)
+
+    def validate(
+        self,
+        input: Union[List[str], Dict[str, float]],
+        k: int = 100,
+        seed: Optional[int] = None,
+    ) -> Tuple[Dict[str, list], Dict[str, list]]:
+        """Repeated holdout validation of the raw and z methods against the random (and PageRank) baselines.
+
+        As :func:`diffupath.repeated_holdout.validation_by_method`, each iteration diffuses a random half of the input
+        labels and ranks the other half, but the k iterations share a single kernel product and the baselines and
+        normalization statistics are reused.
+
+        :param input: Input labels (or a label-scores dict, whose scores are diffused).
+        :param k: Iterations of the repeated holdout validation.
+        :param seed: Seed of the random splits and baseline.
+        :return: AUROC and AUPRC metrics by method, one per iteration.
+        """
+        scores = input if isinstance(input, dict) else dict.fromkeys(input, 1)
+
+        rows = self.label_index.get_rows(list(scores))
+        mapped = rows >= 0
+        rows, values = rows[mapped], np.asarray(list(scores.values()), dtype=float)[mapped]
+        rows, positions = np.unique(rows, return_index=True)
+        values = values[positions]
+
+        rng = np.random.default_rng(seed)
+
+        n_nodes, n_input = len(self.kernel.rows_labels), len(rows) // 2
+        input_mat = np.full((n_nodes, k), -1, dtype=float)
+        validation_mat = np.full((n_nodes, k), -1, dtype=float)
+
+        for iteration in range(k):
+            permutation = rng.permutation(len(rows))
+            input_mat[rows[permutation[:n_input]], iteration] = values[permutation[:n_input]]
+            validation_mat[rows[permutation[n_input:]], iteration] = 1
+
+        raw_scores = kernel_product(self.kernel, input_mat)
+
+        method_scores = {
+            RAW: raw_scores,
+            Z: z_normalize(raw_scores, input_mat, *self.row_sums),
+            RANDOM: rng.random((n_nodes, k)),
+        }
+        if self.graph is not None:
+            method_scores[PAGE_RANK] = np.repeat(self.get_baseline(PAGE_RANK).mat, k, axis=1)
+
+        auroc_metrics, auprc_metrics = {}, {}
+
+        for method, method_mat in method_scores.items():
+            auroc, auprc = get_metrics_by_column(validation_mat, method_mat)
+            auroc_metrics[method], auprc_metrics[method] = auroc.tolist(), auprc.tolist()
+
+        return auroc_metrics, auprc_metrics
+
+    def _diffuse_scores(
+        self,
+        scores: Matrix,
+        method: Union[str, List[str]],
+        n_permutations: int = 10000,
+        workers: Optional[int] = 1,
+    ) -> Matrix:
+        """Diffuse formatted input scores, reusing the normalization statistics of the session."""
+        if isinstance(method, str):
+            if method == RAW:
+                return diffuse_on_kernel(scores, self.kernel)
+
+            if method == Z:
+                return diffuse_on_kernel(scores, self.kernel, z=True, row_sums=self.row_sums)
+
+            if method == ML:
+                return diffuse_on_kernel(_to_ml_labels(scores), self.kernel)
+
+            if method in {MC, BER_P}:
+                return diffuse_by_permutations(
+                    scores, method, self.kernel, n_permutations=n_permutations, workers=workers,
+                )
+
+        methods = [method] if isinstance(method, str) else list(method)
+
+        return diffuse_by_methods(
+            scores,
+            methods,
+            self.kernel,
+            n_permutations=n_permutations,
+            workers=workers,
+            row_sums=self.row_sums if Z in methods else None,
+        )
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""Sparsified kernels, keeping only the relevant entries of a dense kernel as a scipy CSR matrix."""
+
+import logging
+from typing import Optional
+
+import numpy as np
+from diffupy.matrix import Matrix
+from scipy import sparse
+
+log = logging.getLogger(__name__)
+
+
+class SparseKernel(Matrix):
+    """Kernel Matrix whose values are stored as a scipy CSR matrix."""
+
+    def __init__(
+        self,
+        mat,
+        rows_labels,
+        name: str = '',
+    ):
+        """Initialize the sparse kernel.
+
+        :param mat: Square (sparse or dense) kernel matrix.
+        :param rows_labels: Node labels, shared by rows and columns.
+        :param name: Name of the kernel.
+        """
+        self.rows_labels = list(rows_labels)
+        self.name = name
+        self.quadratic = True
+
+        self.mat = sparse.csr_matrix(mat)
+
+        self.get_labels = True
+        self.get_indices = False
+
+        self.validate_labels()
+
+    def __copy__(self):
+        """Return a copy of the sparse kernel."""
+        return SparseKernel(self.mat.copy(), rows_labels=self.rows_labels, name=self.name)
+
+    @property
+    def density(self) -> float:
+        """Return the fraction of stored entries over the dense kernel size."""
+        n = len(self.rows_labels)
+        return self.mat.nnz / (n * n) if n else 0.
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory used by the CSR arrays."""
+        return self.mat.data.nbytes + self.mat.indices.nbytes + self.mat.indptr.nbytes
+
+    def to_dense(self) -> Matrix:
+        """Return the kernel as a dense Matrix."""
+        return Matrix(self.mat.toarray(), rows_labels=self.rows_labels, quadratic=True, name=self.name)
+
+
+def sparsify_kernel(
+    kernel: Matrix,
+    top_k: Optional[int] = None,
+    relative_threshold: Optional[float] = None,
+    block_size: int = 1024,
+) -> SparseKernel:
+    """Sparsify a dense kernel, keeping the top-k entries per column and/or the entries above a relative threshold.
+
+    The diagonal is always kept, since it holds the self-contribution of each node.
+
+    :param kernel: Network as a dense kernel.
+    :param top_k: Number of largest entries kept per column.
+    :param relative_threshold: Keep entries whose value is at least this fraction of the column maximum.
+    :param block_size: Number of columns processed at once, bounding the extra memory used.
+    """
+    if top_k is None and relative_threshold is None:
+        raise ValueError('Either top_k or relative_threshold should be provided to sparsify the kernel.')
+
+    mat = kernel.mat
+    n = mat.shape[0]
+
+    if top_k is not None and not 0 < top_k <= n:
+        raise ValueError(f'top_k should be between 1 and the number of nodes ({n}), but {top_k} was given.')
+
+    rows, cols, values = [], [], []
+
+    for start in range(0, n, block_size):
+        block = np.asarray(mat[:, start:start + block_size])
+        keep = np.zeros(block.shape, dtype=bool)
+
+        if top_k is not None:
+            top_rows = np.argpartition(-block, top_k - 1, axis=0)[:top_k]
+            keep[top_rows, np.arange(block.shape[1])] = True
+        else:
+            keep[:] = True
+
+        if relative_threshold is not None:
+            keep &= block >= relative_threshold * block.max(axis=0)
+
+        # Keep the diagonal
+        keep[np.arange(start, start + block.shape[1]), np.arange(block.shape[1])] = True
+
+        block_rows, block_cols = np.nonzero(keep)
+        rows.append(block_rows)
+        cols.append(block_cols + start)
+        values.append(block[block_rows, block_cols])
+
+    sparse_mat = sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=mat.shape,
+    )
+
+    sparse_kernel = SparseKernel(sparse_mat, rows_labels=kernel.rows_labels, name=kernel.name)
+
+    log.info(f'Sparsified kernel keeps {sparse_kernel.mat.nnz} entries ({sparse_kernel.density:.2%} density).')
+
+    return sparse_kernel
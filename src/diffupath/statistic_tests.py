@@ -4,12 +4,20 @@
 import itertools
 import math
 from collections import defaultdict
+from typing import List, Optional
 
+import numpy as np
 import pandas as pd
 from scipy import stats
 from scipy.stats import wilcoxon
 from statsmodels.stats.multitest import fdrcorrection
 
+from .results import ITERATION_COLUMN, VALUE_COLUMN
+
+#: Paired tests of the metrics tables
+TTEST = 't'
+WILCOXON = 'wilcoxon'
+
 """Statistical tests"""
 
 
@@ -79,3 +87,137 @@ def get_wilcoxon_test(metrics, dataframe=False, title=""):
         return df
 
     return p_values
+
+
+"""Vectorized paired tests"""
+
+
+def get_paired_tests(
+    table: pd.DataFrame,
+    method_column: str = 'method',
+    strata: Optional[List[str]] = None,
+    test: str = TTEST,
+    alpha: float = 0.05,
+) -> pd.DataFrame:
+    """Run the paired tests between every pair of methods of every stratum of a metrics table, with a single FDR pass.
+
+    Method values are paired by iteration. All the pairs of every stratum are tested at once, as the columns of a
+    (iterations x tests) array of differences, and their p-values corrected together (Benjamini-Hochberg).
+
+    :param table: Long metrics table (see :func:`diffupath.results.metrics_to_table`).
+    :param method_column: Column of the compared methods (e.g. 'method' or 'database').
+    :param strata: Columns the pairs are tested within. By default every column but the methods, iterations and values.
+    :param test: Paired test, "t" (paired t-test) or "wilcoxon" (signed-rank test, normal approximation).
+    :param alpha: Family-wise false discovery rate.
+    :return: A row per stratum and pair of methods, with the number of pairs, mean difference, test statistic, p-value,
+     FDR-corrected q-value and whether the difference is significant.
+    """
+    if test not in {TTEST, WILCOXON}:
+        raise ValueError(f'Unknown paired test: {test}')
+
+    strata = strata or [
+        column for column in table.columns if column not in {method_column, ITERATION_COLUMN, VALUE_COLUMN}
+    ]
+
+    values = table.pivot_table(
+        index=strata + [ITERATION_COLUMN], columns=method_column, values=VALUE_COLUMN, aggfunc='first',
+    )
+    # Methods in their order in the table, as in the nested metrics
+    methods = list(table[method_column].drop_duplicates())
+    values = values[methods]
+
+    # (strata x iterations x methods) array, NaN for the iterations a stratum (or method) lacks
+    index = values.index.to_frame(index=False)
+    strata_codes = index.groupby(strata, sort=False).ngroup().to_numpy()
+    positions = index.groupby(strata, sort=False).cumcount().to_numpy()
+
+    mat = np.full((strata_codes.max() + 1, positions.max() + 1, len(methods)), np.nan)
+    mat[strata_codes, positions] = values.to_numpy()
+
+    pairs = np.array(list(itertools.combinations(range(len(methods)), 2))).reshape(-1, 2)
+    differences = mat[:, :, pairs[:, 0]] - mat[:, :, pairs[:, 1]]
+
+    # Tests as columns, the first stratum pairs first
+    differences = differences.transpose(1, 0, 2).reshape(mat.shape[1], -1)
+
+    if test == TTEST:
+        n, statistic, p_values = _paired_ttest(differences)
+    else:
+        n, statistic, p_values = _wilcoxon_test(differences)
+
+    q_values = np.full(len(p_values), np.nan)
+    tested = np.isfinite(p_values)
+    if tested.any():
+        q_values[tested] = fdrcorrection(p_values[tested], alpha=alpha, method='indep', is_sorted=False)[1]
+
+    strata_keys = index[strata].drop_duplicates().reset_index(drop=True)
+    results = strata_keys.loc[np.repeat(np.arange(len(strata_keys)), len(pairs))].reset_index(drop=True)
+
+    results['method_a'] = np.tile(np.asarray(methods, dtype=object)[pairs[:, 0]], len(strata_keys))
+    results['method_b'] = np.tile(np.asarray(methods, dtype=object)[pairs[:, 1]], len(strata_keys))
+    results['test'] = test
+    results['n'] = n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results['mean_difference'] = np.nansum(differences, axis=0) / np.sum(~np.isnan(differences), axis=0)
+    results['statistic'] = statistic
+    results['p_value'] = p_values
+    results['q_value'] = q_values
+    results['significant'] = q_values < alpha
+
+    return results
+
+
+"""Helper functions"""
+
+
+def _paired_ttest(differences: np.ndarray):
+    """Return the number of pairs, t statistic and two-sided p-value of each column of paired differences."""
+    n = np.sum(~np.isnan(differences), axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(differences, axis=0) / n
+        variance = np.nansum((differences - mean) ** 2, axis=0) / (n - 1)
+        statistic = mean / np.sqrt(variance / n)
+        p_values = 2 * stats.t.sf(np.abs(statistic), n - 1)
+
+    return n, statistic, p_values
+
+
+def _wilcoxon_test(differences: np.ndarray):
+    """Return the number of non-zero pairs, statistic and two-sided p-value of each column of paired differences.
+
+    Wilcoxon signed-rank test, by its normal approximation with tie correction, zero differences being dropped.
+    """
+    valid = ~np.isnan(differences) & (differences != 0)
+    n = valid.sum(axis=0)
+
+    # Dropped differences rank last, so that the ranks of the others are unaffected
+    absolute = np.where(valid, np.abs(differences), np.inf)
+    ranks = stats.rankdata(absolute, axis=0)
+
+    r_plus = np.sum(ranks * (valid & (differences > 0)), axis=0)
+    r_minus = np.sum(ranks * (valid & (differences < 0)), axis=0)
+
+    # Tie correction, summing t^2 - 1 over the differences of each group of t tied absolute differences
+    sorted_absolute = np.sort(absolute, axis=0)
+    rows = np.arange(len(absolute))[:, np.newaxis]
+
+    starts = np.ones(absolute.shape, dtype=bool)
+    starts[1:] = sorted_absolute[1:] != sorted_absolute[:-1]
+    ends = np.ones(absolute.shape, dtype=bool)
+    ends[:-1] = starts[1:]
+
+    group_starts = np.maximum.accumulate(np.where(starts, rows, 0), axis=0)
+    group_ends = np.minimum.accumulate(np.where(ends, rows, len(absolute))[::-1], axis=0)[::-1]
+    tie_sizes = np.where(rows < n, group_ends - group_starts + 1, 1)
+
+    mean = n * (n + 1) / 4
+    variance = n * (n + 1) * (2 * n + 1) / 24 - np.sum(tie_sizes ** 2 - 1, axis=0) / 48
+
+    statistic = np.minimum(r_plus, r_minus)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (statistic - mean) / np.sqrt(variance)
+        p_values = np.where(n > 0, 2 * stats.norm.sf(np.abs(z)), np.nan)
+
+    return n, statistic, p_values
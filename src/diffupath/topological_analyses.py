@@ -18,7 +18,7 @@ def generate_pagerank_baseline(graph: nx.Graph,
 
     pagerank_scores = nx.pagerank(graph)
 
-    if len(pagerank_scores.values()) != len(background_mat.mat):
+    if len(pagerank_scores.values()) != len(background_mat.rows_labels):
         warnings.warn(
             'The provided graph do not match the kernel nodes amount. The nodes will be matched (deleting and filling missing) according to the reference Matrix.')
 
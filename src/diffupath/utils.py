@@ -11,10 +11,12 @@ import random
 from collections import defaultdict
 from glob import glob
 from statistics import mean
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 
+from .compact_kernel import compact_kernel
+
 log = logging.getLogger(__name__)
 
 
@@ -64,12 +66,17 @@ def get_last_file(path):
     return max(list_of_files, key=os.path.getctime)
 
 
-def get_kernel_from_graph(graph, kernel_method, normalized=False):
-    """Get kernel from graph given a kernel method."""
+def get_kernel_from_graph(graph, kernel_method, normalized=False, dtype: Optional[str] = None, packed=False):
+    """Get kernel from graph given a kernel method, optionally stored in a compact dtype and/or symmetric packed."""
     if 'normalized' in inspect.getfullargspec(kernel_method).args:
-        return kernel_method(graph, normalized=normalized)
+        kernel = kernel_method(graph, normalized=normalized)
     else:
-        return kernel_method(graph)
+        kernel = kernel_method(graph)
+
+    if dtype or packed:
+        return compact_kernel(kernel, dtype=dtype, packed=packed)
+
+    return kernel
 
 
 def print_dict_dimensions(entities_db, title='', message='Total number of '):
@@ -7,12 +7,29 @@ from typing import List, Dict, Union, Optional, Tuple, Set, Callable
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import seaborn as sns
+from diffupy.matrix import Matrix
 from matplotlib_venn import venn3
+from scipy import sparse
+from scipy.cluster.hierarchy import leaves_list, linkage
 
+from .compact_kernel import PackedKernel
+from .kernel_diffusion import kernel_row_block
+from .results import VALUE_COLUMN, metrics_to_table
 from .statistic_tests import get_normalized_p_values
 
+#: Maximum number of rows (and columns) of drawn heatmaps, larger matrices being aggregated into tiles of block means
+MAX_HEATMAP_SIZE = 500
+
+#: Maximum number of annotated heatmap cells, larger heatmaps being drawn without per-cell text
+MAX_ANNOTATED_CELLS = 400
+
+#: Maximum number of tick labels per heatmap axis
+MAX_TICK_LABELS = 60
+
+#: Number of matrix rows read at once when aggregating heatmaps
+HEATMAP_BLOCK_ROWS = 256
+
 """Process/mapping input data plots"""
 
 
@@ -21,21 +38,36 @@ def show_heatmap(
     entity_count: List[List[int]],
     row_labels: List[int],
     col_labels: List[int],
-    title: str = "DiffuPath Mapping"
+    title: str = "DiffuPath Mapping",
+    max_annotated_cells: int = MAX_ANNOTATED_CELLS,
 ) -> None:
     """Render a heatmap from a numpy array and two lists of labels.
 
+    Heatmaps larger than MAX_HEATMAP_SIZE rows or columns are drawn as tiles of block means, and heatmaps with more
+    cells than max_annotated_cells without the per-cell annotations.
+
     :param entity_number: A 2D numpy array of shape (N,M).
     :param entity_count: Value in data units according to which the colors from textcolors are applied.
     :param row_labels: A list or array of length N with the labels for the rows.
     :param col_labels: A list or array of length N with the labels for the columns.
     :param title: Main title for the heatmap.
+    :param max_annotated_cells: Maximum number of cells annotated with their count.
     """
+    entity_number, entity_count = np.asarray(entity_number), np.asarray(entity_count)
+
+    if max(entity_number.shape) > MAX_HEATMAP_SIZE:
+        entity_number, row_edges, col_edges = downsample_matrix(entity_number)
+        # Tiles are annotated with the total count of the cells they aggregate
+        entity_count = np.add.reduceat(np.add.reduceat(entity_count, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+        row_labels, col_labels = _get_tile_labels(row_labels, row_edges), _get_tile_labels(col_labels, col_edges)
+
     fig, ax = plt.subplots(figsize=(15, 7))
 
     im, cbar = _generate_heatmap(entity_number, row_labels, col_labels, ax=ax,
                                  cmap="YlGn", cbarlabel="percentage [0-1]")
-    _ = _annotate_heatmap(im, entity_count=entity_count, valfmt="{x:1} ")
+
+    if entity_number.size <= max_annotated_cells:
+        _ = _annotate_heatmap(im, entity_count=entity_count, valfmt="{x:1} ")
 
     fig.tight_layout()
     ax.set_title(title)
@@ -77,12 +109,14 @@ def _generate_heatmap(
     cbar = ax.figure.colorbar(im, ax=ax, **cbar_kw)
     cbar.ax.set_ylabel(cbarlabel, rotation=-90, va="bottom")
 
-    # We want to show all ticks...
-    ax.set_xticks(np.arange(data.shape[1]))
-    ax.set_yticks(np.arange(data.shape[0]))
-    # ... and label them with the respective list entries.
-    ax.set_xticklabels(col_labels)
-    ax.set_yticklabels(row_labels)
+    # We want to show all ticks (unless too many to be read)...
+    if data.shape[1] <= MAX_TICK_LABELS:
+        ax.set_xticks(np.arange(data.shape[1]))
+        # ... and label them with the respective list entries.
+        ax.set_xticklabels(col_labels)
+    if data.shape[0] <= MAX_TICK_LABELS:
+        ax.set_yticks(np.arange(data.shape[0]))
+        ax.set_yticklabels(row_labels)
 
     # Let the horizontal axes labeling appear on top.
     ax.tick_params(top=True, bottom=False,
@@ -96,10 +130,12 @@ def _generate_heatmap(
     for edge, spine in ax.spines.items():
         spine.set_visible(False)
 
-    ax.set_xticks(np.arange(data.shape[1] + 1) - .5, minor=True)
-    ax.set_yticks(np.arange(data.shape[0] + 1) - .5, minor=True)
-    ax.grid(which="minor", color="w", linestyle='-', linewidth=3)
-    ax.tick_params(which="minor", bottom=False, left=False)
+    # White grid between cells, only for heatmaps small enough to be annotated
+    if data.size <= MAX_ANNOTATED_CELLS:
+        ax.set_xticks(np.arange(data.shape[1] + 1) - .5, minor=True)
+        ax.set_yticks(np.arange(data.shape[0] + 1) - .5, minor=True)
+        ax.grid(which="minor", color="w", linestyle='-', linewidth=3)
+        ax.tick_params(which="minor", bottom=False, left=False)
 
     ax.set_title(title)
 
@@ -143,14 +179,14 @@ def _annotate_heatmap(
     if isinstance(valfmt, str):
         valfmt = matplotlib.ticker.StrMethodFormatter(valfmt)
 
-    # Loop over the data and create a `Text` for each "pixel".
-    # Change the text's color depending on the data.
+    # Create a `Text` for each "pixel", its color depending on the data (normalized for all pixels at once).
+    colors = np.asarray(textcolors)[(np.asarray(im.norm(data)) > threshold).astype(int)]
+
     texts = []
-    for i in range(data.shape[0]):
-        for j in range(data.shape[1]):
-            kw.update(color=textcolors[im.norm(data[i, j]) > threshold])
-            text = im.axes.text(j, i, valfmt(entity_count[i, j], None), **kw)
-            texts.append(text)
+    for i, j in np.ndindex(*data.shape):
+        kw.update(color=colors[i, j])
+        text = im.axes.text(j, i, valfmt(entity_count[i, j], None), **kw)
+        texts.append(text)
 
     return texts
 
@@ -196,6 +232,110 @@ def show_distribution(
         _ = sns.distplot(a=np.asarray(list(dataset.values())), ax=axs[i]).set_title(f'{subtitle} {dataset_label}')
 
 
+"""Matrix heatmaps"""
+
+
+def downsample_matrix(
+    matrix: Union[Matrix, np.ndarray],
+    max_size: int = MAX_HEATMAP_SIZE,
+    block_rows: int = HEATMAP_BLOCK_ROWS,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Aggregate a matrix into at most max_size x max_size tiles, as the means of its blocks of rows and columns.
+
+    The matrix is read in blocks of rows, so memory-mapped (and packed or sparse) kernels are never loaded whole.
+
+    :param matrix: Matrix (e.g. a kernel or distance matrix, dense, sparse, packed or memory-mapped) or array.
+    :param max_size: Maximum number of tiles per axis.
+    :param block_rows: Number of rows read at once.
+    :return: Tile means, and the row and column edges of the tiles (tile i spans rows edges[i] to edges[i + 1]).
+    """
+    n_rows, n_cols = _get_shape(matrix)
+
+    row_edges = np.linspace(0, n_rows, min(n_rows, max_size) + 1).astype(int)
+    col_edges = np.linspace(0, n_cols, min(n_cols, max_size) + 1).astype(int)
+    row_tiles = np.searchsorted(row_edges, np.arange(n_rows), side='right') - 1
+
+    sums = np.zeros((len(row_edges) - 1, len(col_edges) - 1))
+
+    for start in range(0, n_rows, block_rows):
+        stop = min(start + block_rows, n_rows)
+
+        # Column tile sums of the rows of the block, added to their row tiles
+        tile_sums = np.add.reduceat(_get_row_block(matrix, start, stop), col_edges[:-1], axis=1)
+        np.add.at(sums, row_tiles[start:stop], tile_sums)
+
+    return sums / np.outer(np.diff(row_edges), np.diff(col_edges)), row_edges, col_edges
+
+
+def order_tiles(tiles: np.ndarray, symmetric: Optional[bool] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the orders of the rows and columns of tiles from their hierarchical clustering, grouping similar tiles.
+
+    :param tiles: Tile means (see :func:`downsample_matrix`).
+    :param symmetric: Flag to order the columns as the rows. By default for square symmetric tiles.
+    """
+    if symmetric is None:
+        symmetric = tiles.shape[0] == tiles.shape[1] and np.allclose(tiles, tiles.T)
+
+    row_order = leaves_list(linkage(tiles, method='average')) if len(tiles) > 1 else np.arange(len(tiles))
+    if symmetric:
+        return row_order, row_order
+
+    col_order = leaves_list(linkage(tiles.T, method='average')) if tiles.shape[1] > 1 else np.arange(tiles.shape[1])
+
+    return row_order, col_order
+
+
+def show_matrix_heatmap(
+    matrix: Union[Matrix, np.ndarray],
+    max_size: int = MAX_HEATMAP_SIZE,
+    cluster: bool = False,
+    title: str = '',
+    cmap: str = 'viridis',
+    cbarlabel: str = '',
+    path: Optional[str] = None,
+):
+    """Render the heatmap of a large matrix (e.g. a kernel block or a resistance-distance matrix) as tiles.
+
+    Matrices larger than max_size rows or columns are aggregated into tiles of block means before drawing, read in
+    blocks of rows, and the tiles can be ordered by their hierarchical clustering.
+
+    :param matrix: Matrix (dense, sparse, packed or memory-mapped) or array.
+    :param max_size: Maximum number of tiles per axis.
+    :param cluster: Flag to order the tiles by their hierarchical clustering.
+    :param title: Title of the heatmap.
+    :param cmap: Colormap of the heatmap.
+    :param cbarlabel: Label of the colorbar.
+    :param path: Optional path to save the heatmap to, drawn without a display. By default the heatmap is shown.
+    """
+    tiles, row_edges, col_edges = downsample_matrix(matrix, max_size)
+
+    row_labels = _get_tile_labels(matrix.rows_labels, row_edges) if isinstance(matrix, Matrix) else row_edges[:-1]
+    col_labels = row_labels if isinstance(matrix, PackedKernel) else (
+        _get_tile_labels(matrix.cols_labels, col_edges) if isinstance(matrix, Matrix) else col_edges[:-1]
+    )
+
+    if cluster:
+        row_order, col_order = order_tiles(tiles)
+        tiles = tiles[np.ix_(row_order, col_order)]
+        row_labels, col_labels = np.asarray(row_labels)[row_order], np.asarray(col_labels)[col_order]
+
+    if path is None:
+        fig, ax = plt.subplots(figsize=(10, 9))
+    else:
+        # Standalone figure, drawn on an Agg canvas without pyplot
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(10, 9))
+        ax = fig.subplots()
+
+    _generate_heatmap(tiles, row_labels, col_labels, ax=ax, cmap=cmap, cbarlabel=cbarlabel, title=title)
+
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path, bbox_inches='tight')
+
+
 """Validation metrics plots."""
 
 
@@ -359,21 +499,12 @@ def preprocess_for_sb_boxplot(data: Dict[str, Dict[str, Dict[str, List[int]]]]):
 
     :param data: Stratified dataset dictionary of frequencies to be plotted.
     """
-    metrics_by_method_df = {}
-
-    for k1, v1 in data.items():
-        metrics_by_method_to_df = defaultdict(lambda: list())
-        for k2, v2 in v1.items():
-            for k3, scores in v2.items():
-                for score in scores:
-                    metrics_by_method_to_df['k2'].append(k2)
-                    metrics_by_method_to_df['k3'].append(k3)
+    table = metrics_to_table(data, levels=['k1', 'k2', 'k3']).rename(columns={VALUE_COLUMN: 'score'})
 
-                    metrics_by_method_to_df['score'].append(score)
-
-        metrics_by_method_df[k1] = pd.DataFrame(metrics_by_method_to_df)
-
-    return metrics_by_method_df
+    return {
+        k1: frame[['k2', 'k3', 'score']].reset_index(drop=True)
+        for k1, frame in table.groupby('k1', sort=False)
+    }
 
 
 def fdr_barchart_three_plot(
@@ -437,3 +568,32 @@ def fdr_barchart_three_plot(
     ax.plot([-0.2, k_limit], [-np.math.log10(0.05), -np.math.log10(0.05)], "k--")
 
     plt.show()
+
+
+"""Helper functions"""
+
+
+def _get_shape(matrix: Union[Matrix, np.ndarray]) -> Tuple[int, int]:
+    """Return the number of rows and columns of a matrix or array."""
+    if isinstance(matrix, PackedKernel):
+        return matrix.shape
+
+    return (matrix.mat if isinstance(matrix, Matrix) else matrix).shape
+
+
+def _get_row_block(matrix: Union[Matrix, np.ndarray], start: int, stop: int) -> np.ndarray:
+    """Return a block of rows of a matrix or array, as a dense float array."""
+    block = kernel_row_block(matrix, start, stop) if isinstance(matrix, Matrix) else matrix[start:stop]
+
+    if sparse.issparse(block):
+        block = block.toarray()
+
+    return np.asarray(block, dtype=float)
+
+
+def _get_tile_labels(labels: List, edges: np.ndarray) -> List[str]:
+    """Return the labels of tiles: the label of their first row, with the number of other rows they aggregate."""
+    return [
+        str(labels[start]) if stop - start == 1 else f'{labels[start]} (+{stop - start - 1})'
+        for start, stop in zip(edges[:-1], edges[1:])
+    ]
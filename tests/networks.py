@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+"""Test networks and kernels."""
+
+import networkx as nx
+from diffupy.kernels import regularised_laplacian_kernel
+from diffupy.matrix import Matrix
+
+
+def get_test_graph(n_nodes: int = 40, seed: int = 1, prefix: str = '') -> nx.Graph:
+    """Return a small connected random graph, its nodes labelled by their number after an optional prefix."""
+    graph = nx.connected_watts_strogatz_graph(n_nodes, 4, 0.3, seed=seed)
+
+    return nx.relabel_nodes(graph, lambda node: f'{prefix}{node}')
+
+
+def get_test_kernel(n_nodes: int = 40, seed: int = 1, prefix: str = '') -> Matrix:
+    """Return the regularised Laplacian kernel of a small random graph (see :func:`get_test_graph`)."""
+    return regularised_laplacian_kernel(get_test_graph(n_nodes, seed, prefix))
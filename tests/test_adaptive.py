@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the adaptive validation iterations."""
+
+import unittest
+from functools import partial
+
+import numpy as np
+
+from diffupath.adaptive import get_confidence_interval, run_adaptive
+from diffupath.kfold import validation_by_kfold
+
+from .networks import get_test_kernel
+
+
+class AdaptiveTest(unittest.TestCase):
+    """Test that adaptive runs stop once their intervals are narrow enough, or their budget is spent."""
+
+    def test_stops_on_target_or_budget(self):
+        """Test the stopping rule on metrics with a known spread."""
+        rng = np.random.default_rng(0)
+
+        def run_batch(n, spread):
+            return {'raw': list(0.8 + spread * rng.standard_normal(n))}, {'raw': list(0.5 + spread * rng.random(n))}
+
+        auroc, auprc, report = run_adaptive(partial(run_batch, spread=0.01), max_iterations=1000, target_width=0.02)
+
+        self.assertTrue(report['converged'])
+        self.assertLess(report['iterations'], 1000)
+        self.assertEqual(len(auroc['raw']), report['iterations'])
+        self.assertEqual(report['auroc']['raw']['ci_width'], get_confidence_interval(auroc['raw'])[1])
+        self.assertLessEqual(report['auprc']['raw']['ci_width'], 0.02)
+
+        _, _, report = run_adaptive(partial(run_batch, spread=1), max_iterations=30, target_width=0.02, batch_size=7)
+
+        self.assertFalse(report['converged'])
+        self.assertEqual(report['iterations'], 30)
+
+    def test_adaptive_kfold(self):
+        """Test that adaptive k-fold repeats get a metric per fold of every repeat run."""
+        kernel = get_test_kernel(60, prefix='g')
+        labels = [f'g{i}' for i in range(0, 60, 3)]
+
+        auroc, _, report = run_adaptive(
+            partial(validation_by_kfold, labels, kernel, None, 5), max_iterations=6, target_width=1, batch_size=2,
+        )
+
+        self.assertIn(report['iterations'], {2, 4, 6})
+        self.assertTrue(all(len(values) == 5 * report['iterations'] for values in auroc.values()))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the asyncio diffusion API."""
+
+import asyncio
+import unittest
+from unittest import mock
+
+import numpy as np
+from diffupy.constants import Z
+
+from diffupath.async_diffusion import diffuse_async
+from diffupath.session import DiffusionSession
+
+from .networks import get_test_kernel
+
+
+class AsyncDiffusionTest(unittest.IsolatedAsyncioTestCase):
+    """Test that concurrent requests are coalesced into batched kernel products."""
+
+    def setUp(self):
+        """Start a session over a test kernel."""
+        self.session = DiffusionSession(get_test_kernel(40, prefix='g'))
+
+        self.inputs = [{f'G{i}': float(i % j + 1) for i in range(0, 30, j)} for j in range(2, 8)]
+
+    async def test_coalesced_requests(self):
+        """Test that concurrent requests share a kernel product and match the synchronous scores."""
+        with mock.patch.object(self.session, 'diffuse_batch', wraps=self.session.diffuse_batch) as diffuse_batch:
+            observed = await asyncio.gather(*(diffuse_async(input, self.session, method=Z) for input in self.inputs))
+
+        self.assertEqual(diffuse_batch.call_count, 1)
+
+        for input, scores in zip(self.inputs, observed):
+            expected = self.session.diffuse(input, method=Z)
+
+            self.assertEqual(scores.cols_labels, expected.cols_labels)
+            np.testing.assert_allclose(scores.mat, expected.mat)
+
+    async def test_cancelled_request(self):
+        """Test that requests cancelled while pending are dropped from their batch, without failing the rest of it."""
+        with mock.patch.object(self.session, 'diffuse_batch', wraps=self.session.diffuse_batch) as diffuse_batch:
+            tasks = [asyncio.create_task(diffuse_async(input, self.session)) for input in self.inputs]
+
+            # The requests are submitted, and their batch pending, before the first one is cancelled
+            await asyncio.sleep(0)
+            tasks[0].cancel()
+
+            observed = await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.assertEqual(len(diffuse_batch.call_args[0][0]), len(self.inputs) - 1)
+        self.assertIsInstance(observed[0], asyncio.CancelledError)
+        for input, scores in zip(self.inputs[1:], observed[1:]):
+            np.testing.assert_allclose(scores.mat, self.session.diffuse(input).mat)
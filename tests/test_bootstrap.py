@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the bootstrap confidence intervals."""
+
+import unittest
+
+import numpy as np
+from sklearn import metrics
+
+from diffupath.bootstrap import bootstrap_confidence_intervals, bootstrap_metrics, store_scores
+
+
+class BootstrapTest(unittest.TestCase):
+    """Test the vectorized bootstrap replicates and intervals."""
+
+    def setUp(self):
+        """Generate validation labels and informative scores of three iterations."""
+        rng = np.random.default_rng(0)
+
+        self.labels = rng.random((200, 3)) < 0.1
+        self.scores = self.labels + rng.normal(0, 0.8, (200, 3))
+
+    def test_replicates(self):
+        """Test that replicates match scikit-learn on the resampled nodes and do not depend on the chunk size."""
+        auroc, auprc = bootstrap_metrics(self.labels, self.scores, n_bootstraps=50, seed=1)
+        chunked_auroc, chunked_auprc = bootstrap_metrics(
+            self.labels, self.scores, n_bootstraps=50, seed=1, max_memory=1,
+        )
+
+        np.testing.assert_allclose(auroc, chunked_auroc)
+        np.testing.assert_allclose(auprc, chunked_auprc)
+
+        # First replicate, resampling the same nodes for every iteration
+        index = np.random.default_rng(1).integers(0, 200, 200)
+        expected = np.mean([
+            metrics.roc_auc_score(self.labels[index, j], self.scores[index, j]) for j in range(3)
+        ])
+        self.assertAlmostEqual(auroc[0], expected)
+
+    def test_confidence_intervals(self):
+        """Test that intervals of stored scores contain the point estimates, and shrink with more iterations."""
+        scores_store = {}
+        for j in range(3):
+            store_scores(scores_store, 'raw', np.where(self.labels[:, j], 1, -1), self.scores[:, j])
+        store_scores(scores_store, 'single', np.where(self.labels[:, 0], 1, -1), self.scores[:, 0])
+
+        intervals = bootstrap_confidence_intervals(scores_store, n_bootstraps=500, seed=0)
+
+        point = np.mean([metrics.roc_auc_score(self.labels[:, j], self.scores[:, j]) for j in range(3)])
+        low, high = intervals['raw']['auroc']
+        self.assertLess(low, point)
+        self.assertLess(point, high)
+
+        single_low, single_high = intervals['single']['auroc']
+        self.assertLess(high - low, single_high - single_low)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the DiffuPath directory management."""
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from diffupath.cache import (
+    CORRUPTED, RECORDED, VERIFIED, get_artifacts, prune_cache, read_manifest, record_access, verify_artifacts,
+    warm_artifacts,
+)
+from diffupath.kernel_io import get_rows_end, write_kernel_file
+
+from .networks import get_test_kernel
+
+
+class CacheTest(unittest.TestCase):
+    """Test the stats, pruning and checks of the DiffuPath directory artifacts."""
+
+    def setUp(self):
+        """Fill a temporary DiffuPath directory with a kernel file and an output."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp_dir.name
+
+        os.makedirs(os.path.join(self.cache_dir, 'kernels'))
+        os.makedirs(os.path.join(self.cache_dir, 'output'))
+
+        self.kernel_path = os.path.join(self.cache_dir, 'kernels', 'kernel.dpk')
+        write_kernel_file(get_test_kernel(20), self.kernel_path, metadata={'build_seconds': 2.})
+
+        self.output_path = os.path.join(self.cache_dir, 'output', 'scores.csv')
+        with open(self.output_path, 'w') as file:
+            file.write('Node,score\na,1\n')
+
+    def tearDown(self):
+        """Remove the temporary DiffuPath directory."""
+        self.tmp_dir.cleanup()
+
+    def test_artifacts(self):
+        """Test that artifacts are listed with their category and build cost."""
+        artifacts = {artifact.path: artifact for artifact in get_artifacts(self.cache_dir)}
+
+        self.assertEqual(set(artifacts), {self.kernel_path, self.output_path})
+        self.assertEqual(artifacts[self.kernel_path].category, 'kernels')
+        self.assertEqual(artifacts[self.kernel_path].build_seconds, 2.)
+        self.assertIsNone(artifacts[self.output_path].build_seconds)
+
+    def test_verify(self):
+        """Test that checksums are recorded, verified and that corrupted artifacts are reported."""
+        self.assertEqual(verify_artifacts(self.cache_dir), {self.kernel_path: VERIFIED, self.output_path: RECORDED})
+        self.assertEqual(verify_artifacts(self.cache_dir)[self.output_path], VERIFIED)
+
+        # Corrupt the last byte of the kernel body
+        with open(self.kernel_path, 'r+b') as file:
+            file.seek(-1, os.SEEK_END)
+            file.write(b'\1')
+
+        self.assertEqual(verify_artifacts(self.cache_dir)[self.kernel_path], CORRUPTED)
+
+    def test_prune_least_recently_used(self):
+        """Test that the least recently used artifacts are evicted first."""
+        record_access(self.output_path, self.cache_dir)
+
+        kernel_size = os.path.getsize(self.kernel_path)
+
+        evicted = prune_cache(kernel_size, self.cache_dir, dry_run=True)
+        self.assertEqual([artifact.path for artifact in evicted], [self.kernel_path])
+        self.assertTrue(os.path.isfile(self.kernel_path))
+
+        prune_cache(kernel_size, self.cache_dir)
+        self.assertEqual([artifact.path for artifact in get_artifacts(self.cache_dir)], [self.output_path])
+
+    def test_concurrent_accesses(self):
+        """Test that no access is lost when recorded by concurrent processes."""
+        paths = [os.path.join(self.cache_dir, 'output', f'scores_{i}.csv') for i in range(64)]
+        for path in paths:
+            open(path, 'w').close()
+
+        with ProcessPoolExecutor(max_workers=8) as executor:
+            list(executor.map(partial(record_access, cache_dir=self.cache_dir), paths))
+
+        self.assertEqual(set(read_manifest(self.cache_dir)), {os.path.relpath(path, self.cache_dir) for path in paths})
+
+    def test_warm_first_rows(self):
+        """Test that the header and the first rows of a kernel file can be paged in without the rest of the file."""
+        rows_end = get_rows_end(self.kernel_path, 5)
+        first_rows = get_test_kernel(20).mat[:5]
+
+        with open(self.kernel_path, 'rb') as file:
+            file.seek(rows_end - first_rows.nbytes)
+            self.assertEqual(file.read(first_rows.nbytes), first_rows.tobytes())
+
+        self.assertEqual(warm_artifacts([self.kernel_path], chunk_size=64, max_bytes=rows_end), rows_end)
+        self.assertEqual(warm_artifacts([self.kernel_path], chunk_size=64), os.path.getsize(self.kernel_path))
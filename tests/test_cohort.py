@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the cohort diffusion."""
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from diffupy.constants import Z
+
+from diffupath.cohort import diffuse_cohort
+from diffupath.kernel_diffusion import diffuse_by_method
+from diffupath.label_index import LabelIndex
+
+from .networks import get_test_kernel
+
+
+class CohortTest(unittest.TestCase):
+    """Test that streamed cohorts are diffused as their samples one by one."""
+
+    def setUp(self):
+        """Write a cohort matrix over a subset of the kernel nodes, plus unmapped features."""
+        self.kernel = get_test_kernel(30, prefix='g')
+
+        random_state = np.random.RandomState(0)
+        self.cohort = pd.DataFrame(
+            random_state.normal(size=(11, 12)),
+            index=[f's{i}' for i in range(11)],
+            columns=[f'G{i}' for i in range(10)] + ['unknown1', 'unknown2'],
+        ).rename_axis('Sample')
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'cohort.tsv')
+        self.cohort.to_csv(self.path, sep='\t')
+
+    def tearDown(self):
+        """Remove the temporary files."""
+        self.tmp_dir.cleanup()
+
+    def test_chunks_match_single_samples(self):
+        """Test that chunked z-scores match the diffusion of each sample on its own."""
+        observed = diffuse_cohort(self.path, self.kernel, method=Z, chunk_size=4)
+
+        self.assertEqual(observed.rows_labels, list(self.cohort.index))
+
+        label_index = LabelIndex.from_kernel(self.kernel)
+
+        for i, (sample, scores) in enumerate(self.cohort.iterrows()):
+            input_scores = label_index.format_input(scores.to_dict(), missing_value=0)
+            expected = diffuse_by_method(input_scores, Z, self.kernel)
+
+            np.testing.assert_allclose(observed.mat[i], expected.mat[:, 0])
+
+    def test_npy_output(self):
+        """Test that .npy cohorts and outputs match the in memory results."""
+        npy_path = os.path.join(self.tmp_dir.name, 'cohort.npy')
+        np.save(npy_path, self.cohort.values)
+
+        output = os.path.join(self.tmp_dir.name, 'scores.npy')
+        diffuse_cohort(npy_path, self.kernel, output=output, chunk_size=5, feature_labels=list(self.cohort.columns))
+
+        np.testing.assert_allclose(np.load(output), diffuse_cohort(self.path, self.kernel).mat)
+
+        with open(os.path.join(self.tmp_dir.name, 'scores.labels.json')) as file:
+            self.assertEqual(json.load(file)['cols_labels'], self.kernel.rows_labels)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the diffusion pipeline."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from diffupy.constants import BER_S, GM, JSON, ML, RAW, Z
+
+from diffupath import diffuse
+from diffupath.constants import PATHME_DB
+from diffupath.diffuse import run_diffusion
+from diffupath.kernel_build import build_kernels, plan_kernel_builds
+from diffupath.kernel_diffusion import diffuse_by_method
+from diffupath.label_index import LabelIndex
+from diffupath.results import NODE_COLUMN, read_scores
+
+from .networks import get_test_graph, get_test_kernel
+
+
+class RunDiffusionTest(unittest.TestCase):
+    """Test the dispatch of the diffusion methods."""
+
+    def setUp(self):
+        """Build the test kernel and input."""
+        self.kernel = get_test_kernel()
+        self.input = [str(node) for node in range(0, 40, 5)]
+
+    def _run(self, method):
+        return run_diffusion(self.input, network=self.kernel, method=method)
+
+    def test_single_method_list(self):
+        """Test that a list of a single method is diffused as the method itself."""
+        for method in (RAW, Z, ML):
+            np.testing.assert_allclose(self._run([method]).mat, self._run(method).mat, err_msg=method)
+
+    def test_single_kernel_methods(self):
+        """Test that the kernel-level methods run on their own as within a list of methods."""
+        for method in (GM, BER_S):
+            for methods in (method, [method]):
+                observed = self._run(methods)
+                expected = self._run([RAW, method])
+
+                np.testing.assert_allclose(
+                    observed.mat[:, 0], expected.mat[:, expected.cols_labels.index(method)], err_msg=method,
+                )
+
+    def test_output_format(self):
+        """Test that outputs are CSV, unless their extension is of a binary format or another format is requested."""
+        expected = self._run(RAW)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('scores.csv', 'scores.txt', 'scores', 'scores.json'):
+                path = os.path.join(directory, name)
+                run_diffusion(self.input, network=self.kernel, output=path)
+
+                np.testing.assert_allclose(pd.read_csv(path, index_col=NODE_COLUMN).values, expected.mat, err_msg=name)
+
+            path = os.path.join(directory, 'scores.npz')
+            run_diffusion(self.input, network=self.kernel, output=path)
+            np.testing.assert_allclose(read_scores(path).mat, expected.mat)
+
+            path = os.path.join(directory, 'requested.json')
+            run_diffusion(self.input, network=self.kernel, output=path, format_output=JSON)
+            np.testing.assert_allclose(read_scores(path).mat, expected.mat)
+
+
+class KernelStoreTest(unittest.TestCase):
+    """Test that the kernels prebuilt in the kernel store are loaded by the diffusion pipeline, not recomputed."""
+
+    def setUp(self):
+        """Build the test graph and an empty DiffuPath directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.graph = get_test_graph()
+        self.input = [str(node) for node in range(0, 40, 5)]
+
+    def tearDown(self):
+        """Remove the DiffuPath directory."""
+        self.tmp_dir.cleanup()
+
+    def _build(self, **kwargs):
+        """Plan and build the kernels of the test graph in the kernel store."""
+        graph_path = os.path.join(self.tmp_dir.name, 'graphs', 'universe.pickle')
+
+        with mock.patch('diffupath.kernel_build.process_graph_from_file', return_value=self.graph), \
+                mock.patch('diffupath.kernel_build.get_subgraph_by_annotation_value', return_value=self.graph):
+            jobs = plan_kernel_builds(graph_path, os.path.join(self.tmp_dir.name, 'kernels'), **kwargs)
+
+        build_kernels(jobs, workers=1)
+
+    def _run_from_store(self, **kwargs):
+        """Run the diffusion with the kernel store of the temporary directory, failing if a kernel is computed."""
+        recomputed = AssertionError('Kernel recomputed')
+        download = {'download_file_from_google_drive.side_effect': recomputed}
+
+        with mock.patch.object(diffuse, 'DEFAULT_DIFFUPATH_DIR', self.tmp_dir.name), \
+                mock.patch.object(diffuse, 'KERNELS_PATH', os.path.join(self.tmp_dir.name, 'kernels')), \
+                mock.patch.object(diffuse, 'get_kernel_from_graph', side_effect=recomputed), \
+                mock.patch.object(diffuse, 'get_kernel_from_network_path', side_effect=recomputed), \
+                mock.patch.object(diffuse, 'GoogleDriveDownloader', **download), \
+                mock.patch.object(diffuse, 'generate_universe', side_effect=recomputed):
+            return run_diffusion(self.input, **kwargs)
+
+    def _assert_scores(self, scores):
+        kernel = get_test_kernel()
+        expected = diffuse_by_method(LabelIndex.from_kernel(kernel).format_input(self.input), RAW, kernel)
+
+        np.testing.assert_allclose(scores.mat, expected.mat)
+
+    def test_specie_kernel(self):
+        """Test that the kernel built for a specie is loaded for it."""
+        graphs_dir = os.path.join(self.tmp_dir.name, 'graphs')
+        os.makedirs(graphs_dir)
+        open(os.path.join(graphs_dir, 'mmu_pathme_universe.pickle'), 'w').close()
+
+        self._build(databases=[], species=['mmu'], graphs_dir=graphs_dir)
+
+        self._assert_scores(self._run_from_store(specie='mmu'))
+
+    def test_database_kernel(self):
+        """Test that the kernels built for a database and for the PathMe databases are loaded for them."""
+        self._build(databases=[['kegg'], sorted(PATHME_DB)])
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp_dir.name, 'kernels', 'by_db'))), [
+            'kegg.dpk', 'pathme.dpk',
+        ])
+
+        self._assert_scores(self._run_from_store(database='kegg'))
+        self._assert_scores(self._run_from_store(database=sorted(PATHME_DB)))
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the kernel representations."""
+
+import copy
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from diffupy.constants import BER_P, BER_S, GM, MC, ML, RAW, Z
+from diffupy.diffuse import diffuse
+from diffupy.diffuse_raw import diffuse_raw
+
+from diffupath.compact_kernel import compact_kernel
+from diffupath.kernel_diffusion import (
+    check_kernel_precision, diffuse_by_blocks, diffuse_by_method, diffuse_by_methods, diffuse_on_kernel,
+    kernel_ranking_agreement, random_probe_input,
+)
+from diffupath.kernel_build import KernelBuildJob, build_kernels, get_database_kernel_name, get_node_types
+from diffupath.kernel_io import (
+    MappedKernel, get_kernel_info, get_label_coverage, read_kernel_file, read_kernel_header, write_kernel_file,
+)
+from diffupath.permutations import diffuse_by_permutations
+from diffupath.sparse_kernel import sparsify_kernel
+
+from .networks import get_test_graph, get_test_kernel
+
+
+class KernelDiffusionTest(unittest.TestCase):
+    """Test the diffusion over the different kernel representations."""
+
+    def setUp(self):
+        """Build the test kernel and input."""
+        self.kernel = get_test_kernel()
+        self.input_scores = random_probe_input(self.kernel, n_positives=8, seed=2)
+
+    def test_dense_matches_diffupy(self):
+        """Test that raw and z-scores match the diffupy reference implementation."""
+        for z in (False, True):
+            expected = diffuse_raw(graph=None, scores=self.input_scores, k=self.kernel, z=z)
+            observed = diffuse_on_kernel(self.input_scores, self.kernel, z=z)
+
+            np.testing.assert_allclose(observed.mat, expected.mat)
+
+    def test_methods_from_shared_product(self):
+        """Test that the methods computed together match the methods computed one by one."""
+        methods = [RAW, ML, GM, Z, BER_S, MC, BER_P]
+        observed = diffuse_by_methods(self.input_scores, methods, self.kernel, n_permutations=200, seed=3)
+
+        self.assertEqual(observed.cols_labels, methods)
+
+        expected = {
+            GM: diffuse(self.input_scores, GM, k=self.kernel).mat[:, 0],
+            BER_S: diffuse_on_kernel(self.input_scores, self.kernel).mat[:, 0] / (self.input_scores.mat[:, 0] + 1),
+        }
+        for method in (RAW, ML, Z):
+            expected[method] = diffuse_by_method(self.input_scores, method, self.kernel).mat[:, 0]
+        for method in (MC, BER_P):
+            expected[method] = diffuse_by_permutations(
+                self.input_scores, method, self.kernel, n_permutations=200, seed=3,
+            ).mat[:, 0]
+
+        for j, method in enumerate(methods):
+            np.testing.assert_allclose(observed.mat[:, j], expected[method], err_msg=method)
+
+    def test_sparsify_top_k(self):
+        """Test that the sparsified kernel keeps the top-k entries per column and the diagonal."""
+        sparse_kernel = sparsify_kernel(self.kernel, top_k=5)
+
+        self.assertEqual(sparse_kernel.rows_labels, self.kernel.rows_labels)
+        self.assertTrue(all(5 <= nnz <= 6 for nnz in sparse_kernel.mat.getnnz(axis=0)))
+        np.testing.assert_allclose(sparse_kernel.mat.diagonal(), np.diag(self.kernel.mat))
+
+    def test_full_sparse_kernel_matches_dense(self):
+        """Test that keeping every entry reproduces the dense diffusion scores."""
+        sparse_kernel = sparsify_kernel(self.kernel, top_k=len(self.kernel.rows_labels))
+
+        for z in (False, True):
+            np.testing.assert_allclose(
+                diffuse_on_kernel(self.input_scores, sparse_kernel, z=z).mat,
+                diffuse_on_kernel(self.input_scores, self.kernel, z=z).mat,
+            )
+
+        agreement = kernel_ranking_agreement(self.kernel, sparse_kernel, self.input_scores)
+        self.assertAlmostEqual(agreement['probe']['kendall_tau'], 1.)
+        self.assertAlmostEqual(agreement['probe']['auroc'], 1.)
+
+    def test_packed_kernel_matches_dense(self):
+        """Test that the packed kernel products and row sums match the dense kernel, for narrow and wide inputs."""
+        packed_kernel = compact_kernel(self.kernel, dtype=None, packed=True)
+
+        np.testing.assert_allclose(packed_kernel.to_dense().mat, self.kernel.mat)
+
+        for n_cols in (1, 12):
+            mat = np.random.RandomState(n_cols).rand(len(self.kernel.rows_labels), n_cols)
+            np.testing.assert_allclose(packed_kernel.dot(mat), self.kernel.mat @ mat)
+
+        np.testing.assert_allclose(packed_kernel.row_sums()[0], self.kernel.mat.sum(axis=1))
+
+    def test_packed_row_blocks(self):
+        """Test that row blocks unpacked anywhere in the packed kernel match the dense rows."""
+        packed_kernel = compact_kernel(self.kernel, dtype=None, packed=True)
+
+        for start, stop in ((0, 1), (5, 17), (30, 45), (39, 40)):
+            np.testing.assert_allclose(packed_kernel.get_rows(start, stop), self.kernel.mat[start:stop])
+
+    def test_asymmetric_kernel_not_packed(self):
+        """Test that packing a kernel which is not symmetric, beyond its first row and column, is refused."""
+        asymmetric_kernel = copy.copy(self.kernel)
+        asymmetric_kernel.mat = self.kernel.mat.copy()
+        asymmetric_kernel.mat[20, 30] += 1
+
+        with self.assertRaises(ValueError):
+            compact_kernel(asymmetric_kernel, packed=True)
+
+    def test_float32_kernel_precision(self):
+        """Test that float32 and packed float32 kernels preserve the float64 rankings."""
+        for packed in (False, True):
+            precision = check_kernel_precision(
+                self.kernel,
+                compact_kernel(self.kernel, dtype='float32', packed=packed),
+                input_scores=self.input_scores,
+            )
+
+            self.assertGreater(precision['kendall_tau'], 0.99)
+            self.assertLess(precision['max_abs_error'], 1e-3)
+
+
+class KernelFileTest(unittest.TestCase):
+    """Test the kernel files and the out-of-core diffusion over them."""
+
+    def setUp(self):
+        """Build the test kernel and input."""
+        self.kernel = get_test_kernel()
+        self.input_scores = random_probe_input(self.kernel, n_positives=8, seed=3)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the temporary kernel files."""
+        self.tmp_dir.cleanup()
+
+    def test_kernel_file_round_trip(self):
+        """Test that dense, sparse and packed kernels are read back as written."""
+        for kernel in (
+            self.kernel,
+            sparsify_kernel(self.kernel, top_k=5),
+            compact_kernel(self.kernel, dtype='float32', packed=True),
+        ):
+            path = os.path.join(self.tmp_dir.name, 'kernel.dpk')
+            write_kernel_file(kernel, path)
+
+            for mmap in (True, False):
+                read_kernel = read_kernel_file(path, mmap=mmap)
+
+                self.assertEqual(read_kernel.rows_labels, kernel.rows_labels)
+                np.testing.assert_array_equal(
+                    diffuse_on_kernel(self.input_scores, read_kernel).mat,
+                    diffuse_on_kernel(self.input_scores, kernel).mat,
+                )
+
+    def test_blocked_diffusion_matches_in_memory(self):
+        """Test that streaming a memory-mapped kernel by row blocks reproduces the in-memory scores."""
+        path = os.path.join(self.tmp_dir.name, 'kernel.dpk')
+        write_kernel_file(self.kernel, path)
+
+        mapped_kernel = read_kernel_file(path)
+        self.assertIsInstance(mapped_kernel, MappedKernel)
+
+        for method in (RAW, Z):
+            expected = diffuse_on_kernel(self.input_scores, self.kernel, z=method == Z).mat
+
+            np.testing.assert_allclose(
+                diffuse_by_blocks(self.input_scores, method, mapped_kernel, block_size=7).mat,
+                expected,
+            )
+
+            csv_path = diffuse_by_blocks(
+                self.input_scores, method, mapped_kernel, block_size=7,
+                output=os.path.join(self.tmp_dir.name, 'scores.csv'),
+            )
+            np.testing.assert_allclose(pd.read_csv(csv_path, index_col=0).values, expected)
+
+            npy_path = diffuse_by_blocks(
+                self.input_scores, method, mapped_kernel, block_size=7,
+                output=os.path.join(self.tmp_dir.name, 'scores.npy'),
+            )
+            np.testing.assert_allclose(np.load(npy_path), expected)
+
+    def test_build_kernels(self):
+        """Test that kernels are built in parallel and written as kernel files with their build metadata."""
+        jobs = [
+            KernelBuildJob(
+                name=f'graph_{n_nodes}',
+                graph=get_test_graph(n_nodes),
+                output=os.path.join(self.tmp_dir.name, 'by_db', f'graph_{n_nodes}.dpk'),
+                databases=['kegg'],
+            )
+            for n_nodes in (20, 30, 40)
+        ]
+
+        # The budget only fits one job at a time
+        reports = build_kernels(jobs, workers=2, memory_budget=jobs[-1].memory)
+
+        self.assertEqual({report.name for report in reports}, {job.name for job in jobs})
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp_dir.name, 'by_db'))), sorted(
+            os.path.basename(job.output) for job in jobs
+        ))
+
+        header = read_kernel_header(jobs[-1].output)
+        self.assertEqual(header['kernel_method'], 'regularised_laplacian_kernel')
+        self.assertEqual(header['kernel_params']['normalized'], False)
+        self.assertIn('build_seconds', header['metadata'])
+        np.testing.assert_allclose(read_kernel_file(jobs[-1].output).mat, self.kernel.mat)
+
+    def test_database_kernel_names(self):
+        """Test that the PathMe combinations are stored under their own names, and other combinations by database."""
+        self.assertEqual(get_database_kernel_name(['KEGG']), 'kegg')
+        self.assertEqual(get_database_kernel_name(['wikipathways', 'reactome', 'kegg']), 'pathme')
+        self.assertEqual(get_database_kernel_name(['kegg', 'reactome', 'wikipathways', 'drugbank']), 'pathme_drugbank')
+        self.assertEqual(
+            get_database_kernel_name(['kegg', 'reactome', 'wikipathways', 'mirtarbase']), 'pathme_mirtarbase',
+        )
+        self.assertEqual(get_database_kernel_name(['reactome', 'kegg']), '_kegg_reactome')
+
+    def test_kernel_info_from_header(self):
+        """Test that node types, provenance and coverage are read from the header."""
+        graph = get_test_graph()
+        nx.set_node_attributes(graph, {node: 'genes' if int(node) % 2 else 'metabolites' for node in graph}, 'type')
+
+        path = os.path.join(self.tmp_dir.name, 'kernel.dpk')
+        write_kernel_file(
+            compact_kernel(self.kernel, dtype='float32'),
+            path,
+            node_types=get_node_types(graph),
+            databases=['reactome', 'kegg'],
+            kernel_method='regularised_laplacian_kernel',
+        )
+
+        kernel_info = get_kernel_info(path)
+
+        self.assertEqual(kernel_info['n_nodes'], 40)
+        self.assertEqual(kernel_info['dtype'], '<f4')
+        self.assertEqual(kernel_info['databases'], ['kegg', 'reactome'])
+        self.assertEqual(kernel_info['node_types'], {'genes': 20, 'metabolites': 20})
+
+        self.assertEqual(
+            get_label_coverage(path, ['0', '1', '3', 'unknown']),
+            {'genes': (2, 20), 'metabolites': (1, 20)},
+        )
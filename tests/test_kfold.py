@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the k-fold cross-validation and the vectorized metrics."""
+
+import unittest
+
+import numpy as np
+from diffupy.constants import RAW, Z
+from sklearn import metrics
+
+from diffupath.kfold import get_fold_assignment, validation_by_kfold
+from diffupath.metrics import get_metrics_by_column
+
+from .networks import get_test_kernel
+
+
+class KFoldTest(unittest.TestCase):
+    """Test the fold assignment, the column-wise metrics and the k-fold validation."""
+
+    def test_stratified_folds_and_metrics(self):
+        """Test that strata are spread evenly over the folds, and the column-wise metrics match scikit-learn."""
+        strata = np.repeat([0, 1, 2], [30, 20, 7])
+        folds = get_fold_assignment(strata, k=5, rng=np.random.default_rng(0))
+
+        for stratum in range(3):
+            counts = np.bincount(folds[strata == stratum], minlength=5)
+            self.assertLessEqual(counts.max() - counts.min(), 1)
+
+        self.assertLessEqual(np.ptp(np.bincount(folds)), 1)
+
+        rng = np.random.default_rng(1)
+        labels = np.where(rng.random((50, 4)) < 0.2, 1, -1)
+        # Rounded scores, so that the metrics are checked with ties
+        scores = np.round(rng.random((50, 4)), 1)
+
+        auroc, auprc = get_metrics_by_column(labels, scores)
+
+        for j in range(4):
+            self.assertAlmostEqual(auroc[j], metrics.roc_auc_score(labels[:, j], scores[:, j]))
+            self.assertAlmostEqual(auprc[j], metrics.average_precision_score(labels[:, j], scores[:, j]))
+
+    def test_validation_by_kfold(self):
+        """Test that stratified k-fold returns a metric per fold and repeat, reproducible from its seed."""
+        kernel = get_test_kernel(60, prefix='g')
+
+        mapping_by_entity = {
+            'gene': [f'G{i}' for i in range(0, 40, 2)],
+            'metabolite': {f'g{i}': 1.0 for i in range(41, 59, 3)},
+        }
+
+        auroc_metrics, auprc_metrics = validation_by_kfold(mapping_by_entity, kernel, k=5, repeats=3, seed=0)
+
+        self.assertEqual(set(auroc_metrics), {RAW, Z, 'random'})
+        self.assertTrue(all(len(values) == 15 for values in auprc_metrics.values()))
+        self.assertEqual(auroc_metrics, validation_by_kfold(mapping_by_entity, kernel, k=5, repeats=3, seed=0)[0])
+
+    def test_binned_validation(self):
+        """Test that held-out values are binned into validation labels, as in the repeated holdout."""
+        kernel = get_test_kernel(60, prefix='g')
+
+        rows = np.arange(0, 60, 2)
+        values = np.resize([1.0, 0.0, -1.0, 0.7], len(rows))
+
+        auroc = validation_by_kfold(dict(zip((f'g{row}' for row in rows), values)), kernel, k=5, seed=0)[0][RAW]
+
+        folds = get_fold_assignment(np.zeros(len(rows)), k=5, rng=np.random.default_rng(0))
+        input_mat, validation_mat = np.full((60, 5), -1.), np.full((60, 5), -1.)
+
+        for fold in range(5):
+            held_out = folds == fold
+            input_mat[rows[~held_out], fold] = values[~held_out]
+            validation_mat[rows[held_out], fold] = values[held_out] >= 0.5
+
+        np.testing.assert_allclose(auroc, get_metrics_by_column(validation_mat, kernel.mat @ input_mat)[0])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the label index."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from diffupy.matrix import Matrix
+from diffupy.process_input import format_input_for_diffusion
+
+from diffupath.kernel_io import read_label_index, write_kernel_file
+from diffupath.label_index import LabelIndex, build_alias_index
+
+KERNEL_LABELS = ['mir-21', 'tp53', 'htr1a,b,d', 'l-glutamate', 'apoptosis', 'acetyl-coa', 'c4d, ic3b']
+
+
+class LabelIndexTest(unittest.TestCase):
+    """Test the mapping and formatting of inputs through the label index."""
+
+    def setUp(self):
+        """Build a kernel with labels needing normalization."""
+        self.kernel = Matrix(np.eye(len(KERNEL_LABELS)), rows_labels=KERNEL_LABELS, quadratic=True)
+        self.label_index = LabelIndex.from_kernel(self.kernel)
+
+    def test_normalized_labels(self):
+        """Test that munged inputs, Reactome identifiers and aliases map to the kernel rows."""
+        np.testing.assert_array_equal(
+            self.label_index.get_rows(['mir21', 'TP53', 'htr1b', 'lglutamate', 'unknown']),
+            [0, 1, 2, 3, -1],
+        )
+
+        label_index = LabelIndex.from_kernel(self.kernel, aliases={'p53': 'tp53'})
+        np.testing.assert_array_equal(label_index.get_rows(['p53']), [1])
+
+    def test_curation_aliases(self):
+        """Test the aliases compiled from the PathMe curation rules and the decorated labels resolved by prefix."""
+        aliases = build_alias_index(KERNEL_LABELS)
+
+        self.assertEqual(aliases['htr1d'], 'htr1a,b,d')
+        self.assertEqual(aliases['acetyl coa'], 'acetyl-coa')
+        # Protein complexes are not split into identifiers
+        self.assertNotIn('ic3b', aliases)
+
+        np.testing.assert_array_equal(
+            self.label_index.get_rows(['acetylcoa(mit)', 'tp53gene', 'mir215p', 'tp5', 'tp53x']),
+            [5, 1, 0, -1, -1],
+        )
+
+    def test_format_input_matches_diffupy(self):
+        """Test that exactly matching inputs are formatted as in diffupy."""
+        for processed_input in (
+            ['tp53', 'apoptosis'],
+            {'tp53': 0.5, 'apoptosis': -2.},
+            {'genes': {'tp53': 1.}, 'bps': {'apoptosis': 1.}},
+        ):
+            observed = self.label_index.format_input(processed_input)
+            # diffupy pops the type dicts while formatting them
+            expected = format_input_for_diffusion(processed_input, self.kernel)
+
+            self.assertEqual(observed.rows_labels, self.kernel.rows_labels)
+            for col_label in expected.cols_labels:
+                np.testing.assert_array_equal(
+                    observed.mat[:, observed.cols_labels.index(col_label)],
+                    expected.match_rows(self.kernel).mat[:, expected.cols_labels.index(col_label)],
+                )
+
+    def test_mapping_report(self):
+        """Test that unmapped labels are reported by column."""
+        report = self.label_index.mapping_report({'genes': ['tp53', 'brca1'], 'mirna': ['mir21']})
+
+        self.assertEqual(report['genes'], {'mapped': 1, 'total': 2, 'unmapped': ['brca1']})
+        self.assertEqual(report['mirna']['unmapped'], [])
+
+    def test_label_index_in_kernel_file(self):
+        """Test that the label index is persisted in the kernel file header."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'kernel.dpk')
+            write_kernel_file(self.kernel, path)
+
+            np.testing.assert_array_equal(
+                read_label_index(path).get_rows(['htr1d', 'mir21']),
+                self.label_index.get_rows(['htr1d', 'mir21']),
+            )
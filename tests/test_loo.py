@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the closed-form leave-one-out validation."""
+
+import unittest
+
+from diffupy.constants import RAW, Z
+from diffupy.process_input import format_input_for_diffusion
+
+from diffupath.compact_kernel import pack_kernel
+from diffupath.kernel_diffusion import diffuse_on_kernel
+from diffupath.loo import loo_scores, validation_by_loo
+
+from .networks import get_test_kernel
+
+
+class LeaveOneOutTest(unittest.TestCase):
+    """Test that the closed-form held-out scores match one diffusion per held-out label."""
+
+    def setUp(self):
+        """Compute a test kernel and input."""
+        self.kernel = get_test_kernel(30, prefix='g')
+        self.labels = {f'g{i}': float(i % 4) - 1.5 for i in range(0, 30, 3)}
+
+    def test_matches_diffusion_per_label(self):
+        """Test raw and z held-out scores of dense and packed kernels against diffusing each held-out input."""
+        input_diff = format_input_for_diffusion(self.labels, self.kernel)
+
+        for kernel in (self.kernel, pack_kernel(self.kernel)):
+            for z in (False, True):
+                scores = loo_scores(input_diff, kernel, z=z).mat[:, 0]
+
+                for label in self.labels:
+                    held_out = format_input_for_diffusion(
+                        {other: score for other, score in self.labels.items() if other != label}, self.kernel,
+                    )
+                    i = self.kernel.rows_labels.index(label)
+
+                    expected = diffuse_on_kernel(held_out, self.kernel, z=z).mat[i, 0]
+                    self.assertAlmostEqual(scores[i], expected, places=6)
+
+    def test_validation_by_loo(self):
+        """Test that the validation returns a single metric per method."""
+        auroc_metrics, auprc_metrics = validation_by_loo(list(self.labels), self.kernel)
+
+        self.assertEqual(set(auroc_metrics), {RAW, Z, 'random'})
+        self.assertTrue(all(len(values) == 1 and 0 <= values[0] <= 1 for values in auprc_metrics.values()))
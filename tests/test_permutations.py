@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the permutation engine."""
+
+import unittest
+
+import numpy as np
+
+from diffupath.kernel_diffusion import diffuse_on_kernel, random_probe_input
+from diffupath.permutations import permutation_test
+
+from .networks import get_test_kernel
+
+
+class PermutationTest(unittest.TestCase):
+    """Test the batched permutation engine."""
+
+    def setUp(self):
+        """Build the test kernel and input."""
+        self.kernel = get_test_kernel(30)
+        self.input_scores = random_probe_input(self.kernel, n_positives=6, seed=2)
+
+    def test_reproducible_across_workers(self):
+        """Test that results only depend on the seed, not on the number of worker processes."""
+        in_process = permutation_test(self.input_scores.mat, self.kernel, n_permutations=300, batch_size=64, seed=1)
+        sharded = permutation_test(
+            self.input_scores.mat, self.kernel, n_permutations=300, batch_size=64, seed=1, workers=2,
+        )
+
+        for observed, expected in zip(sharded[:4], in_process[:4]):
+            np.testing.assert_allclose(observed, expected)
+
+        self.assertTrue(np.all((in_process.p_values > 0) & (in_process.p_values <= 1)))
+
+    def test_moments_match_z_scores(self):
+        """Test that the permutation moments converge to the analytical z-score normalization."""
+        result = permutation_test(self.input_scores.mat, self.kernel, n_permutations=5000, batch_size=1000, seed=0)
+
+        z_scores = diffuse_on_kernel(self.input_scores, self.kernel, z=True).mat
+
+        np.testing.assert_allclose((result.raw - result.means) / result.stds, z_scores, atol=0.1)
+
+    def test_moments_match_one_shot(self):
+        """Test that the moments accumulated batch by batch match those of all the permuted scores at once."""
+        n_permutations, batch_size = 300, 64
+        result = permutation_test(
+            self.input_scores.mat, self.kernel, n_permutations=n_permutations, batch_size=batch_size, seed=1,
+        )
+
+        batch_sizes = [min(batch_size, n_permutations - start) for start in range(0, n_permutations, batch_size)]
+        n_nodes, n_cols = self.input_scores.mat.shape
+
+        permuted_scores = np.concatenate([
+            (self.kernel.mat @ np.random.default_rng(seed).permuted(
+                np.repeat(self.input_scores.mat, size, axis=1), axis=0,
+            )).reshape(n_nodes, n_cols, size)
+            for size, seed in zip(batch_sizes, np.random.SeedSequence(1).spawn(len(batch_sizes)))
+        ], axis=2)
+
+        np.testing.assert_allclose(result.means, permuted_scores.mean(axis=2))
+        np.testing.assert_allclose(result.stds, permuted_scores.std(axis=2, ddof=1))
+        np.testing.assert_allclose(
+            result.p_values,
+            (np.sum(permuted_scores >= result.raw[:, :, np.newaxis], axis=2) + 1) / (n_permutations + 1),
+        )
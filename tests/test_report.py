@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the report rendering."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from diffupath.report import BOX_PLOT, FDR_BARCHART, get_report_figures, render_report
+from diffupath.results import metrics_to_table
+
+
+class ReportTest(unittest.TestCase):
+    """Test the split of metrics tables into figures and their cached rendering."""
+
+    def setUp(self):
+        """Generate a by database metrics table."""
+        rng = np.random.default_rng(0)
+
+        metrics = {
+            metric: {
+                dataset: {
+                    background: {database: list(rng.random(10)) for database in ('kegg', 'reactome', 'wikipathways')}
+                    for background in ('subgraph', 'PathMeUniverse')
+                }
+                for dataset in ('Dataset 1', 'Dataset 2')
+            }
+            for metric in ('auroc', 'auprc')
+        }
+        self.table = metrics_to_table(metrics, levels=['metric', 'dataset', 'background', 'database'])
+
+    def test_figures(self):
+        """Test that every metric gets a box plot and an FDR bar chart of its compared databases."""
+        figures = get_report_figures(self.table)
+
+        self.assertEqual(
+            set(figures), {f'{metric}_{kind}' for metric in ('auroc', 'auprc') for kind in (BOX_PLOT, FDR_BARCHART)},
+        )
+
+        box_plot = figures[f'auroc_{BOX_PLOT}']
+        self.assertEqual((box_plot.x, box_plot.panel, box_plot.hue), ('database', 'dataset', 'background'))
+        self.assertEqual(len(box_plot.frame), 120)
+
+        # Three pairs of databases for each dataset and background
+        self.assertEqual(len(figures[f'auroc_{FDR_BARCHART}'].frame), 12)
+
+    def test_render_only_changed_figures(self):
+        """Test that re-rendering a report only redraws the figures whose data changed."""
+        with tempfile.TemporaryDirectory() as output:
+            rendered = render_report(self.table, output, workers=1)
+            self.assertEqual(len(rendered), 4)
+            self.assertTrue(all(os.path.getsize(path) for path in rendered.values()))
+
+            self.assertEqual(render_report(self.table, output, workers=1), {})
+
+            # Scaled metrics change their box plot, but not the (scale invariant) t-tests of their bar chart
+            table = self.table.copy()
+            table.loc[table.metric == 'auprc', 'value'] /= 2
+
+            self.assertEqual(set(render_report(table, output, workers=1)), {f'auprc_{BOX_PLOT}'})
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the split of the cores between workers and BLAS threads."""
+
+import unittest
+
+from threadpoolctl import threadpool_info
+
+from diffupath.resources import ResourceConfig, limit_blas_threads, map_tasks, plan_resources
+
+
+def _get_blas_threads(_) -> list:
+    """Return the number of threads of the BLAS thread pools of the current process."""
+    return [pool['num_threads'] for pool in threadpool_info() if pool['user_api'] == 'blas']
+
+
+class ResourcesTest(unittest.TestCase):
+    """Test the planning and enforcement of the workers and BLAS threads split."""
+
+    def test_auto_split(self):
+        """Test that large kernels get BLAS threads and small ones worker processes."""
+        self.assertEqual(plan_resources(n_nodes=40000, n_cores=8), ResourceConfig(1, 8, 8, 40000, True))
+        self.assertEqual(plan_resources(n_nodes=1000, n_tasks=3, n_cores=8)[:2], (3, 2))
+        self.assertEqual(plan_resources(workers=2, n_cores=8)[:2], (2, 4))
+        self.assertEqual(plan_resources(workers='4', blas_threads='1', n_cores=8)[:2], (4, 1))
+
+        with self.assertRaises(ValueError):
+            plan_resources(workers=0)
+
+    def test_worker_limits(self):
+        """Test that the BLAS threads are limited in the current process and in the workers."""
+        if not _get_blas_threads(None):
+            self.skipTest('No BLAS thread pool found.')
+
+        with limit_blas_threads(1):
+            self.assertEqual(set(_get_blas_threads(None)), {1})
+
+        observed = map_tasks(_get_blas_threads, [(i,) for i in range(4)], ResourceConfig(2, 1, 2))
+
+        self.assertEqual(len(observed), 4)
+        self.assertTrue(all(set(threads) == {1} for threads in observed))
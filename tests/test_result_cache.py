@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the results cache."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from diffupy.kernels import regularised_laplacian_kernel
+from diffupy.matrix import Matrix
+
+from diffupath.cache import read_manifest
+from diffupath.result_cache import cache_results, get_cached_results, get_network_fingerprint, get_request_key
+
+from .networks import get_test_kernel
+
+
+class ResultCacheTest(unittest.TestCase):
+    """Test that identical requests share their cache key and results."""
+
+    def setUp(self):
+        """Compute a kernel and a temporary cache directory."""
+        self.kernel = get_test_kernel(20, prefix='g')
+        self.fingerprint = get_network_fingerprint(self.kernel, kernel_method=regularised_laplacian_kernel)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the temporary cache directory."""
+        self.tmp_dir.cleanup()
+
+    def test_request_key(self):
+        """Test that keys ignore the order and case of input labels, but not the scores or processing flags."""
+        key = get_request_key(self.fingerprint, {'raw': {'G1': 1.0, 'g2': -0.5}}, methods=['raw'], binarize=False)
+
+        self.assertEqual(
+            key,
+            get_request_key(self.fingerprint, {'raw': {'g2': -0.5, 'g1': 1}}, methods=['raw'], binarize=False),
+        )
+        self.assertNotEqual(
+            key,
+            get_request_key(self.fingerprint, {'raw': {'G1': 1.0, 'g2': 0.5}}, methods=['raw'], binarize=False),
+        )
+        self.assertNotEqual(
+            key,
+            get_request_key(self.fingerprint, {'raw': {'G1': 1.0, 'g2': -0.5}}, methods=['raw'], binarize=True),
+        )
+
+        self.kernel.mat[0, 0] += 1
+        self.assertNotEqual(self.fingerprint, get_network_fingerprint(self.kernel))
+
+    def test_cache_hit_and_eviction(self):
+        """Test that cached results are returned as stored, and the least recently used ones evicted."""
+        results = Matrix(np.random.RandomState(0).normal(size=(20, 2)), self.kernel.rows_labels, ['a', 'b'])
+
+        path = cache_results('first', results, self.tmp_dir.name, max_size=None)
+        size = os.path.getsize(path)
+
+        cached = get_cached_results('first', self.tmp_dir.name)
+        np.testing.assert_array_equal(cached.mat, results.mat)
+        self.assertEqual(cached.rows_labels, results.rows_labels)
+        self.assertIsNone(get_cached_results('second', self.tmp_dir.name))
+
+        # Budget for a single result, so caching a second one evicts the first
+        cache_results('second', results, self.tmp_dir.name, max_size=size)
+
+        self.assertIsNone(get_cached_results('first', self.tmp_dir.name))
+        self.assertIsNotNone(get_cached_results('second', self.tmp_dir.name))
+        self.assertEqual(set(read_manifest(self.tmp_dir.name)), {'second.npz'})
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the output of the diffusion results."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from diffupy.matrix import Matrix
+
+from diffupath.results import (
+    SCORE_COLUMN, metrics_to_table, read_metrics, read_scores, select_nodes, select_scores, write_metrics,
+    write_scores,
+)
+
+
+class SelectionTest(unittest.TestCase):
+    """Test the selection of the top scoring nodes."""
+
+    def setUp(self):
+        """Build random results with two columns."""
+        random_state = np.random.RandomState(0)
+        self.results = Matrix(
+            random_state.normal(size=(50, 2)),
+            rows_labels=[f'n{i}' for i in range(50)],
+            cols_labels=['a', 'b'],
+        )
+        self.node_types = ['genes', 'metabolites'] * 25
+
+    def test_top_k_matches_full_sort(self):
+        """Test that the partial sort selects the same nodes, in the same order, as a full sort."""
+        scores = self.results.mat[:, 0]
+
+        np.testing.assert_array_equal(select_nodes(scores, top_k=7), np.argsort(-scores)[:7])
+        np.testing.assert_array_equal(select_nodes(scores, threshold=1.), np.argsort(-scores)[:np.sum(scores >= 1.)])
+
+    def test_select_entity_types(self):
+        """Test that the selection is restricted to entity types, for each column."""
+        selected = select_scores(
+            self.results, top_k=5, node_types=self.node_types, entity_types=['metabolites'],
+        )
+
+        self.assertEqual(len(selected), 10)
+        self.assertEqual(set(selected['Type']), {'metabolites'})
+
+        expected = np.sort(self.results.mat[1::2, 1])[::-1][:5]
+        np.testing.assert_allclose(selected[selected['Column'] == 'b'][SCORE_COLUMN], expected)
+
+        with self.assertRaises(ValueError):
+            select_scores(self.results, entity_types=['genes'])
+
+
+class ResultsFileTest(unittest.TestCase):
+    """Test the diffusion scores and metrics files."""
+
+    def setUp(self):
+        """Build random results and nested metrics."""
+        self.results = Matrix(
+            np.random.RandomState(0).normal(size=(20, 3)),
+            rows_labels=[f'n{i}' for i in range(20)],
+            cols_labels=['raw', 'z', 'ber_s'],
+        )
+        self.metrics = {
+            'auroc': {'Dataset 1': {'raw': [0.7, 0.8], 'z': [0.75, 0.85]}},
+            'auprc': {'Dataset 1': {'raw': [0.2, 0.3], 'z': [0.25, 0.35]}},
+        }
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the temporary files."""
+        self.tmp_dir.cleanup()
+
+    def test_scores_round_trip(self):
+        """Test that scores are read back from every format, also restricted to some columns."""
+        for extension in ('csv', 'json', 'npz', 'parquet', 'feather'):
+            path = os.path.join(self.tmp_dir.name, f'scores.{extension}')
+            write_scores(self.results, path)
+
+            scores = read_scores(path, columns=['z'])
+
+            self.assertEqual(scores.rows_labels, self.results.rows_labels, msg=extension)
+            np.testing.assert_allclose(scores.mat[:, 0], self.results.mat[:, 1], err_msg=extension)
+
+    def test_metrics_append(self):
+        """Test that appended metrics tables are read back as nested metrics, filtering rows while reading."""
+        levels = ['metric', 'dataset', 'method']
+
+        self.assertEqual(len(metrics_to_table(self.metrics, levels)), 8)
+
+        for extension in ('csv', 'parquet'):
+            path = os.path.join(self.tmp_dir.name, f'metrics.{extension}')
+
+            write_metrics(self.metrics, path, levels=levels, append=True)
+            write_metrics({'auroc': {'Dataset 2': {'raw': [0.6]}}}, path, levels=levels, append=True)
+
+            metrics = read_metrics(path, metric='auroc')
+
+            self.assertEqual(metrics['auroc']['Dataset 1'], self.metrics['auroc']['Dataset 1'], msg=extension)
+            self.assertEqual(metrics['auroc']['Dataset 2'], {'raw': [0.6]}, msg=extension)
+            self.assertNotIn('auprc', metrics, msg=extension)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the diffusion sessions."""
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from diffupy.constants import RAW, Z
+
+from diffupath.kernel_diffusion import diffuse_on_kernel
+from diffupath.session import RANDOM, DiffusionSession
+
+from .networks import get_test_kernel
+
+
+class SessionTest(unittest.TestCase):
+    """Test that sessions diffuse as the stateless functions, reusing their state."""
+
+    def setUp(self):
+        """Start a session over a test kernel."""
+        self.kernel = get_test_kernel(40, prefix='g')
+        self.session = DiffusionSession(self.kernel)
+
+        self.inputs = {
+            'first': {f'G{i}': float(i % 3) for i in range(0, 20, 2)},
+            'second': {f'G{i}': -1.0 for i in range(5, 15)},
+        }
+
+    def test_batch_matches_single_inputs(self):
+        """Test that batched z-scores, computed from several threads, match the single input z-scores."""
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            batches = list(executor.map(lambda _: self.session.diffuse_batch(self.inputs, method=Z), range(8)))
+
+        self.assertEqual(batches[0].cols_labels, ['first', 'second'])
+
+        for j, input in enumerate(self.inputs.values()):
+            scores = self.session.format_input(input)
+            expected = diffuse_on_kernel(scores, self.kernel, z=True)
+
+            np.testing.assert_allclose(self.session.diffuse(input, method=Z).mat, expected.mat)
+
+            for batch in batches:
+                np.testing.assert_allclose(batch.mat[:, j], expected.mat[:, 0])
+
+    def test_validate(self):
+        """Test that the repeated holdout validation returns a metric per iteration for the methods and baselines."""
+        labels = [f'G{i}' for i in range(12)] + ['unknown']
+
+        auroc_metrics, auprc_metrics = self.session.validate(labels, k=5, seed=0)
+
+        # The PageRank baseline is only computed for sessions with a graph
+        self.assertEqual(set(auroc_metrics), {RAW, Z, RANDOM})
+        self.assertTrue(all(len(values) == 5 for values in auprc_metrics.values()))
+        self.assertEqual(auroc_metrics, self.session.validate(labels, k=5, seed=0)[0])
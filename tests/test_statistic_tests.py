@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the paired tests of the validation metrics."""
+
+import unittest
+
+import numpy as np
+from scipy import stats
+from statsmodels.stats.multitest import fdrcorrection
+
+from diffupath.results import metrics_to_table
+from diffupath.statistic_tests import WILCOXON, get_p_values, get_paired_tests
+
+
+class PairedTestsTest(unittest.TestCase):
+    """Test that the vectorized paired tests match the pairwise scipy tests."""
+
+    def setUp(self):
+        """Generate nested metrics of three methods over two datasets."""
+        rng = np.random.default_rng(0)
+
+        self.metrics = {
+            'auroc': {
+                dataset: {method: list(np.round(rng.normal(mean, 0.05, 25), 2)) for method, mean in means.items()}
+                for dataset, means in {
+                    'Dataset 1': {'raw': 0.8, 'z': 0.82, 'random': 0.5},
+                    'Dataset 2': {'raw': 0.7, 'z': 0.7, 'random': 0.5},
+                }.items()
+            },
+        }
+        self.table = metrics_to_table(self.metrics, levels=['metric', 'dataset', 'method'])
+
+    def test_ttest_and_fdr(self):
+        """Test the t-test p-values against the pairwise tests and the q-values against a single FDR pass."""
+        results = get_paired_tests(self.table)
+
+        self.assertEqual(len(results), 6)
+
+        for dataset, method_metrics in self.metrics['auroc'].items():
+            for pair, p_value in get_p_values(method_metrics).items():
+                method_a, method_b = eval(pair)
+                row = results[
+                    (results.dataset == dataset) & (results.method_a == method_a) & (results.method_b == method_b)
+                ]
+                self.assertAlmostEqual(row.p_value.item(), p_value)
+
+        np.testing.assert_allclose(results.q_value, fdrcorrection(results.p_value)[1])
+
+    def test_wilcoxon_uneven_iterations(self):
+        """Test Wilcoxon p-values of strata with different numbers of iterations, as adaptive runs produce."""
+        table = self.table[~((self.table.dataset == 'Dataset 2') & (self.table.iteration >= 15))]
+
+        results = get_paired_tests(table, test=WILCOXON).set_index(['dataset', 'method_a', 'method_b'])
+
+        for (dataset, method_a, method_b), row in results.iterrows():
+            values = self.metrics['auroc'][dataset]
+            n = 15 if dataset == 'Dataset 2' else 25
+
+            expected = stats.wilcoxon(values[method_a][:n], values[method_b][:n], correction=False, method='approx')
+            self.assertAlmostEqual(row.p_value, expected.pvalue)
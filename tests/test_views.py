@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the heatmaps of large matrices."""
+
+import os
+import tempfile
+import unittest
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from diffupath.compact_kernel import pack_kernel
+from diffupath.sparse_kernel import sparsify_kernel
+from diffupath.views import MAX_HEATMAP_SIZE, downsample_matrix, order_tiles, show_heatmap, show_matrix_heatmap
+
+from .networks import get_test_kernel
+
+
+class HeatmapTest(unittest.TestCase):
+    """Test the aggregation of large matrices into heatmap tiles."""
+
+    def setUp(self):
+        """Compute a test kernel."""
+        self.kernel = get_test_kernel(90, prefix='g')
+
+    def test_block_means(self):
+        """Test that tiles are the block means of dense, packed, sparse and memory-mapped kernels."""
+        tiles, row_edges, col_edges = downsample_matrix(self.kernel, max_size=30, block_rows=7)
+
+        self.assertEqual(tiles.shape, (30, 30))
+        self.assertAlmostEqual(tiles[4, 7], self.kernel.mat[12:15, 21:24].mean())
+        np.testing.assert_array_equal(downsample_matrix(self.kernel.mat, max_size=100)[0], self.kernel.mat)
+
+        with tempfile.TemporaryDirectory() as directory:
+            mmap = np.lib.format.open_memmap(os.path.join(directory, 'kernel.npy'), mode='w+', shape=(90, 90))
+            mmap[:] = self.kernel.mat
+
+            for matrix in (pack_kernel(self.kernel), sparsify_kernel(self.kernel, top_k=90), mmap):
+                np.testing.assert_allclose(downsample_matrix(matrix, max_size=30, block_rows=7)[0], tiles)
+
+        row_order, col_order = order_tiles(tiles)
+        np.testing.assert_array_equal(row_order, col_order)
+        self.assertEqual(sorted(row_order), list(range(30)))
+
+    def test_save_clustered_heatmap(self):
+        """Test that clustered heatmaps of large matrices are saved without a display."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'kernel.png')
+            show_matrix_heatmap(self.kernel, max_size=20, cluster=True, path=path)
+
+            self.assertGreater(os.path.getsize(path), 0)
+
+    def test_annotated_tiles(self):
+        """Test that the tiles of a downsampled heatmap are annotated with the total count of their cells."""
+        n_rows = 2 * MAX_HEATMAP_SIZE
+        entity_count = np.arange(2 * n_rows).reshape(n_rows, 2)
+
+        show_heatmap(entity_count / entity_count.max(), entity_count, list(range(n_rows)), ['a', 'b'],
+                     max_annotated_cells=n_rows)
+
+        texts = {(text.get_position(), text.get_text().strip()) for text in plt.gcf().axes[0].texts}
+        plt.close('all')
+
+        self.assertEqual(len(texts), n_rows)
+        self.assertIn(((1, 3), str(entity_count[6:8, 1].sum())), texts)